@@ -2,6 +2,9 @@ from collections import OrderedDict
 from ocgis.interface.base.crs import CFWGS84
 from ocgis import constants
 from ocgis.util.logging_ocgis import ocgis_lh
+from ocgis.util.helpers import get_object_array
+import numpy as np
+import itertools
 
 
 class SpatialCollection(OrderedDict):
@@ -47,20 +50,44 @@ class SpatialCollection(OrderedDict):
         assert(alias not in self[ugid])
         self[ugid].update({alias:field})
                 
-    def get_iter_dict(self,use_upper_keys=False,conversion_map=None):
+    def get_iter_batches(self,use_upper_keys=False,conversion_map=None,formatter=None):
+        '''
+        Iterate over the collection's rows in blocks.
+        
+        :param bool use_upper_keys: If `True`, header names are upper-cased.
+        :param dict conversion_map: Maps header names to functions applied to each
+         value in the header's column.
+        :param formatter: See :meth:`ocgis.interface.base.field.Field.get_iter_batches`.
+        :type formatter: function
+        :returns: Tuple of an object array of geometries and a mapping of header
+         names to object arrays of row values ordered by the collection headers. See
+         :meth:`ocgis.interface.base.field.Field.get_iter_batches`.
+        :rtype: tuple of (:class:`numpy.ndarray`, :class:`collections.OrderedDict`)
+        '''
         r_headers = self.headers
         use_conversion = False if conversion_map is None else True
         for ugid,field_dict in self.iteritems():
+            if formatter is None:
+                ugid_value = ugid
+            else:
+                ugid_value = formatter(get_object_array([ugid]))[0]
             for field in field_dict.itervalues():
-                for row in field.get_iter(value_keys=self.value_keys):
-                    row['ugid'] = ugid
-                    yld_row = {k:row[k] for k in r_headers}
+                for batch in field.get_iter_batches(value_keys=self.value_keys,formatter=formatter):
+                    batch['ugid'] = np.empty(batch['geom'].shape[0],dtype=object)
+                    batch['ugid'].fill(ugid_value)
+                    yld = OrderedDict([(k,batch[k]) for k in r_headers])
                     if use_conversion:
                         for k,v in conversion_map.iteritems():
-                            yld_row[k] = v(yld_row[k])
+                            yld[k] = get_object_array([v(element) for element in yld[k]])
                     if use_upper_keys:
-                        yld_row = {k.upper():v for k,v in yld_row.iteritems()}
-                    yield(row['geom'],yld_row)
+                        yld = OrderedDict([(k.upper(),v) for k,v in yld.iteritems()])
+                    yield(batch['geom'],yld)
+    
+    def get_iter_dict(self,use_upper_keys=False,conversion_map=None):
+        for geoms,batch in self.get_iter_batches(use_upper_keys=use_upper_keys,conversion_map=conversion_map):
+            keys = batch.keys()
+            for geom,row in itertools.izip(geoms,itertools.izip(*batch.values())):
+                yield(geom,dict(itertools.izip(keys,row)))
                     
     def get_iter_elements(self):
         for ugid,fields in self.iteritems():
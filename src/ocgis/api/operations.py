@@ -6,6 +6,7 @@ from ocgis.conv.meta import MetaConverter
 from ocgis.calc.base import AbstractMultivariateFunction,\
     AbstractKeyedOutputFunction
 from ocgis.interface.base.crs import CFRotatedPole, WGS84
+from ocgis.conv import parquet_
 
 
 class OcgOperations(object):
@@ -32,6 +33,8 @@ class OcgOperations(object):
     :type geom: list of dict, list of float, str
     :param aggregate: If `True`, dataset geometries are aggregated to coincident selection geometries.
     :type aggregate: bool
+    :param aggregate_geometry: The source of the aggregated geometry. Either dissolve the selected dataset geometries (`'union'`) or use the selection geometry directly (`'selection'`).
+    :type aggregate_geometry: str
     :param calc: Calculations to be performed on the dataset subset.
     :type calc: list of dictionaries
     :param calc_grouping: Temporal grouping to apply during calculation.
@@ -68,6 +71,16 @@ class OcgOperations(object):
     :type output_crs: :class:`ocgis.crs.CoordinateReferenceSystem`
     :param search_radius_mult: This value is multiplied by a data's resolution to determine the buffer radius for point selection geometries.
     :type search_radius_mult: float
+    :param select_nearest: If `True`, point selection geometries select the data cell with the nearest centroid instead of buffering the point.
+    :type select_nearest: bool
+    :param geom_simplify_mult: If provided, polygon selection geometries are simplified with a topology-preserving tolerance of this value multiplied by the data's resolution.
+    :type geom_simplify_mult: float
+    :param output_compression: If `'gzip'`, CSV output files are written as gzip-compressed streams.
+    :type output_compression: str
+    :param output_layout: The layout of vector outputs. Geometries are repeated for each data value (`'long'`) or written once with values in a separate table (`'normalized'`) or in a column for each time value (`'wide'`).
+    :type output_layout: str
+    :param nc_options: Chunking, compression, and file format options for netCDF output.
+    :type nc_options: dict
     """
     
     def __init__(self, dataset=None, spatial_operation='intersects', geom=None, aggregate=False,
@@ -76,7 +89,9 @@ class OcgOperations(object):
                  output_format='numpy', agg_selection=False, select_ugid=None, 
                  vector_wrap=True, allow_empty=False, dir_output=None, 
                  slice=None, file_only=False, headers=None, format_time=True,
-                 calc_sample_size=False, search_radius_mult=0.75, output_crs=None):
+                 calc_sample_size=False, search_radius_mult=0.75, output_crs=None,
+                 aggregate_geometry='union', select_nearest=False, geom_simplify_mult=None,
+                 output_compression=None, output_layout='long', nc_options=None):
         
         # # Tells "__setattr__" to not perform global validation until all
         # # values are set initially.
@@ -85,6 +100,7 @@ class OcgOperations(object):
         self.dataset = Dataset(dataset)
         self.spatial_operation = SpatialOperation(spatial_operation)
         self.aggregate = Aggregate(aggregate)
+        self.aggregate_geometry = AggregateGeometry(aggregate_geometry)
         self.calc_sample_size = CalcSampleSize(calc_sample_size)
         self.calc = Calc(calc)
         self.calc_grouping = CalcGrouping(calc_grouping)
@@ -94,6 +110,9 @@ class OcgOperations(object):
         self.backend = Backend(backend)
         self.prefix = Prefix(prefix or env.PREFIX)
         self.output_format = OutputFormat(output_format)
+        self.output_compression = OutputCompression(output_compression)
+        self.output_layout = OutputLayout(output_layout)
+        self.nc_options = NcOptions(nc_options)
         self.agg_selection = AggregateSelection(agg_selection)
         self.select_ugid = SelectUgid(select_ugid)
         self.geom = Geom(geom,select_ugid=self.select_ugid)
@@ -105,6 +124,8 @@ class OcgOperations(object):
         self.headers = Headers(headers)
         self.output_crs = OutputCRS(output_crs)
         self.search_radius_mult = SearchRadiusMultiplier(search_radius_mult)
+        self.select_nearest = SelectNearest(select_nearest)
+        self.geom_simplify_mult = GeomSimplifyMultiplier(geom_simplify_mult)
         self.format_time = FormatTime(format_time)
         
         ## these values are left in to perhaps be added back in at a later date.
@@ -232,6 +253,28 @@ class OcgOperations(object):
                 if rd.time_region is not None:
                     _raise_('Snippets are not implemented for time regions.',obj=Snippet)
         
+        ## the selection geometry only matches the aggregated data geometries
+        ## following a clip.
+        if self.aggregate_geometry == 'selection':
+            if not self.aggregate or self.spatial_operation != 'clip':
+                _raise_('The selection geometry may only be used as the aggregate geometry when aggregating clipped data.',obj=AggregateGeometry)
+        
+        ## only csv outputs are written as compressed streams
+        if self.output_compression is not None:
+            if self.output_format not in ['csv','csv+']:
+                _raise_('Output compression is only available for CSV output formats.',obj=OutputCompression)
+        
+        ## alternative layouts are available for shapefile and geojson outputs.
+        ## csv+ geometries are always normalized.
+        if self.output_layout != 'long':
+            if self.output_format not in ['shp','geojson']:
+                _raise_('Output layouts are only available for shapefile and GeoJSON output formats.',obj=OutputLayout)
+        
+        ## chunking and compression options are only relevant for netCDF
+        if self.nc_options is not None:
+            if self.output_format != 'nc':
+                _raise_('netCDF options are only available for the netCDF output format.',obj=NcOptions)
+        
         ## no slicing with a geometry - can easily lead to extent errors
         if self.slice is not None:
             assert(self.geom is None)
@@ -279,6 +322,17 @@ class OcgOperations(object):
                     msg = 'Keyed function output may not be written to netCDF.'
                     _raise_(msg)
         
+        ## parquet output requires the optional pyarrow dependency
+        if self.output_format == 'parquet' and parquet_.pq is None:
+            _raise_('The "pyarrow" package is required for Parquet output.')
+        
+        ## time series netCDF output stores a series for each station. keyed
+        ## outputs have no series.
+        if self.output_format == 'nc-ts' and self.calc is not None:
+            if any([issubclass(c['ref'],AbstractKeyedOutputFunction) for c in self.calc]):
+                msg = 'Keyed function output may not be written to netCDF.'
+                _raise_(msg)
+        
         ## validate any calculations against the operations object
         if self.calc is not None:
             for c in self.calc:
@@ -47,6 +47,19 @@ class Aggregate(base.BooleanParameter):
     meta_false = 'Selected geometries are not aggregated (unioned).'
     
     
+class AggregateGeometry(base.StringOptionParameter):
+    name = 'aggregate_geometry'
+    default = 'union'
+    valid = ('union','selection')
+    
+    def _get_meta_(self):
+        if self.value == 'union':
+            ret = 'Aggregated geometries were dissolved from the selected dataset geometries.'
+        else:
+            ret = 'The selection geometry was used as the aggregated geometry.'
+        return(ret)
+
+
 class AggregateSelection(base.BooleanParameter):
     name = 'agg_selection'
     default = False
@@ -362,6 +375,25 @@ class Geom(base.OcgParameter):
         return(ret)
     
     
+class GeomSimplifyMultiplier(base.OcgParameter):
+    input_types = [float]
+    name = 'geom_simplify_mult'
+    nullable = True
+    default = None
+    return_type = [float]
+
+    def _get_meta_(self):
+        if self.value is None:
+            msg = 'Selection geometries were not simplified.'
+        else:
+            msg = 'Polygon selection geometries were simplified with a tolerance of {0} times the data resolution.'.format(self.value)
+        return(msg)
+
+    def _validate_(self,value):
+        if value <= 0:
+            raise(DefinitionValidationError(self,msg='must be > 0'))
+
+
 class Headers(base.IterableParameter,base.OcgParameter):
     name = 'headers'
     default = None
@@ -401,6 +433,49 @@ class Headers(base.IterableParameter,base.OcgParameter):
         return('The following headers were used for file creation: {0}'.format(self.value))
 
 
+class NcOptions(base.OcgParameter):
+    input_types = [dict]
+    name = 'nc_options'
+    nullable = True
+    default = None
+    return_type = dict
+    #: Maps option names to their accepted types.
+    valid = {'chunking':basestring,
+             'chunksizes':(list,tuple),
+             'complevel':int,
+             'file_format':basestring,
+             'least_significant_digit':int,
+             'shuffle':bool,
+             'zlib':bool}
+    valid_chunking = ('map','timeseries')
+    valid_file_format = ('NETCDF3_CLASSIC','NETCDF3_64BIT','NETCDF4_CLASSIC','NETCDF4')
+    
+    def _get_meta_(self):
+        if self.value is None:
+            ret = 'No netCDF creation options were provided.'
+        else:
+            ret = 'The netCDF creation options were: {0}.'.format(self.value)
+        return(ret)
+    
+    def _validate_(self,value):
+        for k,v in value.iteritems():
+            if k not in self.valid:
+                msg = 'Option "{0}" is not valid. Valid options are: {1}.'.format(k,sorted(self.valid.keys()))
+                raise(DefinitionValidationError(self,msg))
+            if not isinstance(v,self.valid[k]):
+                raise(DefinitionValidationError(self,'Option "{0}" has an invalid type: {1}.'.format(k,type(v))))
+        if value.get('chunking') not in (None,)+self.valid_chunking:
+            raise(DefinitionValidationError(self,'"chunking" must be one of: {0}.'.format(self.valid_chunking)))
+        if not 0 <= value.get('complevel',4) <= 9:
+            raise(DefinitionValidationError(self,'"complevel" must be between 0 and 9.'))
+        file_format = value.get('file_format')
+        if file_format is not None:
+            if file_format not in self.valid_file_format:
+                raise(DefinitionValidationError(self,'"file_format" must be one of: {0}.'.format(self.valid_file_format)))
+            if file_format.startswith('NETCDF3') and any([k in value for k in ['chunking','chunksizes','zlib','shuffle']]):
+                raise(DefinitionValidationError(self,'Chunking and compression require a NETCDF4 file format.'))
+    
+    
 class OutputCRS(base.OcgParameter):
     input_types = [CoordinateReferenceSystem]
     name = 'output_crs'
@@ -416,6 +491,20 @@ class OutputCRS(base.OcgParameter):
         return(ret)
 
 
+class OutputCompression(base.StringOptionParameter):
+    name = 'output_compression'
+    default = None
+    valid = ('gzip',)
+    nullable = True
+    
+    def _get_meta_(self):
+        if self.value is None:
+            ret = 'Output files are not compressed.'
+        else:
+            ret = 'Output files are compressed using "{0}".'.format(self.value)
+        return(ret)
+
+
 class OutputFormat(base.StringOptionParameter):
     name = 'output_format'
     default = 'numpy'
@@ -426,6 +515,21 @@ class OutputFormat(base.StringOptionParameter):
         return(ret)
     
     
+class OutputLayout(base.StringOptionParameter):
+    name = 'output_layout'
+    default = 'long'
+    valid = ('long','normalized','wide')
+    
+    def _get_meta_(self):
+        if self.value == 'long':
+            ret = 'Vector outputs contain a geometry for each data value.'
+        elif self.value == 'normalized':
+            ret = 'Vector outputs contain each geometry once. Data values are written to a separate CSV file keyed by the geometry identifiers.'
+        else:
+            ret = 'Vector outputs contain each geometry once with a column for each time value.'
+        return(ret)
+    
+    
 class Prefix(base.StringParameter):
     name = 'prefix'
     nullable = False
@@ -454,6 +558,13 @@ class SearchRadiusMultiplier(base.OcgParameter):
             raise(DefinitionValidationError(self,msg='must be >= 0'))
     
 
+class SelectNearest(base.BooleanParameter):
+    name = 'select_nearest'
+    default = False
+    meta_true = 'The data cells with centroids nearest to point selection geometries were selected.'
+    meta_false = 'Point selection geometries were buffered to spatially select data.'
+
+
 class SelectUgid(base.IterableParameter,base.OcgParameter):
     name = 'select_ugid'
     return_type = tuple
@@ -1,7 +1,7 @@
 from ocgis.calc.engine import OcgCalculationEngine
 from ocgis import env, constants
 from ocgis.exc import EmptyData, ExtentError, MaskedDataError, EmptySubsetError,\
-    ImproperPolygonBoundsError
+    ImproperPolygonBoundsError, ResolutionError
 from ocgis.util.spatial.wrap import Wrapper
 from ocgis.util.logging_ocgis import ocgis_lh
 import logging
@@ -12,6 +12,11 @@ from ocgis.calc.base import AbstractMultivariateFunction,\
     AbstractKeyedOutputFunction
 from ocgis.util.helpers import project_shapely_geometry
 from shapely.geometry.multipoint import MultiPoint
+from ocgis.util.spatial.nearest import NearestCellIndex
+from ocgis.util.spatial.simplify import GeometrySimplifier
+from ocgis.util.cache import BoundedCache, get_geometry_key
+from fiona.crs import to_string
+import numpy as np
 
 
 class SubsetOperation(object):
@@ -21,7 +26,18 @@ class SubsetOperation(object):
         self.serial = serial
         self.nprocs = nprocs
         
-        self._subset_log = ocgis_lh.get_logger('subset')
+        self._subset_log = ocgis_lh.get_logger('subset')
+        
+        ## simplified selection geometries are cached and shared between request
+        ## datasets.
+        if self.ops.geom_simplify_mult is None:
+            self._simplifier = None
+        else:
+            self._simplifier = GeometrySimplifier()
+        
+        ## selection geometries are projected, buffered, and unwrapped once for
+        ## all request datasets with matching spatial properties.
+        self._geom_cache = BoundedCache(maxsize=constants.geom_cache_size)
 
         ## create the calculation engine
         if self.ops.calc is None:
@@ -32,7 +48,8 @@ class SubsetOperation(object):
                                            self.ops.calc,
                                            raw=self.ops.calc_raw,
                                            agg=self.ops.aggregate,
-                                           calc_sample_size=self.ops.calc_sample_size)
+                                           calc_sample_size=self.ops.calc_sample_size,
+                                           online_chunk_size=env.ONLINE_CHUNK_SIZE)
             
         ## in the case of netcdf output, geometries must be unioned. this is
         ## also true for the case of the selection geometry being requested as
@@ -66,6 +83,161 @@ class SubsetOperation(object):
         else:
             raise(ocgis_lh(exc=NotImplementedError('multiprocessing is not available')))
 
+    def _get_processed_geometry_(self,field,geom,crs,is_360,buffer_point,alias,ugid):
+        '''
+        Project the selection geometry to the field's coordinate system, buffer
+        points, and unwrap geographic geometries for 0 to 360 fields. Processed
+        geometries are cached by geometry, coordinate systems, longitudinal domain,
+        and buffer radius.
+        
+        :param bool buffer_point: If `True`, point geometries are buffered by
+         `search_radius_mult` times the field's resolution.
+        :returns: Tuple of the processed geometry and its coordinate system.
+        :rtype: tuple of (:class:`shapely.geometry.base.BaseGeometry`,
+         :class:`ocgis.interface.base.crs.CoordinateReferenceSystem`)
+        '''
+        if buffer_point and type(geom) in [Point,MultiPoint]:
+            radius = self.ops.search_radius_mult*field.spatial.grid.resolution
+        else:
+            radius = None
+        key = (get_geometry_key(geom),self._get_crs_key_(crs),self._get_crs_key_(field.spatial.crs),
+               is_360,radius)
+        try:
+            ret = self._geom_cache[key]
+        except KeyError:
+            ## see if the selection crs matches the field's crs
+            if crs is not None and crs != field.spatial.crs:
+                geom = project_shapely_geometry(geom,crs.sr,field.spatial.crs.sr)
+                crs = field.spatial.crs
+            ## if the geometry is a point, we need to buffer it unless the nearest
+            ## cells are selected.
+            if radius is not None:
+                ocgis_lh(logger=self._subset_log,msg='buffering point geometry',level=logging.DEBUG)
+                geom = geom.buffer(radius)
+            ## unwrap the data if it is geographic and 360
+            if is_360 and crs == CFWGS84():
+                ocgis_lh('unwrapping selection geometry',self._subset_log,alias=alias,ugid=ugid)
+                geom = Wrapper().unwrap(geom)
+            ret = (geom,crs)
+            self._geom_cache[key] = ret
+        else:
+            ocgis_lh('using cached selection geometry',self._subset_log,alias=alias,ugid=ugid,level=logging.DEBUG)
+        return(ret)
+    
+    @staticmethod
+    def _get_crs_key_(crs):
+        if crs is None:
+            ret = None
+        else:
+            ret = to_string(crs.value)
+        return(ret)
+    
+    def _get_simplified_geometry_(self,field,geom,alias,ugid):
+        '''
+        :returns: The selection geometry simplified using a tolerance of
+         `geom_simplify_mult` times the field's resolution. The relative area error
+         introduced by the simplification is logged. If the resolution is not
+         available (e.g. single row or column grids), `geom` is returned unchanged.
+        :rtype: :class:`shapely.geometry.base.BaseGeometry`
+        '''
+        try:
+            tolerance = self.ops.geom_simplify_mult*field.spatial.grid.resolution
+        except ResolutionError:
+            ocgis_lh('resolution not available, selection geometry not simplified',self._subset_log,
+                     alias=alias,ugid=ugid,level=logging.DEBUG)
+            return(geom)
+        ret,area_error = self._simplifier.simplify(geom,tolerance)
+        if ret is not geom:
+            msg = 'selection geometry simplified with tolerance {0} (relative area error: {1:.4%})'.format(tolerance,area_error)
+            ocgis_lh(msg,self._subset_log,alias=alias,ugid=ugid)
+        return(ret)
+    
+    def _get_is_disjoint_(self,field,extent,is_360,geom,crs,nearest_cells):
+        '''
+        :returns: `True` if the selection geometry's envelope does not overlap the
+         field extent. `False` is returned if the comparison requires a projection.
+        :rtype: bool
+        '''
+        if extent is None or geom is None:
+            return(False)
+        if crs is not None and crs != field.spatial.crs:
+            return(False)
+        is_point = type(geom) in [Point,MultiPoint]
+        if is_point and nearest_cells is not None:
+            return(False)
+        minx,miny,maxx,maxy = geom.bounds
+        if is_point:
+            try:
+                radius = self.ops.search_radius_mult*field.spatial.grid.resolution
+            except ResolutionError:
+                return(False)
+            minx,miny,maxx,maxy = minx-radius,miny-radius,maxx+radius,maxy+radius
+        ext_minx,ext_miny,ext_maxx,ext_maxy = extent
+        if miny > ext_maxy or maxy < ext_miny:
+            return(True)
+        x_ranges = [(minx,maxx)]
+        ## selection geometries are unwrapped for 0 to 360 fields
+        if is_360 and crs == CFWGS84():
+            x_ranges.append((minx+360,maxx+360))
+        for lower,upper in x_ranges:
+            if not (lower > ext_maxx or upper < ext_minx):
+                return(False)
+        return(True)
+    
+    def _get_nearest_cells_(self,field,itr):
+        '''
+        :returns: A dictionary mapping the index of point selection geometries in
+         `itr` to a tuple of nearest row and column indices. Points outside the grid
+         extent with no cell center within `search_radius_mult` times the data
+         resolution are not selected. The value is `None` if no point of the
+         geometry is selected.
+        :rtype: dict
+        '''
+        ocgis_lh(logger=self._subset_log,msg='finding nearest cells for point geometries',level=logging.DEBUG)
+        is_360 = CFWGS84.get_is_360(field.spatial)
+        x,y,owners = [],[],[]
+        for idx_geom,gd in enumerate(itr):
+            geom = gd.get('geom')
+            if type(geom) not in [Point,MultiPoint]:
+                continue
+            crs = gd.get('crs')
+            if crs is not None and crs != field.spatial.crs:
+                geom = project_shapely_geometry(geom,crs.sr,field.spatial.crs.sr)
+                crs = field.spatial.crs
+            if crs == CFWGS84() and is_360:
+                geom = Wrapper().unwrap(geom)
+            points = [geom] if type(geom) == Point else list(geom)
+            for pt in points:
+                x.append(pt.x)
+                y.append(pt.y)
+                owners.append(idx_geom)
+        
+        ret = {}
+        if len(owners) > 0:
+            index = NearestCellIndex(field.spatial.grid)
+            rows,cols,distance = index.query(x,y,return_distance=True)
+            rows,cols,distance = rows[:,0],cols[:,0],distance[:,0]
+            ## points far outside the grid do not select an edge cell
+            x,y = np.array(x),np.array(y)
+            minx,miny,maxx,maxy = field.spatial.grid.extent
+            within = np.logical_and(np.logical_and(x >= minx,x <= maxx),np.logical_and(y >= miny,y <= maxy))
+            try:
+                radius = self.ops.search_radius_mult*field.spatial.grid.resolution
+                within = np.logical_or(within,distance <= radius)
+            except ResolutionError:
+                pass
+            if not within.all():
+                ocgis_lh('{0} point(s) too far from the grid for nearest cell selection'.format(np.invert(within).sum()),
+                         self._subset_log,level=logging.WARN)
+            owners = np.array(owners)
+            for idx_geom in np.unique(owners):
+                select = np.logical_and(owners == idx_geom,within)
+                if select.any():
+                    ret[idx_geom] = (rows[select],cols[select])
+                else:
+                    ret[idx_geom] = None
+        return(ret)
+
     def _process_geometries_(self,rds):
         ocgis_lh(msg='entering _process_geometries_',logger=self._subset_log,level=logging.DEBUG)
         
@@ -125,9 +297,26 @@ class SubsetOperation(object):
             itr = [{}]
         else:
             itr = [{}] if self.ops.geom is None else self.ops.geom
+        
+        ## nearest cells for point selection geometries are found with a single
+        ## query against the field's grid.
+        if self.ops.select_nearest and self.ops.slice is None and self.ops.geom is not None:
+            nearest_cells = self._get_nearest_cells_(field,itr)
+        else:
+            nearest_cells = None
+        
+        ## the field's extent is used to reject selection geometries that do not
+        ## overlap the field before any geometric processing. every selection
+        ## geometry is still iterated so disjoint geometries follow the empty
+        ## subset path (i.e. an extent error or an empty collection).
+        is_360 = False if self.ops.geom is None else CFWGS84.get_is_360(field.spatial)
+        if self.ops.geom is not None and field.spatial.grid is not None:
+            extent = field.spatial.grid.extent
+        else:
+            extent = None
                 
         ## loop over the iterator
-        for gd in itr:
+        for idx_geom,gd in enumerate(itr):
             ## initialize the collection object to store the subsetted data. if
             ## the output CRS differs from the field's CRS, adjust accordingly 
             ## when initilizing.
@@ -145,7 +334,7 @@ class SubsetOperation(object):
             crs = gd.get('crs')
             
             if 'properties' in gd and 'UGID' in gd['properties']:
-                ugid = gd['properties']['UGID']
+                ugid = gd['properties']['UGID']
             else:
                 ## try to get lowercase ugid in case the shapefile is not perfectly
                 ## formed. however, if there is no geometry accept the error and
@@ -174,26 +363,39 @@ class SubsetOperation(object):
             elif self.ops.slice is not None:
                 field = field.__getitem__(self.ops.slice)
                 
-            ## see if the selection crs matches the field's crs
-            if crs is not None and crs != field.spatial.crs:
-                geom = project_shapely_geometry(geom,crs.sr,field.spatial.crs.sr)
-                crs = field.spatial.crs
-            ## if the geometry is a point, we need to buffer it...
-            if type(geom) in [Point,MultiPoint]:
-                ocgis_lh(logger=self._subset_log,msg='buffering point geometry',level=logging.DEBUG)
-                geom = geom.buffer(self.ops.search_radius_mult*field.spatial.grid.resolution)
-            ## unwrap the data if it is geographic and 360
-            if geom is not None and crs == CFWGS84():
-                if CFWGS84.get_is_360(field.spatial):
-                    ocgis_lh('unwrapping selection geometry',self._subset_log,alias=alias,ugid=ugid)
-                    geom = Wrapper().unwrap(geom)
+            ## selection geometries not overlapping the field are empty
+            is_disjoint = self._get_is_disjoint_(field,extent,is_360,geom,crs,nearest_cells)
+            if is_disjoint:
+                ocgis_lh('selection geometry does not overlap the field extent',self._subset_log,
+                         alias=alias,ugid=ugid,level=logging.DEBUG)
+                    
+            ## match the selection geometry to the field's coordinate system and
+            ## longitudinal domain.
+            if not is_disjoint and geom is not None:
+                geom,crs = self._get_processed_geometry_(field,geom,crs,is_360,nearest_cells is None,alias,ugid)
+            ## simplify the selection geometry to the data resolution. the original
+            ## geometry is retained for output.
+            if not is_disjoint and geom is not None and self._simplifier is not None:
+                geom_operation = self._get_simplified_geometry_(field,geom,alias,ugid)
+            else:
+                geom_operation = geom
             ## perform the spatial operation
             if geom is not None:
                 try:
-                    if self.ops.spatial_operation == 'intersects':
-                        sfield = field.get_intersects(geom)
+                    if is_disjoint:
+                        raise(EmptySubsetError(origin='spatial'))
+                    elif nearest_cells is not None and type(geom) in [Point,MultiPoint]:
+                        if nearest_cells[idx_geom] is None:
+                            raise(EmptySubsetError(origin='spatial'))
+                        rows,cols = nearest_cells[idx_geom]
+                        sfield = field.get_cells(rows,cols)
+                    elif self.ops.spatial_operation == 'intersects':
+                        sfield = field.get_intersects(geom_operation)
                     elif self.ops.spatial_operation == 'clip':
-                        sfield = field.get_clip(geom)
+                        ## aggregated geometries are constructed from the clip
+                        ## geometry. only area fractions are needed to weight the
+                        ## data values.
+                        sfield = field.get_clip(geom_operation,intersect_geometries=not self.ops.aggregate)
                     else:
                         ocgis_lh(exc=NotImplementedError(self.ops.spatial_operation))
                 except EmptySubsetError as e:
@@ -209,7 +411,11 @@ class SubsetOperation(object):
             if sfield is not None:
                 ## aggregate if requested
                 if self.ops.aggregate:
-                    sfield = sfield.get_spatially_aggregated(new_spatial_uid=ugid)
+                    if self.ops.aggregate_geometry == 'selection' and geom is not None:
+                        selection_geometry = geom
+                    else:
+                        selection_geometry = None
+                    sfield = sfield.get_spatially_aggregated(new_spatial_uid=ugid,selection_geometry=selection_geometry)
                 
                 ## wrap the returned data.
                 if not env.OPTIMIZE_FOR_CALC:
@@ -218,8 +424,13 @@ class SubsetOperation(object):
                             ocgis_lh('wrapping output geometries',self._subset_log,alias=alias,ugid=ugid)
                             sfield.spatial.crs.wrap(sfield.spatial)
                             
-                ## check for all masked values
-                if env.OPTIMIZE_FOR_CALC is False and self.ops.file_only is False:
+                ## check for all masked values. streamed calculations load values
+                ## one time chunk at a time and are not checked.
+                if self.cengine is not None and self.cengine.get_is_online(file_only=self.ops.file_only):
+                    check_masked = False
+                else:
+                    check_masked = env.OPTIMIZE_FOR_CALC is False and self.ops.file_only is False
+                if check_masked:
                     for variable in sfield.variables.itervalues():
                         if variable.value.mask.all():
                             ## masked data may be okay depending on other opeartional
@@ -19,6 +19,11 @@ class AbstractFunction(object):
       data type will be used for the output data type.
     * **key** (str): The function's unique string identifier.
     
+    Optional class attributes to overload:
+    
+    * **Online** (class): A subclass of :class:`ocgis.calc.online.AbstractOnlineAccumulator`
+      computing the function over streamed time chunks. See :func:`ocgis.calc.online.iter_online_groups`.
+    
     :param alias: The string identifier to use for the calculation.
     :type alias: str
     :param dtype: The output data type.
@@ -45,6 +50,7 @@ class AbstractFunction(object):
     def description(self): str
     dtype = None
     Group = None
+    Online = None
     @abc.abstractproperty
     def key(self): str
     long_name = ''
@@ -2,6 +2,9 @@ from ocgis.util.logging_ocgis import ocgis_lh
 from ocgis.interface.base.variable import VariableCollection
 from ocgis.interface.base.field import DerivedMultivariateField, DerivedField
 from ocgis.calc.base import AbstractMultivariateFunction
+from ocgis.calc.online import iter_online_groups
+from ocgis import constants
+import numpy as np
 
 
 class OcgCalculationEngine(object):
@@ -12,14 +15,20 @@ class OcgCalculationEngine(object):
     :type raw: bool
     :param agg: If True, data needs to be spatially aggregated (using weights) following a calculation.
     :type agg: bool
+    :param online_chunk_size: If provided, set functions defining an online accumulator
+     are computed by streaming the time axis in chunks of this size (see
+     :func:`ocgis.calc.online.iter_online_groups`).
+    :type online_chunk_size: int
     '''
     
-    def __init__(self,grouping,funcs,raw=False,agg=False,calc_sample_size=False):
+    def __init__(self,grouping,funcs,raw=False,agg=False,calc_sample_size=False,
+                 online_chunk_size=None):
         self.raw = raw
         self.agg = agg
         self.grouping = grouping
         self.funcs = funcs
         self.calc_sample_size = calc_sample_size
+        self.online_chunk_size = online_chunk_size
         
         ## select which value data to pull based on raw and agg arguments
         if self.raw and self.agg is False:
@@ -46,6 +55,22 @@ class OcgCalculationEngine(object):
         check = [issubclass(f['ref'],klass) for f in funcs]
         ret = True if any(check) else False
         return(ret)
+    
+    def get_is_online(self,file_only=False):
+        '''
+        Return `True` if calculations are streamed over time chunks. All functions
+        must define an online accumulator and calculations may not use raw values
+        from an aggregated request.
+        
+        :param file_only: If `True`, only output sizes are computed.
+        :type file_only: bool
+        :rtype: bool
+        '''
+        if self.online_chunk_size is None or self.grouping is None or file_only or self.use_raw_values:
+            ret = False
+        else:
+            ret = all(f['ref'].Online is not None for f in self.funcs)
+        return(ret)
         
     def execute(self,coll,file_only=False):
         
@@ -64,20 +89,65 @@ class OcgCalculationEngine(object):
                     if k2 not in self.tgds:
                         self.tgds[k2] = v2.temporal.get_grouping(self.grouping)
 
+        is_online = self.get_is_online(file_only=file_only)
+        
         ## iterate over functions
         for ugid,dct in coll.iteritems():
             for alias_field,field in dct.iteritems():
                 new_temporal = self.tgds.get(alias_field)
-                out_vc = VariableCollection()
-                for f in self.funcs:
-                    ocgis_lh('calculating: {0}'.format(f),logger='calc.engine')
-                    function = f['ref'](alias=f['name'],dtype=None,field=field,file_only=file_only,vc=out_vc,
-                         parms=f['kwds'],tgd=new_temporal,use_raw_values=self.use_raw_values,
-                         calc_sample_size=self.calc_sample_size)
-                    out_vc = function.execute()
+                if is_online:
+                    out_vc = self._execute_online_(field,new_temporal)
+                else:
+                    out_vc = VariableCollection()
+                    for f in self.funcs:
+                        ocgis_lh('calculating: {0}'.format(f),logger='calc.engine')
+                        function = f['ref'](alias=f['name'],dtype=None,field=field,file_only=file_only,vc=out_vc,
+                             parms=f['kwds'],tgd=new_temporal,use_raw_values=self.use_raw_values,
+                             calc_sample_size=self.calc_sample_size)
+                        out_vc = function.execute()
                 new_temporal = new_temporal or field.temporal
                 new_field = klass(variables=out_vc,temporal=new_temporal,spatial=field.spatial,
                                   level=field.level,realization=field.realization,meta=field.meta,
                                   uid=field.uid)
                 coll[ugid][alias_field] = new_field
         return(coll)
+    
+    def _execute_online_(self,field,tgd):
+        '''
+        Compute the set functions by streaming the field's time axis. Only one chunk
+        of source values is held in memory at a time.
+        
+        :rtype: :class:`ocgis.interface.base.variable.VariableCollection`
+        '''
+        ocgis_lh('calculating online with chunk size: {0}'.format(self.online_chunk_size),logger='calc.engine')
+        
+        shp_fill = list(field.shape)
+        shp_fill[1] = len(tgd.dgroups)
+        fills = {}
+        attrs = {}
+        for idx_group,ret in iter_online_groups(field,self.funcs,self.grouping,chunk_size=self.online_chunk_size,
+                                                calc_sample_size=self.calc_sample_size,attrs=attrs):
+            for key,value in ret.iteritems():
+                if key not in fills:
+                    fills[key] = np.ma.array(np.zeros(shp_fill,dtype=value.dtype),mask=True)
+                fills[key][:,idx_group,:,:,:] = value[:,0,:,:,:]
+        
+        out_vc = VariableCollection()
+        for f in self.funcs:
+            function = f['ref'](alias=f['name'],dtype=None,field=field,vc=out_vc,parms=f['kwds'],tgd=tgd,
+                                calc_sample_size=self.calc_sample_size)
+            for variable in field.variables.itervalues():
+                alias = '{0}_{1}'.format(function.alias,variable.alias)
+                fill = fills[alias]
+                if function.dtype is not None and fill.dtype != function.dtype:
+                    fill = fill.astype(function.dtype)
+                if self.calc_sample_size:
+                    sample_size = fills['n_'+alias].astype(constants.np_int)
+                    sample_size.mask = fill.mask.copy()
+                else:
+                    sample_size = None
+                function._add_to_collection_(value={'fill':fill,'sample_size':sample_size},
+                                             parent_variables=[variable],alias=alias)
+                function.vc[alias].meta['attrs'].update(attrs.get(alias,{}))
+            out_vc = function.vc
+        return(out_vc)
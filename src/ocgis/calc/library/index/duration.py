@@ -1,6 +1,5 @@
 from ocgis.calc import base
 import numpy as np
-from ocgis.util.helpers import iter_array
 from ocgis.exc import DefinitionValidationError
 from ocgis import constants
 from collections import OrderedDict
@@ -22,36 +21,28 @@ class Duration(base.AbstractUnivariateSetFunction,base.AbstractParameterizedFunc
         :type summary: str
         '''
         assert(len(values.shape) == 3)
-        ## storage array for counts
         shp_out = values.shape[-2:]
-        store = np.zeros(shp_out,dtype=self.dtype).flatten()
-        ## get the summary operation from the numpy library
-        summary_operation = getattr(np,summary)
-
-        ## find longest sequence for each geometry across time dimension
-        for ii,fill in enumerate(self._iter_consecutive_(values,threshold,operation)):
-            ## case of only a singular occurrence
-            if len(fill) > 1:
-                fill = summary_operation(fill)
-            else:
-                try:
-                    fill = fill[0]
-                ## value is likely masked
-                except IndexError:
-                    fill = 0
-            store[ii] = fill
-        
+        cell,lengths,n_cells = self._get_spells_(values,threshold,operation)
+        store = self._get_spell_summary_(cell,lengths,n_cells,summary).astype(self.dtype)
         store.resize(shp_out)
         
         ## update the output mask. this only applies to geometries so pick the
         ## first masked time field
-        store = np.ma.array(store,mask=values.mask[0,:,:])
+        store = np.ma.array(store,mask=np.ma.getmaskarray(values)[0,:,:])
         
         return(store)
     
-    def _iter_consecutive_(self,values,threshold,operation):
-        ## time index reference
-        ref = np.arange(0,values.shape[0])
+    def _get_spells_(self,values,threshold,operation):
+        '''
+        Detect spells (runs of consecutive time steps where the logical operation
+        is `True`) for all grid cells at once. Masked values interrupt a spell.
+        
+        :param values: Array with dimension (time,row,column).
+        :type values: :class:`numpy.ma.MaskedArray`
+        :returns: A tuple of (flat cell index of each spell, length of each spell,
+         number of cells). Spells are ordered by cell and then by time.
+        :rtype: tuple
+        '''
         ## perform requested logical operation
         if operation == 'gt':
             arr = values > threshold
@@ -61,27 +52,55 @@ class Duration(base.AbstractUnivariateSetFunction,base.AbstractParameterizedFunc
             arr = values >= threshold
         elif operation == 'lte':
             arr = values <= threshold
-
-        ## find longest sequence for each geometry across time dimension
-        for rowidx,colidx in iter_array(values[0,:,:],use_mask=False):
-            vec = arr[:,rowidx,colidx].reshape(-1)
-            ## check first if there is a longer series than 1
-            if np.any(np.diff(ref[vec]) == 1):
-                ## find locations where the values switch
-                diff_idx = np.diff(vec)
-                if diff_idx.shape != ref.shape:
-                    diff_idx = np.append(diff_idx,[False])
-                split_idx = ref[diff_idx] + 1
-                splits = np.array_split(vec,split_idx)
-                fill = [a.sum() for a in splits if np.all(a)]
-            ## case of only a singular occurrence
-            elif np.any(vec):
-                fill = [1]
-            ## case for no occurrence
-            else:
-                fill = [0]
-            
-            yield(fill)
+        else:
+            raise(NotImplementedError('The operation "{0}" was not recognized.'.format(operation)))
+        arr = np.ma.filled(arr,False)
+        n_cells = arr.shape[1]*arr.shape[2]
+        
+        ## pad the time axis with false values so every spell has a start and an
+        ## end. the cell axis is first so spells are returned in cell order.
+        padded = np.zeros((n_cells,arr.shape[0]+2),dtype=np.int8)
+        padded[:,1:-1] = arr.reshape(arr.shape[0],n_cells).T
+        switch = np.diff(padded,axis=1)
+        cell,start = np.nonzero(switch == 1)
+        stop = np.nonzero(switch == -1)[1]
+        lengths = stop - start
+        
+        return(cell,lengths,n_cells)
+    
+    @staticmethod
+    def _get_spell_summary_(cell,lengths,n_cells,summary):
+        '''
+        :returns: The summary of spell lengths for each cell. Cells without a spell
+         have a summary value of zero.
+        :rtype: :class:`numpy.ndarray`
+        '''
+        count = np.bincount(cell,minlength=n_cells)
+        has_spell = count > 0
+        ret = np.zeros(n_cells,dtype=np.float64)
+        if not has_spell.any():
+            return(ret)
+        ## spells are ordered by cell. this is the offset of each cell's first spell.
+        offset = np.cumsum(count) - count
+        
+        if summary in ('mean','std'):
+            total = np.bincount(cell,weights=lengths,minlength=n_cells)
+            ret[has_spell] = total[has_spell]/count[has_spell]
+            if summary == 'std':
+                sq = np.bincount(cell,weights=(lengths - ret[cell])**2,minlength=n_cells)
+                ret[has_spell] = np.sqrt(sq[has_spell]/count[has_spell])
+        elif summary in ('max','min'):
+            ufunc = np.maximum if summary == 'max' else np.minimum
+            ret[has_spell] = ufunc.reduceat(lengths,offset[has_spell])
+        elif summary == 'median':
+            sorted_lengths = lengths[np.lexsort((lengths,cell))]
+            lower = offset + (count - 1)//2
+            upper = offset + count//2
+            ret[has_spell] = (sorted_lengths[lower[has_spell]] + sorted_lengths[upper[has_spell]])/2.0
+        else:
+            raise(NotImplementedError('The summary "{0}" was not recognized.'.format(summary)))
+        
+        return(ret)
     
     @classmethod 
     def validate(cls,ops):
@@ -105,35 +124,52 @@ class FrequencyDuration(base.AbstractKeyedOutputFunction,Duration):
         :type operation: str
         '''
         shp_out = values.shape[-2:]
-        store = np.zeros(shp_out,dtype=object).flatten()
-        for ii,duration in enumerate(self._iter_consecutive_(values,threshold,operation)):
-            summary = self._get_summary_(duration)
-            store[ii] = summary
+        cell,lengths,n_cells = self._get_spells_(values,threshold,operation)
+        store = self._get_frequency_tables_(cell,lengths,n_cells)
         store.resize(shp_out)
         
         ## update the output mask. this only applies to geometries so pick the
         ## first masked time field
-        store = np.ma.array(store,mask=values.mask[0,:,:])
+        store = np.ma.array(store,mask=np.ma.getmaskarray(values)[0,:,:])
         
         return(store)
         
-    def _get_summary_(self,duration):
+    def _get_frequency_tables_(self,cell,lengths,n_cells):
         '''
-        :param duration: List of duration elements for frequency target.
-        :type duration: list
+        >>> cell = np.array([0, 0, 0, 0])
+        >>> lengths = np.array([3, 5, 2, 2])
         
-        >>> duration = [3, 5, 2, 2]
-        
-        :returns: NumPy structure with dimension equal to the count of unique elements
-         in the `duration` sequence.
+        :returns: Object array with a NumPy structure for each cell. The structure
+         has a dimension equal to the count of unique spell lengths in the cell. Cells
+         without a spell have a single zero-length entry with a count of one.
+        :rtype: :class:`numpy.ndarray`
         '''
-        set_duration = set(duration)
-        ret = np.empty(len(set_duration),dtype=self.structure_dtype)
-        for ii,sd in enumerate(set_duration):
-            idx = np.array(duration) == sd
-            count = idx.sum()
-            ret[ii]['duration'] = sd
-            ret[ii]['count'] = count
+        ## sort by cell and length then locate the unique (cell,length) pairs
+        order = np.lexsort((lengths,cell))
+        cell = cell[order]
+        lengths = lengths[order]
+        is_first = np.ones(cell.shape[0],dtype=bool)
+        is_first[1:] = np.logical_or(np.diff(cell) != 0,np.diff(lengths) != 0)
+        first = np.nonzero(is_first)[0]
+        
+        tables = np.empty(first.shape[0],dtype=self.structure_dtype)
+        tables['duration'] = lengths[first]
+        tables['count'] = np.diff(np.append(first,cell.shape[0]))
+        
+        ## insert the zero-length entry for cells without a spell. the entries of
+        ## preceding cells determine the insert position.
+        n_unique = np.bincount(cell[first],minlength=n_cells)
+        no_spell = np.nonzero(n_unique == 0)[0]
+        if no_spell.shape[0] > 0:
+            empty = np.array([(0,1)],dtype=self.structure_dtype)
+            tables = np.insert(tables,np.cumsum(n_unique)[no_spell],empty)
+            n_unique[no_spell] = 1
+        
+        ## split the tables into views for each cell. keyed outputs store a
+        ## structure per cell so the object array is filled by cell.
+        ret = np.empty(n_cells,dtype=object)
+        for ii,table in enumerate(np.split(tables,np.cumsum(n_unique)[:-1])):
+            ret[ii] = table
         return(ret)
     
     @classmethod
@@ -1,5 +1,9 @@
 from ocgis.util.logging_ocgis import ocgis_lh
 import numpy as np
+import os
+import hashlib
+from ocgis import env
+from ocgis.calc.percentile import get_percentile
 from ocgis.calc.base import AbstractParameterizedFunction, \
     AbstractUnivariateSetFunction
 
@@ -9,6 +13,8 @@ class DynamicDailyKernelPercentileThreshold(AbstractUnivariateSetFunction,Abstra
     parms_definition = {'operation':str,'percentile':float,'daily_percentile':None,'width':int}
     dtype = np.int32
     description = 'Implementation of moving window percentile threshold calculations similar to ECA indices: http://eca.knmi.nl/documents/atbd.pdf'
+    #: Maximum size in bytes of the values gathered for a batch of calendar day windows.
+    _max_batch_bytes = 2e8
     
     def __init__(self,*args,**kwds):
         self._daily_percentile = {}
@@ -27,33 +33,24 @@ class DynamicDailyKernelPercentileThreshold(AbstractUnivariateSetFunction,Abstra
         :type daily_percentile: `numpy.ndarray`
         '''
         
-        ## if the daily percentile structured array is not passed, calculate it
-        if daily_percentile is None:
-            try:
-                daily_percentile = self._daily_percentile[self._curr_variable.alias]
-            ## likely has not been calculated
-            except KeyError:
-                dp = self.get_daily_percentile(self._curr_variable.value,
-                                               self.field.temporal.value_datetime,
-                                               percentile,
-                                               width)
-                self._daily_percentile.update({self._curr_variable.alias:dp})
-                daily_percentile = self._daily_percentile[self._curr_variable.alias]
-                
-            
-        ## extract the corresponding dates
-        dates = self.field.temporal.value_datetime[self._curr_group]
+        alias = self._curr_variable.alias
+        try:
+            percentiles,field_cday = self._daily_percentile[alias]
+        ## likely has not been calculated
+        except KeyError:
+            ## if the daily percentile structured array is not passed, calculate it
+            if daily_percentile is None:
+                daily_percentile = self._get_or_load_daily_percentile_(percentile,width)
+            ## stack the percentile arrays for fancy indexing by calendar day
+            percentiles = np.array([p for p in daily_percentile['percentile']])
+            ## match each field date to its calendar day index
+            lookup = {(m,d):idx for m,d,idx in zip(daily_percentile['month'],daily_percentile['day'],daily_percentile['index'])}
+            field_cday = np.array([lookup[(dt.month,dt.day)] for dt in self.field.temporal.value_datetime.flat])
+            self._daily_percentile[alias] = (percentiles,field_cday)
         
-        ## match each date to it's percentile
-        dp_indices = np.zeros(dates.shape)
-        for ii,date in enumerate(dates):
-            month,day = date.month,date.day
-            dp_indices[ii] = daily_percentile['index'][np.logical_and(daily_percentile['month'] == month,
-                                                                      daily_percentile['day'] == day)]
         ## construct the the comparison array
-        b = np.empty_like(values)
-        for ii in range(b.shape[0]):
-            b[ii] = daily_percentile[ii]['percentile']
+        dp_indices = field_cday[self._curr_group]
+        b = percentiles[dp_indices].reshape(values.shape)
         
         ## perform requested logical operation
         if operation == 'gt':
@@ -72,15 +69,74 @@ class DynamicDailyKernelPercentileThreshold(AbstractUnivariateSetFunction,Abstra
         ret = np.ma.sum(ret,axis=0)
         
         return(ret)
+    
+    def _get_or_load_daily_percentile_(self,percentile,width):
+        '''
+        Return the daily percentile structure array for the current variable. If
+        :attr:`ocgis.env.DIR_CACHE` is set, the array is loaded from or saved to the
+        cache directory.
+        '''
+        variable = self._curr_variable
+        temporal = self.field.temporal.value_datetime
+        value = variable.value
+        path = None
+        if env.DIR_CACHE is not None:
+            key = self._get_cache_key_(variable,value,temporal,percentile,width)
+            path = os.path.join(env.DIR_CACHE,'{0}_{1}.npz'.format(self.key,key))
+            if os.path.exists(path):
+                ocgis_lh('loading cached daily percentile: {0}'.format(path),'calc.library')
+                return(self.load_daily_percentile(path))
         
-#    @property
-#    def daily_percentile(self):
-#        if self._daily_percentile is None:
-#            self._daily_percentile = self.get_daily_percentile(self.dataset.value,
-#                                                               self.dataset.temporal.value_datetime,
-#                                                               self.kwds['percentile'],
-#                                                               self.kwds['width'])
-#        return(self._daily_percentile)
+        ret = self.get_daily_percentile(value,temporal,percentile,width)
+        if path is not None:
+            self.save_daily_percentile(path,ret)
+        return(ret)
+    
+    @staticmethod
+    def _get_cache_key_(variable,value,temporal,percentile,width):
+        '''
+        :returns: A digest of the input values, their mask, the time values, and the
+         function parameters. Subsets differing in spatial mask, units conversion, or
+         time and level selection produce different keys.
+        :rtype: str
+        '''
+        uri = getattr(getattr(variable,'_data',None),'uri',None)
+        digest = hashlib.md5(repr([uri,variable.name,variable.units,value.shape,str(value.dtype),
+                                   percentile,width]))
+        digest.update(np.ascontiguousarray(np.ma.getdata(value)))
+        digest.update(np.ascontiguousarray(np.ma.getmaskarray(value)))
+        digest.update(repr([(dt.year,dt.month,dt.day,dt.hour) for dt in temporal.flat]))
+        return(digest.hexdigest())
+    
+    @staticmethod
+    def save_daily_percentile(path,daily_percentile):
+        '''
+        :param path: Path to the output ``.npz`` file.
+        :type path: str
+        :param daily_percentile: Structure array as returned by :meth:`~ocgis.calc.library.DynamicDailyKernelPercentileThreshold.get_daily_percentile`.
+        :type daily_percentile: numpy.ndarray
+        '''
+        percentiles = np.ma.array([p for p in daily_percentile['percentile']])
+        with open(path,'wb') as f:
+            np.savez(f,month=daily_percentile['month'],day=daily_percentile['day'],
+                     percentile=percentiles.data,mask=np.ma.getmaskarray(percentiles))
+    
+    @staticmethod
+    def load_daily_percentile(path):
+        '''
+        :param path: Path to a file written by :meth:`~ocgis.calc.library.DynamicDailyKernelPercentileThreshold.save_daily_percentile`.
+        :type path: str
+        :rtype: numpy.ndarray
+        '''
+        loaded = np.load(path)
+        try:
+            cday = DynamicDailyKernelPercentileThreshold._get_cday_structure_(loaded['month'],loaded['day'])
+            percentiles = np.ma.array(loaded['percentile'],mask=loaded['mask'])
+            for ii in range(cday.shape[0]):
+                cday['percentile'][ii] = percentiles[ii]
+        finally:
+            loaded.close()
+        return(cday)
     
     @staticmethod
     def get_daily_percentile(all_values,temporal,percentile,width):
@@ -89,7 +145,7 @@ class DynamicDailyKernelPercentileThreshold(AbstractUnivariateSetFunction,Abstra
         :type all_values: numpy.MaskedArray
         :param temporal: Vector holding `datetime.datetime` objects with same length as the time axis of `all_values`.
         :type temporal: numpy.ndarray
-        :param percentile: Percentile threshold to use in the `numpy.percentile` calculation.
+        :param percentile: Percentile threshold to use in the :func:`~ocgis.calc.percentile.get_percentile` calculation.
         :type percentile: int or float from 0 to 100
         :param width: Width of kernel to use for the moving window percentile.
         :type width: int, oddly-number, at least 3 or greater
@@ -98,57 +154,48 @@ class DynamicDailyKernelPercentileThreshold(AbstractUnivariateSetFunction,Abstra
         '''
         assert(len(all_values.shape) == 5)
         
-        ## collect the days and months uniquely to use for the calendar attribution
-        dmap = {}
-        years = set()
-        for dt in temporal.flat:
-            day,month,year = dt.day,dt.month,dt.year
-            years.update([year])
-            if month not in dmap:
-                dmap[month] = []
-            if day not in dmap[month]:
-                dmap[month].append(day)
+        ## map each time step to its calendar day. calendar days are ordered by
+        ## month then day.
+        months = np.array([dt.month for dt in temporal.flat])
+        days = np.array([dt.day for dt in temporal.flat])
+        cday_key,time_cday = np.unique(months*100 + days,return_inverse=True)
+        cday = DynamicDailyKernelPercentileThreshold._get_cday_structure_(cday_key/100,cday_key%100)
+        cday_shape = cday.shape[0]
         
-        ## this is the structure array storing date parts and percentile arrays
-        cday_length = sum([len(v) for v in dmap.itervalues()])
-        cday = np.zeros(cday_length,dtype=[('month',int),('day',int),('index',int),('percentile',object)])
-        idx = 0
-        for month in sorted(dmap):
-            for day in sorted(dmap[month]):
-                cday[idx] = (month,day,idx,None)
-                idx += 1
+        ## window membership for every calendar day and time step using the
+        ## circular distance between calendar day indices.
+        window = DynamicDailyKernelPercentileThreshold._get_calendar_day_window_(cday['index'],0,width)
+        stride = (window.shape[0] - 1)/2
+        distance = (time_cday.reshape(1,-1) - cday['index'].reshape(-1,1)) % cday_shape
+        members = np.logical_or(distance <= stride,distance >= cday_shape - stride)
         
-        ## loop for each calendar day and calculate the percentile value for its
-        ## data window
-        r_cday_index = cday['index']
-        r_logical_and = np.logical_and
-        cday_shape = cday.shape[0]
-        for target_cday_index in range(cday_shape):
-            select = np.zeros(all_values.shape[1],dtype=bool)
-            
-            ## this function returns the calendar days part of the target calendar
-            ## day's window. these are then used to subset the calendar day structure
-            ## array.
-            window_days = DynamicDailyKernelPercentileThreshold._get_calendar_day_window_(r_cday_index,target_cday_index,width)
-            cday_select = np.zeros(cday_shape,dtype=bool)
-            for wd in window_days:
-                cday_select = np.logical_or(cday_select,r_cday_index == wd)
-            cday_sub = cday[cday_select]
-            
-            ## a tight loop used to determine if a date is a member of a particular
-            ## window.
-            ## TODO: optimize
-            for ii,dt in enumerate(temporal.flat):
-                r_month,r_day = dt.month,dt.day
-                dt_cday = cday['index'][r_logical_and(cday['day'] == r_day,cday['month'] == r_month)]
-                select[ii] = dt_cday in cday_sub['index']
+        ## calendar days with an equal number of window members are computed
+        ## together. the number of calendar days in a batch is limited by the size
+        ## of the gathered values.
+        n_members = members.sum(axis=1)
+        cell_size = all_values.size/all_values.shape[1]*all_values.itemsize
+        for n in np.unique(n_members):
+            target = np.nonzero(n_members == n)[0]
+            batch_size = max(1,int(DynamicDailyKernelPercentileThreshold._max_batch_bytes/(cell_size*max(n,1))))
+            for start in range(0,target.shape[0],batch_size):
+                batch = target[start:start+batch_size]
+                ## time indices with dimension (calendar day,window member)
+                time_idx = np.nonzero(members[batch])[1].reshape(batch.shape[0],n)
+                ## calculate the percentile values for the windows
+                percentile_subset = all_values[:,time_idx]
+                ret = get_percentile(percentile_subset,percentile,axis=2)
+                for ii,target_cday_index in enumerate(batch):
+                    cday['percentile'][target_cday_index] = ret[:,ii]
             
-            ## calculate the percentile value for the window
-            percentile_subset = all_values[:,select]
-#            assert(percentile_subset.shape[0] == len(years)*width)
-            cday['percentile'][target_cday_index] = np.percentile(percentile_subset,percentile,axis=1)
-            
-        return(cday)        
+        return(cday)
+    
+    @staticmethod
+    def _get_cday_structure_(months,days):
+        cday = np.zeros(len(months),dtype=[('month',int),('day',int),('index',int),('percentile',object)])
+        cday['month'] = months
+        cday['day'] = days
+        cday['index'] = np.arange(cday.shape[0])
+        return(cday)
             
     @staticmethod
     def _get_calendar_day_window_(cday_index,target_cday_index,width):
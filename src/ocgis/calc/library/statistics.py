@@ -1,24 +1,32 @@
 from ocgis.calc import base
+from ocgis.calc import online
+from ocgis.calc.percentile import get_percentile, get_median
 import numpy as np
 
 
 class FrequencyPercentile(base.AbstractUnivariateSetFunction,base.AbstractParameterizedFunction):
     key = 'freq_perc'
-    parms_definition = {'percentile':float}
-    description = 'The percentile value along the time axis. See: http://docs.scipy.org/doc/numpy-dev/reference/generated/numpy.percentile.html.'
+    parms_definition = {'percentile':float,'sketch_size':int}
+    description = 'The percentile value along the time axis. Masked values are excluded. See: http://docs.scipy.org/doc/numpy-dev/reference/generated/numpy.percentile.html.'
+    Online = online.OnlineQuantileSketch
     
-    def calculate(self,values,percentile=None):
+    def calculate(self,values,percentile=None,sketch_size=None):
         '''
         :param percentile: Percentile to compute.
         :type percentile: float on the interval [0,100]
+        :param sketch_size: Compactor capacity of the :class:`~ocgis.calc.sketch.QuantileSketch`
+         used when the calculation is streamed over time chunks (see :attr:`ocgis.env.ONLINE_CHUNK_SIZE`).
+         Percentiles computed here from in-memory values are exact and do not use a sketch.
+        :type sketch_size: int
         '''
-        ret = np.percentile(values,percentile,axis=0)
+        ret = get_percentile(values,percentile,axis=0)
         return(ret)
 
 
 class Max(base.AbstractUnivariateSetFunction):
     description = 'Max value for the series.'
     key = 'max'
+    Online = online.OnlineMax
     
     def calculate(self,values):
         return(np.ma.max(values,axis=0))
@@ -27,6 +35,7 @@ class Max(base.AbstractUnivariateSetFunction):
 class Min(base.AbstractUnivariateSetFunction):
     description = 'Min value for the series.'
     key = 'min'
+    Online = online.OnlineMin
     
     def calculate(self,values):
         return(np.ma.min(values,axis=0))
@@ -35,6 +44,7 @@ class Min(base.AbstractUnivariateSetFunction):
 class Mean(base.AbstractUnivariateSetFunction):
     description = 'Compute mean value of the set.'
     key = 'mean'
+    Online = online.OnlineMean
     
     def calculate(self,values):
         return(np.ma.mean(values,axis=0))
@@ -45,12 +55,13 @@ class Median(base.AbstractUnivariateSetFunction):
     key = 'median'
     
     def calculate(self,values):
-        return(np.ma.median(values,axis=0))
+        return(get_median(values,axis=0))
     
     
 class StandardDeviation(base.AbstractUnivariateSetFunction):
     description = 'Compute standard deviation of the set.'
     key = 'std'
+    Online = online.OnlineStandardDeviation
     
     def calculate(self,values):
         return(np.ma.std(values,axis=0))
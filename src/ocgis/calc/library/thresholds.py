@@ -1,4 +1,5 @@
 from ocgis.calc import base
+from ocgis.calc import online
 import numpy as np
 
 
@@ -7,6 +8,7 @@ class Between(base.AbstractUnivariateSetFunction,base.AbstractParameterizedFunct
     parms_definition = {'lower':float,'upper':float}
     dtype = np.int32
     key = 'between'
+    Online = online.OnlineBetween
     
     def calculate(self,values,lower=None,upper=None):
         '''
@@ -25,6 +27,7 @@ class Threshold(base.AbstractUnivariateSetFunction,base.AbstractParameterizedFun
     parms_definition = {'threshold':float,'operation':str}
     dtype = np.int32
     key = 'threshold'
+    Online = online.OnlineThreshold
     
     def calculate(self,values,threshold=None,operation=None):
         '''
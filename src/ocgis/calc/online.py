@@ -0,0 +1,358 @@
+import abc
+import numpy as np
+from collections import OrderedDict
+from ocgis import constants
+from ocgis.util.logging_ocgis import ocgis_lh
+from ocgis.exc import CalculationException
+from ocgis.calc.sketch import QuantileSketch
+
+
+class AbstractOnlineAccumulator(object):
+    '''
+    Base class for constant-memory accumulators consuming time chunks of a
+    five-dimensional value array (realization,time,level,row,column). Each
+    update reduces along the time axis (axis=1). The accumulated value has the
+    shape (realization,1,level,row,column).
+
+    :param parms: Formatted keyword parameters from the parent function.
+    :type parms: dict
+    '''
+    __metaclass__ = abc.ABCMeta
+    #: Output data type. If `None`, the data type of the first chunk is used.
+    dtype = None
+    #: If `True`, integer chunks produce floating point output as with :func:`numpy.ma.mean`.
+    _float_output = False
+
+    def __init__(self,**parms):
+        self.parms = parms
+        self.count = None
+        self._dtype = self.dtype
+
+    def update(self,values):
+        '''
+        :param values: A chunk of values with dimensions (realization,time,level,row,column).
+        :type values: :class:`numpy.ma.MaskedArray`
+        '''
+        assert(len(values.shape) == 5)
+        values = np.ma.asarray(values)
+        valid = np.invert(np.ma.getmaskarray(values))
+        n = valid.sum(axis=1).reshape(self._get_reduced_shape_(values))
+        if self.count is None:
+            self.count = n
+            if self._dtype is None:
+                if self._float_output and not np.issubdtype(values.dtype,np.floating):
+                    self._dtype = np.float64
+                else:
+                    self._dtype = values.dtype
+            self._initialize_(values,valid,n)
+        else:
+            self._update_(values,valid,n)
+            self.count = self.count + n
+
+    def get_value(self):
+        ''':rtype: :class:`numpy.ma.MaskedArray`'''
+        if self.count is None:
+            ocgis_lh(exc=ValueError('No values have been accumulated.'),logger='calc.online')
+        value = self._get_value_()
+        ret = np.ma.array(value.astype(self._dtype),mask=self.count == 0)
+        return(ret)
+
+    def get_attrs(self):
+        '''
+        :returns: Additional attributes for the output variable.
+        :rtype: dict
+        '''
+        return({})
+
+    @abc.abstractmethod
+    def _initialize_(self,values,valid,n): pass
+
+    @abc.abstractmethod
+    def _update_(self,values,valid,n): pass
+
+    @abc.abstractmethod
+    def _get_value_(self): pass
+
+    @staticmethod
+    def _get_reduced_shape_(values):
+        shp = list(values.shape)
+        shp[1] = 1
+        return(shp)
+
+    def _get_filled_sum_(self,values):
+        ret = np.ma.filled(values.astype(np.float64),0.0).sum(axis=1)
+        return(ret.reshape(self._get_reduced_shape_(values)))
+
+
+class OnlineCount(AbstractOnlineAccumulator):
+    '''Count of unmasked values (statistical sample size).'''
+    dtype = constants.np_int
+
+    def _initialize_(self,values,valid,n): pass
+
+    def _update_(self,values,valid,n): pass
+
+    def _get_value_(self):
+        return(self.count)
+
+    def get_value(self):
+        ## sample sizes of zero are valid and are not masked
+        return(np.ma.array(self.count.astype(self._dtype),mask=False))
+
+
+class OnlineMean(AbstractOnlineAccumulator):
+    _float_output = True
+
+    def _initialize_(self,values,valid,n):
+        self._sum = self._get_filled_sum_(values)
+
+    def _update_(self,values,valid,n):
+        self._sum += self._get_filled_sum_(values)
+
+    def _get_value_(self):
+        with np.errstate(divide='ignore',invalid='ignore'):
+            ret = self._sum/self.count
+        return(ret)
+
+
+class OnlineStandardDeviation(AbstractOnlineAccumulator):
+    '''
+    Population standard deviation (i.e. `ddof=0`) using Welford's method. Chunk
+    moments are merged with the pairwise update of Chan et al.
+    '''
+    _float_output = True
+
+    def _initialize_(self,values,valid,n):
+        self._mean,self._m2 = self._get_chunk_moments_(values,n)
+
+    def _update_(self,values,valid,n):
+        mean_b,m2_b = self._get_chunk_moments_(values,n)
+        n_a = self.count.astype(np.float64)
+        n_b = n.astype(np.float64)
+        n_ab = n_a + n_b
+        delta = mean_b - self._mean
+        with np.errstate(divide='ignore',invalid='ignore'):
+            weight = np.where(n_ab > 0,n_b/n_ab,0.0)
+            cross = np.where(n_ab > 0,delta**2*n_a*n_b/n_ab,0.0)
+        self._mean = self._mean + delta*weight
+        self._m2 = self._m2 + m2_b + cross
+
+    def _get_value_(self):
+        with np.errstate(divide='ignore',invalid='ignore'):
+            ret = np.sqrt(self._m2/self.count)
+        return(ret)
+
+    def _get_chunk_moments_(self,values,n):
+        with np.errstate(divide='ignore',invalid='ignore'):
+            mean = np.where(n > 0,self._get_filled_sum_(values)/n,0.0)
+        dev = np.ma.filled(values.astype(np.float64) - mean,0.0)
+        m2 = (dev**2).sum(axis=1).reshape(mean.shape)
+        return(mean,m2)
+
+
+class AbstractOnlineExtremum(AbstractOnlineAccumulator):
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractproperty
+    def _reduce(self): 'np.maximum or np.minimum'
+
+    @abc.abstractproperty
+    def _fill(self): float
+
+    def _initialize_(self,values,valid,n):
+        self._extremum = self._get_chunk_extremum_(values)
+
+    def _update_(self,values,valid,n):
+        self._extremum = self._reduce(self._extremum,self._get_chunk_extremum_(values))
+
+    def _get_value_(self):
+        return(self._extremum)
+
+    def _get_chunk_extremum_(self,values):
+        filled = np.ma.filled(values.astype(np.float64),self._fill)
+        ret = self._reduce.reduce(filled,axis=1)
+        return(ret.reshape(self._get_reduced_shape_(values)))
+
+
+class OnlineMax(AbstractOnlineExtremum):
+    _reduce = np.maximum
+    _fill = -np.inf
+
+
+class OnlineMin(AbstractOnlineExtremum):
+    _reduce = np.minimum
+    _fill = np.inf
+
+
+class OnlineQuantileSketch(AbstractOnlineAccumulator):
+    '''
+    Approximate percentile using a :class:`~ocgis.calc.sketch.QuantileSketch`. The
+    compactor capacity is set by the "sketch_size" parameter.
+    '''
+    #: Compactor capacity used if "sketch_size" is not provided.
+    default_sketch_size = 200
+
+    def _initialize_(self,values,valid,n):
+        shp = list(values.shape)
+        shp.pop(1)
+        k = self.parms.get('sketch_size') or self.default_sketch_size
+        self.sketch = QuantileSketch(shp,k=k)
+        self.sketch.update(values,axis=1)
+
+    def _update_(self,values,valid,n):
+        self.sketch.update(values,axis=1)
+
+    def _get_value_(self):
+        ret = self.sketch.get_quantile(self.parms['percentile']/100.0)
+        return(ret.data.reshape(self.count.shape))
+
+    def get_attrs(self):
+        ret = {'quantile_sketch_size':self.sketch.k,
+               'quantile_rank_error':self.sketch.get_error_bound()}
+        return(ret)
+
+
+class AbstractOnlineConditionCount(AbstractOnlineAccumulator):
+    '''Running count of unmasked values satisfying a condition.'''
+    __metaclass__ = abc.ABCMeta
+    dtype = np.int32
+
+    @abc.abstractmethod
+    def _get_condition_(self,values):
+        ''':rtype: boolean :class:`numpy.ndarray`'''
+
+    def _initialize_(self,values,valid,n):
+        self._hits = self._get_chunk_hits_(values,valid)
+
+    def _update_(self,values,valid,n):
+        self._hits += self._get_chunk_hits_(values,valid)
+
+    def _get_value_(self):
+        return(self._hits)
+
+    def _get_chunk_hits_(self,values,valid):
+        condition = np.logical_and(np.ma.filled(self._get_condition_(values),False),valid)
+        return(condition.sum(axis=1).reshape(self._get_reduced_shape_(values)))
+
+
+class OnlineThreshold(AbstractOnlineConditionCount):
+
+    def _get_condition_(self,values):
+        threshold = self.parms['threshold']
+        operation = self.parms['operation']
+        if operation == 'gt':
+            ret = values > threshold
+        elif operation == 'lt':
+            ret = values < threshold
+        elif operation == 'gte':
+            ret = values >= threshold
+        elif operation == 'lte':
+            ret = values <= threshold
+        else:
+            raise(NotImplementedError('The operation "{0}" was not recognized.'.format(operation)))
+        return(ret)
+
+
+class OnlineBetween(AbstractOnlineConditionCount):
+
+    def _get_condition_(self,values):
+        lower,upper = float(self.parms['lower']),float(self.parms['upper'])
+        assert(lower <= upper)
+        return(np.logical_and(values >= lower,values <= upper))
+
+
+def iter_online_groups(field,calc,calc_grouping,chunk_size=365,calc_sample_size=False,attrs=None):
+    '''
+    Compute set functions over temporal groups by streaming the field's time axis
+    in chunks of `chunk_size`. Memory is bounded by a single chunk plus the
+    accumulators of temporal groups not yet closed. Only functions defining an
+    :attr:`~ocgis.calc.base.AbstractFunction.Online` accumulator are supported.
+    :class:`~ocgis.calc.engine.OcgCalculationEngine` uses this function when
+    :attr:`ocgis.env.ONLINE_CHUNK_SIZE` is set.
+
+    >>> calc = [{'func':'mean','name':'mean','ref':Mean,'kwds':{}}]
+    >>> for idx_group,ret in iter_online_groups(field,calc,['month','year']):
+    ...     ret['mean_tas'].shape
+    (1, 1, 1, 64, 128)
+
+    :param field: The source field. Values are loaded from source one chunk at a time.
+    :type field: :class:`ocgis.interface.base.field.Field`
+    :param calc: Sequence of parsed function dictionaries (see :class:`ocgis.api.parms.definition.Calc`).
+    :type calc: list of dict
+    :param calc_grouping: The temporal grouping.
+    :type calc_grouping: list of str
+    :param chunk_size: Number of time steps read per chunk.
+    :type chunk_size: int
+    :param calc_sample_size: If `True`, also yield sample sizes with aliases prefixed by "n_".
+    :type calc_sample_size: bool
+    :param attrs: If provided, this dictionary is updated with output variable attributes
+     reported by the accumulators (e.g. quantile sketch error bounds) keyed by output
+     alias. Numeric attributes hold the maximum across temporal groups.
+    :type attrs: dict
+    :yields: tuple of (temporal group index, :class:`collections.OrderedDict` mapping
+     output aliases to arrays with dimensions (realization,1,level,row,column))
+    '''
+    chunk_size = int(chunk_size)
+    if chunk_size <= 0:
+        ocgis_lh(exc=ValueError('"chunk_size" must be greater than 0.'),logger='calc.online')
+
+    tgd = field.temporal.get_grouping(calc_grouping)
+    ## the function objects are only used to format the parameters
+    functions = []
+    for f in calc:
+        function = f['ref'](alias=f['name'],field=field,parms=f['kwds'],tgd=tgd)
+        if function.Online is None:
+            exc = CalculationException(f['ref'],'No online accumulator is available for this function.')
+            ocgis_lh(exc=exc,logger='calc.online')
+        functions.append(function)
+
+    ## the last time index of a group determines when it is closed
+    group_indices = [np.arange(dgroup.shape[0])[dgroup] for dgroup in tgd.dgroups]
+    group_last = [indices[-1] for indices in group_indices]
+
+    aliases = field.variables.keys()
+    open_groups = {}
+    n_time = field.shape[1]
+    for start in range(0,n_time,chunk_size):
+        stop = min(start+chunk_size,n_time)
+        chunk = field[:,start:stop,:,:,:]
+        chunk_values = {}
+        for alias in aliases:
+            chunk_values[alias] = chunk.variables[alias].value
+
+        for idx_group,indices in enumerate(group_indices):
+            select = indices[np.logical_and(indices >= start,indices < stop)] - start
+            if select.shape[0] == 0:
+                continue
+            if idx_group not in open_groups:
+                accumulators = OrderedDict()
+                for alias in aliases:
+                    for function in functions:
+                        key = '{0}_{1}'.format(function.alias,alias)
+                        accumulators[key] = (alias,function.Online(**function.parms))
+                    ## the sample size is identical for all functions applied to
+                    ## a variable.
+                    if calc_sample_size:
+                        accumulators[alias] = (alias,OnlineCount())
+                open_groups[idx_group] = accumulators
+            for alias,accumulator in open_groups[idx_group].itervalues():
+                accumulator.update(chunk_values[alias][:,select,:,:,:])
+
+        ## release the chunk before yielding closed groups
+        del chunk,chunk_values
+
+        for idx_group in sorted(open_groups.keys()):
+            if group_last[idx_group] < stop:
+                accumulators = open_groups.pop(idx_group)
+                ret = OrderedDict()
+                for key,(alias,accumulator) in accumulators.iteritems():
+                    if key in aliases:
+                        continue
+                    ret[key] = accumulator.get_value()
+                    if attrs is not None:
+                        key_attrs = attrs.setdefault(key,{})
+                        for k,v in accumulator.get_attrs().iteritems():
+                            key_attrs[k] = max(key_attrs.get(k,v),v)
+                    if calc_sample_size:
+                        ret['n_'+key] = accumulators[alias][1].get_value()
+                yield(idx_group,ret)
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+def get_percentile(values,percentile,axis=0):
+    '''
+    Compute percentiles along an axis of a masked array. Masked values are excluded
+    from the computation and cells without any unmasked values are masked in the
+    output. Linear interpolation between the closest ranks is used, matching the
+    default of :func:`numpy.percentile`.
+
+    >>> values = np.ma.array([[1,2],[3,4],[5,6]],mask=[[0,0],[0,1],[0,0]])
+    >>> get_percentile(values,50).tolist()
+    [3.0, 4.0]
+    >>> get_percentile(values,[0,100]).shape
+    (2, 2)
+
+    :param values: The input values.
+    :type values: :class:`numpy.ma.MaskedArray` or :class:`numpy.ndarray`
+    :param percentile: Percentile(s) to compute.
+    :type percentile: float or sequence of floats on the interval [0,100]
+    :param axis: The axis to reduce.
+    :type axis: int
+    :returns: A masked array with the reduced axis removed. If a sequence of
+     percentiles is provided, a leading dimension is added indexing the percentiles.
+    :rtype: :class:`numpy.ma.MaskedArray`
+    '''
+    scalar = np.isscalar(percentile)
+    q = np.atleast_1d(np.asarray(percentile,dtype=np.float64))/100.0
+    if np.any(q < 0) or np.any(q > 1):
+        raise(ValueError('Percentiles must be in the range [0,100].'))
+
+    ## the reduction axis is moved to the front and the remaining dimensions are
+    ## flattened into cells.
+    values = np.ma.asarray(values)
+    values = np.rollaxis(values,axis)
+    shp_out = values.shape[1:]
+    n_time = values.shape[0]
+    values = values.reshape(n_time,-1)
+    mask = np.ma.getmask(values)
+
+    if mask is np.ma.nomask or not mask.any():
+        ## with no masked values all cells have the same sample count and only
+        ## the ranks required for interpolation need to be partitioned.
+        count = np.empty(values.shape[1],dtype=np.int64)
+        count.fill(n_time)
+        data = values.data
+        if n_time > 0:
+            below,above,_ = _get_ranks_(q,n_time)
+            kth = np.unique(np.concatenate((below,above)))
+            data = np.partition(data,kth,axis=0)
+    else:
+        ## masked values are sorted to the end of each cell
+        count = np.invert(mask).sum(axis=0)
+        data = values.data.astype(np.float64)
+        data[mask] = np.inf
+        data.sort(axis=0)
+
+    n_cells = values.shape[1]
+    cells = np.arange(n_cells)
+    ret = np.zeros((q.shape[0],n_cells),dtype=np.float64)
+    empty = count == 0
+    if n_time > 0 and not empty.all():
+        ## cells without values are assigned a rank of zero and masked below
+        count_safe = np.maximum(count,1)
+        for ii,qq in enumerate(q):
+            below,above,weights_above = _get_ranks_(qq,count_safe)
+            lower = data[below,cells].astype(np.float64)
+            upper = data[above,cells].astype(np.float64)
+            ## empty cells hold infinite values
+            with np.errstate(invalid='ignore'):
+                ret[ii] = lower*(1 - weights_above) + upper*weights_above
+
+    ret = ret.reshape([q.shape[0]] + list(shp_out))
+    ret_mask = np.empty(ret.shape,dtype=bool)
+    ret_mask[:] = empty.reshape(shp_out)
+    ret = np.ma.array(ret,mask=ret_mask)
+    if scalar:
+        ret = ret[0]
+    return(ret)
+
+
+def get_median(values,axis=0):
+    '''
+    Compute the median along an axis of a masked array. See :func:`get_percentile`.
+
+    :rtype: :class:`numpy.ma.MaskedArray`
+    '''
+    return(get_percentile(values,50,axis=axis))
+
+
+def _get_ranks_(q,count):
+    '''
+    :param q: Quantile(s) on the interval [0,1].
+    :param count: Sample count(s).
+    :returns: Tuple of (lower rank, upper rank, weight of the upper rank).
+    '''
+    index = q*(count - 1)
+    below = np.floor(index).astype(np.int64)
+    above = np.minimum(below + 1,count - 1)
+    weights_above = index - below
+    return(below,above,weights_above)
@@ -0,0 +1,167 @@
+import numpy as np
+from ocgis.calc.percentile import get_percentile
+
+
+class QuantileSketch(object):
+    '''
+    Mergeable approximate quantile sketch maintained independently for each cell
+    of an array. The sketch is a stack of compactors (see Karnin, Lang, and Liberty,
+    "Optimal Quantile Approximation in Streams", 2016) with a fixed capacity `k`
+    at each level. When a level reaches its capacity, its sorted items are halved
+    with every other item promoted to the next level at double the weight.
+
+    Masked values are stored as NaN placeholders so all cells share the same buffer
+    sizes and compactions are vectorized across cells. NaN placeholders sort
+    last and do not contribute to the quantile queries.
+
+    Sketches may be updated in chunks along the reduction axis, merged with sketches
+    computed elsewhere (e.g. other files or processes), and pickled.
+
+    >>> sketch = QuantileSketch((64,128),k=200)
+    >>> for chunk in chunks:
+    ...     sketch.update(chunk)
+    >>> sketch.get_quantile(0.9).shape
+    (64, 128)
+
+    :param shape: The shape of the cell dimensions (i.e. the input shape without
+     the reduction axis).
+    :type shape: tuple of int
+    :param k: The compactor capacity. Larger values use more memory and reduce error.
+    :type k: int
+    '''
+
+    def __init__(self,shape,k=200):
+        self.shape = tuple(shape)
+        self.k = int(k)
+        if self.k < 2:
+            raise(ValueError('The sketch size must be >= 2.'))
+        n_cells = int(np.prod(self.shape))
+        self.levels = [np.empty((n_cells,0),dtype=np.float64)]
+        #: Count of unmasked values for each cell.
+        self.count = np.zeros(n_cells,dtype=np.int64)
+        #: Count of values (masked or unmasked) added to each cell.
+        self.n = 0
+        #: Upper bound on the absolute rank error introduced by compactions.
+        self.rank_error = 0
+        self._offsets = [0]
+
+    def update(self,values,axis=0):
+        '''
+        :param values: Values to add to the sketch. With `axis` removed, the shape
+         must match the sketch shape.
+        :type values: :class:`numpy.ma.MaskedArray` or :class:`numpy.ndarray`
+        :param axis: The reduction axis (e.g. time).
+        :type axis: int
+        '''
+        values = np.ma.asarray(values)
+        values = np.rollaxis(values,axis)
+        if values.shape[1:] != self.shape:
+            raise(ValueError('Value shape {0} does not match the sketch shape {1}.'.format(values.shape[1:],self.shape)))
+        n_time = values.shape[0]
+        values = values.reshape(n_time,-1)
+        self.count += n_time - np.ma.getmaskarray(values).sum(axis=0)
+        self.n += n_time
+        items = np.ma.filled(values.astype(np.float64),np.nan).T
+        self.levels[0] = np.hstack((self.levels[0],items))
+        self._compress_()
+
+    def merge(self,other):
+        '''
+        Merge another sketch into this sketch.
+
+        :type other: :class:`ocgis.calc.sketch.QuantileSketch`
+        :returns: This sketch.
+        '''
+        if other.shape != self.shape or other.k != self.k:
+            raise(ValueError('Only sketches with equivalent shapes and sizes may be merged.'))
+        for idx,level in enumerate(other.levels):
+            if idx >= len(self.levels):
+                self._add_level_()
+            self.levels[idx] = np.hstack((self.levels[idx],level))
+        self.count += other.count
+        self.n += other.n
+        self.rank_error += other.rank_error
+        self._compress_()
+        return(self)
+
+    def get_error_bound(self):
+        '''
+        :returns: Upper bound on the rank error of quantile queries normalized by the
+         number of unmasked values. The cell with the fewest unmasked values determines
+         the bound. The bound is zero if the sketch holds all values exactly.
+        :rtype: float
+        '''
+        counts = self.count[self.count > 0]
+        if counts.shape[0] == 0 or len(self.levels) == 1:
+            ret = 0.0
+        else:
+            ## a query selects a retained item and may be off by up to the weight
+            ## of the heaviest item in addition to the compaction error. masked
+            ## placeholders sort last and do not shift the ranks of unmasked values.
+            ret = min(1.0,float(self.rank_error + 2**(len(self.levels) - 1))/counts.min())
+        return(ret)
+
+    def get_quantile(self,q):
+        '''
+        :param q: Quantile(s) on the interval [0,1].
+        :type q: float or sequence of floats
+        :returns: A masked array with the sketch shape. Cells with no unmasked values
+         are masked. If a sequence of quantiles is provided, a leading dimension is
+         added indexing the quantiles.
+        :rtype: :class:`numpy.ma.MaskedArray`
+        '''
+        scalar = np.isscalar(q)
+        qs = np.atleast_1d(np.asarray(q,dtype=np.float64))
+
+        ## no compaction has occurred and values are held exactly
+        if len(self.levels) == 1:
+            values = np.ma.masked_invalid(self.levels[0].T)
+            ret = get_percentile(values,qs*100,axis=0)
+        else:
+            items = np.hstack(self.levels)
+            weights = np.hstack([np.ones(level.shape[1],dtype=np.float64)*2**idx for idx,level in enumerate(self.levels)])
+            order = np.argsort(items,axis=1)
+            cells = np.arange(items.shape[0]).reshape(-1,1)
+            items = items[cells,order]
+            weights = weights[order]
+            weights[np.isnan(items)] = 0
+            cumulative = np.cumsum(weights,axis=1)
+            total = cumulative[:,-1]
+            ret = np.empty((qs.shape[0],items.shape[0]),dtype=np.float64)
+            for ii,qq in enumerate(qs):
+                rank = qq*(total - 1)
+                idx = np.argmax(cumulative > rank.reshape(-1,1),axis=1)
+                ret[ii] = items[cells[:,0],idx]
+            ret = np.ma.array(ret,mask=np.zeros(ret.shape,dtype=bool))
+
+        ret = ret.reshape([qs.shape[0]] + list(self.shape))
+        ret.mask = np.logical_or(np.ma.getmaskarray(ret),(self.count == 0).reshape(self.shape))
+        if scalar:
+            ret = ret[0]
+        return(ret)
+
+    def _add_level_(self):
+        self.levels.append(np.empty((self.levels[0].shape[0],0),dtype=np.float64))
+        self._offsets.append(0)
+
+    def _compress_(self):
+        idx = 0
+        while idx < len(self.levels):
+            if self.levels[idx].shape[1] >= self.k:
+                self._compact_(idx)
+            idx += 1
+
+    def _compact_(self,idx):
+        buf = np.sort(self.levels[idx],axis=1)
+        m = buf.shape[1]
+        m_even = m - m%2
+        ## alternate the offset to avoid biasing the retained items
+        offset = self._offsets[idx]
+        self._offsets[idx] = 1 - offset
+        promoted = buf[:,offset:m_even:2]
+        self.levels[idx] = buf[:,m_even:]
+        if idx + 1 == len(self.levels):
+            self._add_level_()
+        self.levels[idx+1] = np.hstack((self.levels[idx+1],promoted))
+        ## a compaction of weight 2**idx items changes any rank by at most 2**idx
+        self.rank_error += 2**idx
@@ -22,7 +22,7 @@ level_headers = ['lid','level']
 required_headers = ['did','ugid','gid']
 
 #: Key identifiers for output formats.
-output_formats = ['numpy','nc','csv','csv+','shp','geojson','meta']
+output_formats = ['numpy','nc','nc-ts','csv','csv+','shp','geojson','parquet','npy','meta']
 
 #test_data_download_url_prefix = 'https://dl.dropboxusercontent.com/u/867854/test_data_download/'
 test_data_download_url_prefix = 'http://www.earthsystemmodeling.org/download/data/ocgis/nc/'
@@ -37,6 +37,19 @@ calc_year_centroid_day = 1
 #: The number of values to use when calculating data resolution.
 resolution_limit = 100
 
+#: The maximum number of data values in each block of rows during field iteration.
+iter_batch_size = 50000
+
+#: The maximum number of processed selection geometries cached during an operation.
+geom_cache_size = 256
+
+#: The maximum number of data values written to a netCDF variable at once.
+nc_write_size = 10000000
+#: The maximum number of data values copied to a memory-mapped NumPy file at once.
+npy_write_size = 10000000
+#: The target number of data values in automatically sized netCDF chunks.
+nc_chunk_size = 262144
+
 #: The data type to use for NumPy integers.
 np_int = np.int32
 #: The data type to use for NumPy floats.
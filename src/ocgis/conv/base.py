@@ -209,18 +209,22 @@ class OcgConverter(object):
         
         from ocgis.conv.fiona_ import ShpConverter, GeoJsonConverter
         from ocgis.conv.csv_ import CsvConverter, CsvPlusConverter
-        from ocgis.conv.numpy_ import NumpyConverter
+        from ocgis.conv.numpy_ import NumpyConverter, NpyConverter
+        from ocgis.conv.parquet_ import ParquetConverter
 #        from ocgis.conv.shpidx import ShpIdxConverter
 #        from ocgis.conv.keyed import KeyedConverter
-        from ocgis.conv.nc import NcConverter
+        from ocgis.conv.nc import NcConverter, NcTimeSeriesConverter
         
         mmap = {'shp':ShpConverter,
                 'csv':CsvConverter,
                 'csv+':CsvPlusConverter,
                 'numpy':NumpyConverter,
+                'npy':NpyConverter,
                 'geojson':GeoJsonConverter,
+                'parquet':ParquetConverter,
 #                'shpidx':ShpIdxConverter,
 #                'keyed':KeyedConverter,
-                'nc':NcConverter}
+                'nc':NcConverter,
+                'nc-ts':NcTimeSeriesConverter}
         
         return(mmap[output_format])
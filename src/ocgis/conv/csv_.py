@@ -7,28 +7,85 @@ import logging
 from ocgis.util.logging_ocgis import ocgis_lh
 import fiona
 from shapely.geometry.geo import mapping
+import itertools
+import gzip
+import numpy as np
 
 
 class OcgDialect(excel):
     lineterminator = '\n'
 
 
+def get_csv_strings(values):
+    '''
+    Format column values as they are written by :class:`csv.writer` using
+    :class:`OcgDialect`. Floating point arrays are formatted with a single string
+    formatting operation.
+    
+    :param values: The column values.
+    :type values: one-dimensional :class:`numpy.ndarray`
+    :rtype: one-dimensional object :class:`numpy.ndarray` of str
+    '''
+    ret = np.empty(values.shape[0],dtype=object)
+    if values.shape[0] == 0:
+        pass
+    elif values.dtype == np.float64:
+        ## this matches the representation of NumPy 64-bit floats
+        strings = ('\n'.join(['%.17g']*values.shape[0]) % tuple(values.tolist())).split('\n')
+        ret[:] = [v if ('.' in v or 'e' in v or 'n' in v) else v+'.0' for v in strings]
+    elif values.dtype.kind in 'biu':
+        ret[:] = values.astype(str).tolist()
+    elif values.dtype == object:
+        ret[:] = map(_get_csv_string_,values)
+    else:
+        ret[:] = map(str,values)
+    return(ret)
+
+def write_csv_batch(fobj,batch):
+    '''
+    Write a block of rows to an open file.
+    
+    :param file fobj: The target file object.
+    :param batch: Maps headers to object arrays of formatted strings. See
+     :func:`get_csv_strings`.
+    :type batch: :class:`collections.OrderedDict`
+    '''
+    lines = itertools.imap(','.join,itertools.izip(*batch.values()))
+    fobj.write('\n'.join(lines))
+    fobj.write('\n')
+
+def _get_csv_string_(value):
+    if value is None:
+        ret = ''
+    ## floats (including NumPy 64-bit floats) are represented by the csv module
+    elif isinstance(value,float):
+        ret = repr(value)
+    else:
+        ret = str(value)
+        if isinstance(value,basestring) and any([c in ret for c in ',"\r\n']):
+            ret = '"{0}"'.format(ret.replace('"','""'))
+    return(ret)
+
+
 class CsvConverter(OcgConverter):
     _ext = 'csv'
                     
     def _build_(self,coll):
         headers = [h.upper() for h in coll.headers]
-        f = open(self.path,'w')
-        writer = csv.DictWriter(f,headers,dialect=OcgDialect)
-        writer.writeheader()
+        if self.ops is not None and self.ops.output_compression == 'gzip':
+            self.path = self.path + '.gz'
+            f = gzip.open(self.path,'wb')
+        else:
+            f = open(self.path,'w')
+        writer = csv.writer(f,dialect=OcgDialect)
+        writer.writerow(headers)
         ret = {'file_object':f,'csv_writer':writer}
         return(ret)
         
     def _write_coll_(self,f,coll):
-        writer = f['csv_writer']
-        
-        for geom,row in coll.get_iter_dict(use_upper_keys=True):
-            writer.writerow(row)
+        ## batch columns are formatted strings ordered by the collection headers.
+        for geoms,batch in coll.get_iter_batches(use_upper_keys=True,formatter=get_csv_strings):
+            write_csv_batch(f['file_object'],batch)
 
     def _finalize_(self,f):
         for fobj in f.itervalues():
@@ -43,7 +100,7 @@ class CsvPlusConverter(CsvConverter):
     def _build_(self,coll):
         ret = CsvConverter._build_(self,coll)
         
-        self._ugid_gid_store = {}
+        self._ugid_gid_store = set()
         
         if not self.ops.aggregate:
             fiona_path = os.path.join(self._get_or_create_shp_folder_(),self.prefix+'_gid.shp')
@@ -63,34 +120,25 @@ class CsvPlusConverter(CsvConverter):
         return(ret)
     
     def _write_coll_(self,f,coll):
-        writer = f['csv_writer']
-        file_fiona = f['fiona_object']
-        rstore = self._ugid_gid_store
-        is_aggregated = self.ops.aggregate
-        
-        for geom,row in coll.get_iter_dict(use_upper_keys=True):
-            writer.writerow(row)
-            if not is_aggregated:
-                did,gid,ugid = row['DID'],row['GID'],row['UGID']
-                try:
-                    if gid in rstore[did][ugid]:
-                        continue
-                    else:
-                        raise(KeyError)
-                except KeyError:
-                    if did not in rstore:
-                        rstore[did] = {}
-                    if ugid not in rstore[did]:
-                        rstore[did][ugid] = []
-                    if gid not in rstore[did][ugid]:
-                        rstore[did][ugid].append(gid)
-                    
-                    ## for multivariate calculation outputs the dataset identifier
-                    ## is None.
-                    try:
-                        converted_did = int(did)
-                    except TypeError:
-                        converted_did = None
-                    feature = {'properties':{'GID':int(gid),'UGID':int(ugid),'DID':converted_did},
-                               'geometry':mapping(geom)}
-                    file_fiona.write(feature)
+        for geoms,batch in coll.get_iter_batches(use_upper_keys=True,formatter=get_csv_strings):
+            write_csv_batch(f['file_object'],batch)
+        if not self.ops.aggregate:
+            self._write_gid_geometries_(f['fiona_object'],coll)
+            
+    def _write_gid_geometries_(self,fiona_object,coll):
+        ## geometries are written once for each dataset and selection geometry
+        ## directly from the field's spatial dimension.
+        written = self._ugid_gid_store
+        for ugid,field_dict in coll.iteritems():
+            for field in field_dict.itervalues():
+                ## for multivariate calculation outputs the dataset identifier is
+                ## None.
+                did = field._get_variable_iter_yield_(field.variables.values()[0])['did']
+                key = (did,ugid)
+                if key in written:
+                    continue
+                written.add(key)
+                records = [{'properties':{'GID':int(gid),'UGID':int(ugid),'DID':did},
+                            'geometry':mapping(geom)}
+                           for _,_,geom,gid in field.spatial.get_geom_iter()]
+                fiona_object.writerecords(records)
@@ -8,6 +8,12 @@ from shapely.geometry.geo import mapping
 from fiona.rfc3339 import FionaTimeType, FionaDateType
 import abc
 from ocgis.util.logging_ocgis import ocgis_lh
+from ocgis import constants
+from ocgis.util.helpers import get_default_or_apply
+import os
+import csv
+import itertools
+from ocgis.conv.csv_ import OcgDialect, get_csv_strings, write_csv_batch
 
     
 class FionaConverter(OcgConverter):
@@ -33,9 +39,13 @@ class FionaConverter(OcgConverter):
                            np.float16:'float',
                            np.int16:'int',
                            str:'str'}
+    #: Headers stored in value columns for the wide layout.
+    _wide_headers = ('tid','time','year','month','day','value')
     
     def _finalize_(self,f):
-        f['fiona_object'].close()
+        for key in ['fiona_object','file_object']:
+            if key in f:
+                f[key].close()
     
     def _build_(self,coll):
         fiona_conversion = {}
@@ -86,6 +96,20 @@ class FionaConverter(OcgConverter):
         if geometry_type == 'Polygon':
             geometry_type = 'MultiPolygon'
         
+        ## geometries are stored once for the normalized and wide layouts. values
+        ## are written to companion tables.
+        layout = self._get_layout_()
+        if layout == 'normalized':
+            fiona_properties = OrderedDict([['DID','int'],['UGID','int'],['GID','int']])
+        elif layout == 'wide':
+            if coll.value_keys is not None:
+                ocgis_lh(exc=ValueError('The wide output layout is not available for keyed outputs.'),logger='fiona_')
+            n_columns = get_default_or_apply(archetype_field.temporal,len,1)
+            value_type = fiona_properties.get('VALUE','float')
+            fiona_properties = OrderedDict([(k,v) for k,v in fiona_properties.iteritems() if k.lower() not in self._wide_headers])
+            for column in self._get_wide_columns_(n_columns):
+                fiona_properties[column] = value_type
+        
         fiona_schema = {'geometry':geometry_type,
                         'properties':fiona_properties}
         
@@ -99,13 +123,168 @@ class FionaConverter(OcgConverter):
         
         ret = {'fiona_object':fiona_object,'fiona_conversion':fiona_conversion}
         
+        if layout == 'normalized':
+            ## values are written to a csv file keyed by the geometry identifiers
+            fobj = open(os.path.join(self.outdir,self.prefix+'_values.csv'),'w')
+            csv.writer(fobj,dialect=OcgDialect).writerow([h.upper() for h in coll.headers])
+            ret.update({'file_object':fobj,'written':set()})
+        elif layout == 'wide':
+            ## maps the value columns to the time values
+            fobj = open(os.path.join(self.outdir,self.prefix+'_columns.csv'),'w')
+            writer = csv.writer(fobj,dialect=OcgDialect)
+            writer.writerow(['COLUMN','DID','TID','TIME','YEAR','MONTH','DAY'])
+            ret.update({'file_object':fobj,'csv_writer':writer,'written':set(),
+                        'columns':self._get_wide_columns_(n_columns)})
+        
+        return(ret)
+    
+    def _get_layout_(self):
+        if self.ops is None:
+            ret = 'long'
+        else:
+            ret = self.ops.output_layout
         return(ret)
     
+    @staticmethod
+    def _get_converted_column_(column,conversion):
+        if conversion is None:
+            ret = column
+        ## numeric conversions are applied to the whole column
+        elif conversion in (int,float):
+            ## masked values are replaced by the fill value which may not fit the
+            ## native integer type. these are converted individually.
+            fill = np.asarray(column == constants.fill_value,dtype=bool)
+            if conversion is int and fill.any():
+                select = np.invert(fill)
+                ret = np.empty(column.shape[0],dtype=object)
+                ret[select] = column[select].astype(int).tolist()
+                ret[fill] = [conversion(element) for element in column[fill]]
+                ret = ret.tolist()
+            else:
+                ret = column.astype(conversion).tolist()
+        else:
+            ret = [conversion(element) for element in column]
+        return(ret)
+    
+    @staticmethod
+    def _get_wide_columns_(n_columns):
+        return(['V{0}'.format(ii) for ii in range(1,n_columns+1)])
+    
     def _write_coll_(self,f,coll):
+        layout = self._get_layout_()
+        if layout == 'normalized':
+            self._write_coll_normalized_(f,coll)
+        elif layout == 'wide':
+            self._write_coll_wide_(f,coll)
+        else:
+            self._write_coll_long_(f,coll)
+            
+    def _write_coll_long_(self,f,coll):
+        fiona_object = f['fiona_object']
+        conversion = {k.upper():v for k,v in f['fiona_conversion'].iteritems()}
+        ## geometries are repeated for each time and level. map each geometry once
+        ## for the collection.
+        mapped = {}
+        for geoms,batch in coll.get_iter_batches(use_upper_keys=True):
+            keys = batch.keys()
+            columns = [self._get_converted_column_(batch[k],conversion.get(k)) for k in keys]
+            records = []
+            for geom,key,row in itertools.izip(geoms,itertools.izip(batch['DID'],batch['UGID'],batch['GID']),itertools.izip(*columns)):
+                try:
+                    geometry = mapped[key]
+                except KeyError:
+                    geometry = mapped[key] = mapping(geom)
+                records.append({'geometry':geometry,'properties':dict(itertools.izip(keys,row))})
+            fiona_object.writerecords(records)
+                
+    def _write_coll_normalized_(self,f,coll):
+        fiona_object = f['fiona_object']
+        written = f['written']
+        for geoms,batch in coll.get_iter_batches(use_upper_keys=True,formatter=get_csv_strings):
+            write_csv_batch(f['file_object'],batch)
+            ## write geometries not written by a previous row
+            records = []
+            for geom,key in itertools.izip(geoms,itertools.izip(batch['DID'],batch['UGID'],batch['GID'])):
+                if key not in written:
+                    written.add(key)
+                    ## for multivariate calculation outputs the dataset identifier
+                    ## is None and formatted as an empty string.
+                    properties = {'DID':None if key[0] == '' else int(key[0]),
+                                  'UGID':int(key[1]),'GID':int(key[2])}
+                    records.append({'geometry':mapping(geom),'properties':properties})
+            fiona_object.writerecords(records)
+            
+    def _write_coll_wide_(self,f,coll):
         fiona_object = f['fiona_object']
-        for geom,properties in coll.get_iter_dict(use_upper_keys=True,conversion_map=f['fiona_conversion']):
-            to_write = {'geometry':mapping(geom),'properties':properties}
-            fiona_object.write(to_write)
+        conversion = f['fiona_conversion']
+        columns = f['columns']
+        headers = [h for h in coll.headers if h not in self._wide_headers]
+        for ugid,field_dict in coll.iteritems():
+            for field in field_dict.itervalues():
+                n_time = 1 if field.temporal is None else field.temporal.shape[0]
+                if n_time > len(columns):
+                    msg = 'The field has {0} time values but the wide output layout has {1} value columns.'.format(n_time,len(columns))
+                    ocgis_lh(exc=ValueError(msg),logger='fiona_')
+                self._write_wide_columns_(f,field)
+                
+                for geom,properties,values in self._iter_wide_rows_(field,ugid,len(columns)):
+                    to_write = OrderedDict()
+                    for h in headers:
+                        value = properties[h]
+                        if h in conversion and value is not None:
+                            value = conversion[h](value)
+                        to_write[h.upper()] = value
+                    for column,value in itertools.izip(columns,values):
+                        if value is not None and 'value' in conversion:
+                            value = conversion['value'](value)
+                        to_write[column] = value
+                    fiona_object.write({'geometry':mapping(geom),'properties':to_write})
+    
+    @staticmethod
+    def _iter_wide_rows_(field,ugid,n_columns):
+        '''
+        :returns: Tuples of (geometry, non-temporal row values, time series values)
+         for each variable, realization, level, and geometry of the field. Rows are
+         assembled one grid row at a time, so memory is bounded by the time series
+         of a single grid row. Rows are ordered by grid row, variable, realization,
+         level, and grid column.
+        :rtype: tuple
+        '''
+        if field.temporal is None:
+            positions = {None:0}
+            time_keys = []
+        else:
+            positions = {tid:idx for idx,tid in enumerate(field.temporal.uid)}
+            time_keys = field._get_dimension_table_('temporal')[1].keys()
+        for idx_row in range(field.shape[3]):
+            ## rows are keyed by all non-temporal row values
+            rows = OrderedDict()
+            for batch in field[:,:,:,idx_row:idx_row+1,:].get_iter_batches():
+                batch['ugid'] = np.empty(batch['geom'].shape[0],dtype=object)
+                batch['ugid'].fill(ugid)
+                key_names = [k for k in batch.keys() if k not in time_keys and k not in ('geom','value')]
+                tids = batch['tid'] if 'tid' in batch else itertools.repeat(None)
+                keys = itertools.izip(*[batch[k] for k in key_names])
+                for key,geom,tid,value in itertools.izip(keys,batch['geom'],tids,batch['value']):
+                    try:
+                        row = rows[key]
+                    except KeyError:
+                        properties = dict(itertools.izip(key_names,key))
+                        row = rows[key] = (geom,properties,[None]*n_columns)
+                    row[2][positions[tid]] = value
+            for row in rows.itervalues():
+                yield(row)
+            
+    def _write_wide_columns_(self,f,field):
+        ## the column definitions are written once for each dataset
+        if field.uid in f['written']:
+            return
+        f['written'].add(field.uid)
+        if field.temporal is None:
+            f['csv_writer'].writerow([f['columns'][0],field.uid,None,None,None,None,None])
+        else:
+            for column,(_,row) in itertools.izip(f['columns'],field.temporal.get_iter()):
+                f['csv_writer'].writerow([column,field.uid,row['tid'],row['time'],row['year'],row['month'],row['day']])
 
 
 class ShpConverter(FionaConverter):
@@ -1,12 +1,53 @@
 from ocgis.conv.base import OcgConverter
 import netCDF4 as nc
+import numpy as np
+import itertools
 from ocgis import constants
 from ocgis.util.logging_ocgis import ocgis_lh
-from ocgis.interface.base.crs import CFWGS84
+from ocgis.interface.base.crs import CFWGS84, WGS84, CFCoordinateReferenceSystem
+from ocgis.util.helpers import get_object_array
 from ocgis.interface.nc.temporal import NcTemporalGroupDimension
 
+
+def get_chunksizes(shape,chunking):
+    '''
+    Get chunk sizes for a netCDF variable with time as its leading dimension and
+    rows and columns as its trailing dimensions. Chunks hold approximately
+    :attr:`ocgis.constants.nc_chunk_size` values.
+    
+    >>> get_chunksizes((365,180,360),'map')
+    (1, 180, 360)
+    
+    :param tuple shape: The variable shape.
+    :param str chunking: The read access pattern. A `'map'` chunk holds a single
+     time step of the spatial domain. A `'timeseries'` chunk holds the time series
+     for a block of cells.
+    :rtype: tuple of int
+    '''
+    size = constants.nc_chunk_size
+    n_time,n_row,n_col = shape[0],shape[-2],shape[-1]
+    if chunking == 'map':
+        n_spatial = float(n_row*n_col)
+        factor = min((size/n_spatial)**0.5,1.0)
+        ret = [1,max(int(n_row*factor),1),max(int(n_col*factor),1)]
+    else:
+        n_time = min(max(n_time,1),size)
+        n_cells = max(int((size/float(n_time))**0.5),1)
+        ret = [n_time,min(n_cells,n_row),min(n_cells,n_col)]
+    ## a single level is read at a time
+    if len(shape) == 4:
+        ret.insert(1,1)
+    return(tuple(ret))
+
     
 class NcConverter(OcgConverter):
+    '''
+    Variable values are written in slabs of time steps. Each slab is sliced from
+    the field before its value is loaded, so at most
+    :attr:`ocgis.constants.nc_write_size` data values are held in memory at once
+    when values are read from source. Operations union selection geometries for
+    netCDF output and all fields are written to the root group.
+    '''
     _ext = 'nc'
     
     def _finalize_(self,ds):
@@ -17,6 +58,9 @@ class NcConverter(OcgConverter):
         return(ds)
         
     def _get_file_format_(self):
+        options = self._get_nc_options_()
+        if 'file_format' in options:
+            return(options['file_format'])
         file_format = set()
         for rd in self.ops.dataset:
             rr = rd._source_metadata['file_format']
@@ -29,12 +73,60 @@ class NcConverter(OcgConverter):
             exc = ValueError('Multiple file formats found: {0}'.format(file_format))
             ocgis_lh(exc=exc,logger='conv.nc')
         else:
-            return(list(file_format)[0])
+            ret = list(file_format)[0]
+            ## chunking and compression are not supported by the netCDF-3 formats
+            kwds = self._get_variable_options_((1,1,1))
+            if ret.startswith('NETCDF3') and ('zlib' in kwds or 'chunksizes' in kwds):
+                ocgis_lh('writing NETCDF4_CLASSIC to support chunking and compression','conv.nc')
+                ret = 'NETCDF4_CLASSIC'
+            return(ret)
+    
+    def _get_nc_options_(self):
+        return(self.ops.nc_options or {})
+    
+    def _get_variable_options_(self,shape,dtype=None):
+        '''
+        :param tuple shape: The shape of the netCDF variable.
+        :param dtype: The data type of the netCDF variable.
+        :type dtype: :class:`numpy.dtype`
+        :returns: Keyword arguments for variable creation. Compressed variables are
+         always chunked.
+        :rtype: dict
+        '''
+        options = self._get_nc_options_()
+        ret = {}
+        if options.get('zlib',False):
+            ret['zlib'] = True
+            ret['complevel'] = options.get('complevel',4)
+            ret['shuffle'] = options.get('shuffle',True)
+        elif 'shuffle' in options:
+            ret['shuffle'] = options['shuffle']
+        if 'chunksizes' in options:
+            ret['chunksizes'] = tuple(options['chunksizes'])
+        elif 'chunking' in options or ret.get('zlib',False):
+            ret['chunksizes'] = get_chunksizes(shape,options.get('chunking','map'))
+        ## precision truncation only applies to floating point data
+        if 'least_significant_digit' in options and (dtype is None or dtype.kind == 'f'):
+            ret['least_significant_digit'] = options['least_significant_digit']
+        return(ret)
     
     def _write_coll_(self,ds,coll):
         
         ## get the target field from the collection
         arch = coll._archetype_field
+        target = self._write_dimensions_(ds,arch)
+        
+        for field_dict in coll.itervalues():
+            for field in field_dict.itervalues():
+                if field.temporal.shape[0] != arch.temporal.shape[0]:
+                    exc = ValueError('Fields written to netCDF must share their time values.')
+                    ocgis_lh(exc=exc,logger='conv.nc')
+                if field.shape[2:] != target['shape']:
+                    msg = 'Fields written to netCDF must share their level and spatial dimensions. Expected {0} but found {1}.'.format(target['shape'],field.shape[2:])
+                    ocgis_lh(exc=ValueError(msg),logger='conv.nc')
+                self._write_variables_(ds,target,field)
+    
+    def _write_dimensions_(self,ds,arch):
         
         ## reference the interfaces
         grid = arch.spatial.grid
@@ -138,30 +230,220 @@ class NcConverter(OcgConverter):
             except KeyError:
                 pass
             return(ret)
-        ## set the spatial data        
+        ## set the spatial data
         _make_spatial_variable_(ds,grid.row.meta['axis']['variable'],grid.row.value,(dim_row,),meta)
         _make_spatial_variable_(ds,grid.col.meta['axis']['variable'],grid.col.value,(dim_col,),meta)
         if grid.row.bounds is not None:
             _make_spatial_variable_(ds,grid.row.meta['axis']['bounds'],grid.row.bounds,(dim_row,dim_bnds),meta)
             _make_spatial_variable_(ds,grid.col.meta['axis']['bounds'],grid.col.bounds,(dim_col,dim_bnds),meta)
         
-        ## set the variable(s) #################################################
-        
-        ## loop through variables
-        for variable in arch.variables.itervalues():
-            value = ds.createVariable(variable.alias,variable.value.dtype,value_dims,
-                                      fill_value=variable.value.fill_value)
-            if not self.ops.file_only:
-                try:
-                    value[:] = variable.value.reshape(*value.shape)
-                except:
-                    import ipdb;ipdb.set_trace()
-            value.setncatts(variable.meta['attrs'])
-            ## and the units, converting to string as passing a NoneType will raise
-            ## an exception.
-            value.units = '' if variable.units is None else variable.units
-                    
         ## add projection variable if applicable ###############################
         
         if not isinstance(arch.spatial.crs,CFWGS84):
             arch.spatial.crs.write_to_rootgrp(ds,meta)
+
+        ret = {'value_dims':value_dims,'shape':arch.shape[2:]}
+        return(ret)
+    
+    def _write_variables_(self,ds,target,field):
+        '''
+        Write the field's variables in slabs of time steps with at most
+        :attr:`ocgis.constants.nc_write_size` data values. Values are loaded one
+        slab at a time when the field's values have not been loaded from source.
+        '''
+        if field.shape[0] != 1:
+            exc = ValueError('Variables with a realization dimension may not be written to netCDF.')
+            ocgis_lh(exc=exc,logger='conv.nc')
+        n_time = field.shape[1]
+        step = max(constants.nc_write_size//max(int(np.prod(field.shape[2:])),1),1)
+        ## only the first slab is needed to create the variables if no values are
+        ## written
+        if self.ops.file_only:
+            n_time = min(step,n_time)
+        for idx in range(0,n_time,step):
+            stop = min(idx+step,n_time)
+            slab = field[:,idx:stop,:,:,:]
+            for variable in slab.variables.itervalues():
+                value = variable.value
+                try:
+                    nc_variable = ds.variables[variable.alias]
+                except KeyError:
+                    shape = [field.shape[idx_shape] for idx_shape in [1,2,3,4]]
+                    if len(target['value_dims']) == 3:
+                        shape.pop(1)
+                    kwds = self._get_variable_options_(tuple(shape),dtype=value.dtype)
+                    nc_variable = ds.createVariable(variable.alias,value.dtype,target['value_dims'],
+                                                    fill_value=value.fill_value,**kwds)
+                    nc_variable.setncatts(variable.meta['attrs'])
+                    ## and the units, converting to string as passing a NoneType will raise
+                    ## an exception.
+                    nc_variable.units = '' if variable.units is None else variable.units
+                if self.ops.file_only:
+                    continue
+                ## remove the realization and, if there is no level, the level dimension
+                if len(target['value_dims']) == 3:
+                    nc_variable[idx:stop] = value[0,:,0,:,:]
+                else:
+                    nc_variable[idx:stop] = value[0,:,:,:,:]
+
+
+class NcTimeSeriesConverter(OcgConverter):
+    '''
+    Writes a CF-1.6 discrete sampling geometry file with a time series for each
+    station. A station is a combination of a selection geometry, a dataset, and a
+    data geometry (UGID, DID, and GID) with its geometry written once as well-known
+    text. Datasets on different grids therefore have their own stations. Data with
+    levels are written as time series profiles. Stations are appended along the
+    unlimited station dimension as collections arrive. All fields must share the
+    time values of the first field.
+    '''
+    _ext = 'nc'
+    
+    def _finalize_(self,f):
+        f['ds'].close()
+    
+    def _build_(self,coll):
+        arch = coll._archetype_field
+        temporal = arch.temporal
+        level = arch.level
+        meta = arch.meta
+        crs = arch.spatial.crs
+        
+        ds = nc.Dataset(self.path,'w',format='NETCDF4')
+        ds.Conventions = 'CF-1.6'
+        ds.featureType = 'timeSeries' if level is None else 'timeSeriesProfile'
+        
+        ## stations are appended as collections arrive
+        ds.createDimension('station')
+        ds.createDimension('time',temporal.shape[0])
+        
+        times = ds.createVariable('time',temporal.value.dtype,('time',))
+        times[:] = temporal.value
+        times.standard_name = 'time'
+        times.axis = 'T'
+        times.units = temporal.units
+        times.calendar = temporal.calendar
+        if temporal.bounds is not None:
+            ds.createDimension('bounds',2)
+            if isinstance(temporal,NcTemporalGroupDimension):
+                name_bounds = 'climatology_bounds'
+                times.climatology = name_bounds
+            else:
+                name_bounds = 'time_bounds'
+                times.bounds = name_bounds
+            times_bounds = ds.createVariable(name_bounds,temporal.bounds.dtype,('time','bounds'))
+            times_bounds[:] = temporal.bounds
+        
+        coordinates = ['time']
+        if level is not None:
+            ds.createDimension('z',level.shape[0])
+            levels = ds.createVariable('z',level.value.dtype,('z',))
+            levels[:] = level.value
+            try:
+                levels.setncatts(meta['variables'][meta['dim_map']['Z']['variable']]['attrs'])
+            except (KeyError,TypeError):
+                pass
+            levels.axis = 'Z'
+            coordinates.append('z')
+        
+        ## station variables
+        station_id = ds.createVariable('station_id',str,('station',))
+        station_id.cf_role = 'timeseries_id'
+        station_id.long_name = 'station identifier composed of the UGID, DID, and GID'
+        for name in ['ugid','did','gid']:
+            var = ds.createVariable(name,constants.np_int,('station',))
+            var.long_name = name.upper()
+        if isinstance(crs,WGS84):
+            names = [('lat','latitude','degrees_north'),('lon','longitude','degrees_east')]
+        else:
+            names = [('y','projection_y_coordinate','m'),('x','projection_x_coordinate','m')]
+        for name,standard_name,units in names:
+            var = ds.createVariable(name,np.float64,('station',))
+            var.standard_name = standard_name
+            var.units = units
+            coordinates.append(name)
+        geometry = ds.createVariable('geometry',str,('station',))
+        geometry.long_name = 'station geometry as well-known text. the station coordinates are the geometry centroid.'
+        
+        ## add projection variable if applicable
+        if isinstance(crs,CFCoordinateReferenceSystem) and not isinstance(crs,CFWGS84):
+            crs.write_to_rootgrp(ds,meta)
+            grid_mapping = meta['grid_mapping_variable_name']
+        else:
+            grid_mapping = None
+        
+        ret = {'ds':ds,'stations':{},'time':temporal.value,'coordinates':' '.join(coordinates),
+               'xy':[n[0] for n in reversed(names)],'grid_mapping':grid_mapping}
+        return(ret)
+    
+    def _write_coll_(self,f,coll):
+        for ugid,field_dict in coll.iteritems():
+            for field in field_dict.itervalues():
+                self._write_field_(f,ugid,field)
+    
+    def _write_field_(self,f,ugid,field):
+        ds = f['ds']
+        if field.temporal.shape != f['time'].shape or not np.all(field.temporal.value == f['time']):
+            exc = ValueError('Fields written to a time series netCDF file must share time values.')
+            ocgis_lh(exc=exc,logger='conv.nc')
+        
+        ## find or add the field's stations
+        stations = f['stations']
+        indices,rows,cols = [],[],[]
+        new = []
+        for row_idx,col_idx,geom,gid in field.spatial.get_geom_iter():
+            key = (ugid,field.uid,gid)
+            try:
+                idx = stations[key]
+            except KeyError:
+                idx = stations[key] = len(stations)
+                new.append((key,geom))
+            indices.append(idx)
+            rows.append(row_idx)
+            cols.append(col_idx)
+        if len(new) > 0:
+            start,stop = len(stations)-len(new),len(stations)
+            ds.variables['station_id'][start:stop] = get_object_array(['{0}_{1}_{2}'.format(*key) for key,_ in new])
+            for idx_key,name in enumerate(['ugid','did','gid']):
+                ds.variables[name][start:stop] = [key[idx_key] for key,_ in new]
+            centroids = [geom.centroid for _,geom in new]
+            ds.variables[f['xy'][0]][start:stop] = [c.x for c in centroids]
+            ds.variables[f['xy'][1]][start:stop] = [c.y for c in centroids]
+            ds.variables['geometry'][start:stop] = get_object_array([geom.wkt for _,geom in new])
+        if len(indices) == 0:
+            return
+        ## stations are contiguous if they were added by this field
+        is_contiguous = np.all(np.diff(indices) == 1)
+        
+        for variable in field.variables.itervalues():
+            try:
+                target = ds.variables[variable.alias]
+            except KeyError:
+                target = self._create_variable_(f,variable)
+            value = variable.value
+            if value.shape[0] != 1:
+                exc = ValueError('Variables with a realization dimension may not be written to netCDF.')
+                ocgis_lh(exc=exc,logger='conv.nc')
+            ## series for each station with dimensions (station,time,level)
+            value = value[0,:,:,rows,cols]
+            if len(target.dimensions) == 2:
+                value = value[:,:,0]
+            if is_contiguous:
+                target[indices[0]:indices[-1]+1] = value
+            else:
+                for idx,series in itertools.izip(indices,value):
+                    target[idx] = series
+    
+    def _create_variable_(self,f,variable):
+        dimensions = ['station','time']
+        if 'z' in f['ds'].dimensions:
+            dimensions.append('z')
+        ret = f['ds'].createVariable(variable.alias,variable.value.dtype,dimensions,
+                                     fill_value=variable.value.fill_value)
+        attrs = {k:v for k,v in variable.meta['attrs'].iteritems() if k not in ['_FillValue','coordinates','grid_mapping']}
+        ret.setncatts(attrs)
+        ret.units = '' if variable.units is None else variable.units
+        ret.coordinates = f['coordinates']
+        if f['grid_mapping'] is not None:
+            ret.grid_mapping = f['grid_mapping']
+        return(ret)
@@ -1,5 +1,9 @@
 from ocgis.conv.base import OcgConverter
 from ocgis.api.collection import SpatialCollection
+from ocgis import constants
+import numpy as np
+import os.path
+import json
 
     
 class NumpyConverter(OcgConverter):
@@ -19,4 +23,93 @@ class NumpyConverter(OcgConverter):
                 ret.add_field(k,coll.geoms[k],v.keys()[0],v.values()[0],properties=coll.properties[k])
         return(ret)
 
-    def _write_(self): pass
\ No newline at end of file
+    def _write_(self): pass
+
+
+class NpyConverter(OcgConverter):
+    '''
+    Writes the values and masks of each variable to memory-mapped NumPy `.npy`
+    files in the output directory with a JSON index describing the files. Returns
+    a collection like :class:`~ocgis.conv.numpy_.NumpyConverter` with variable
+    values backed by the memory-mapped files.
+    '''
+    _ext = None
+    #: Mode used to reopen the memory-mapped files for the returned collection.
+    _mmap_mode = 'r+'
+    
+    def __init__(self,*args,**kwds):
+        OcgConverter.__init__(self,*args,**kwds)
+        ## set when the index is written. remains None if no collections are
+        ## written.
+        self._collection = None
+    
+    def _build_(self,coll):
+        ret = {'collection':SpatialCollection(meta=coll.meta,key=coll.key,crs=coll.crs,headers=coll.headers),
+               'index':[]}
+        return(ret)
+    
+    def _finalize_(self,f):
+        path = os.path.join(self.outdir,self.prefix+'_index.json')
+        with open(path,'w') as fp:
+            json.dump({'prefix':self.prefix,'variables':f['index']},fp,indent=4)
+        self._collection = f['collection']
+    
+    def _get_return_(self):
+        ## None if no collections were written
+        return(self._collection)
+    
+    def _get_npy_name_(self,ugid,field_alias,variable_alias,suffix):
+        ret = '{0}_ugid{1}_{2}_{3}_{4}.npy'.format(self.prefix,ugid,field_alias,variable_alias,suffix)
+        return(ret)
+    
+    def _write_coll_(self,f,coll):
+        for ugid,field_dict in coll.iteritems():
+            for field_alias,field in field_dict.iteritems():
+                ## empty subsets have no values to write
+                if field is not None:
+                    for variable_alias,variable in field.variables.iteritems():
+                        names = [self._get_npy_name_(ugid,field_alias,variable_alias,suffix) for suffix in ['value','mask']]
+                        value = self._write_variable_value_(field,variable_alias,
+                         [os.path.join(self.outdir,name) for name in names],mode=self._mmap_mode)
+                        variable._value = value
+                        f['index'].append({'ugid':ugid,
+                                           'field':field_alias,
+                                           'variable':variable_alias,
+                                           'did':variable.did,
+                                           'dtype':value.dtype.str,
+                                           'shape':list(value.shape),
+                                           'fill_value':np.asscalar(np.array(value.fill_value)),
+                                           'value':names[0],
+                                           'mask':names[1]})
+                f['collection'].add_field(ugid,coll.geoms[ugid],field_alias,field,properties=coll.properties[ugid])
+    
+    @staticmethod
+    def _write_variable_value_(field,variable_alias,paths,mode='r+'):
+        '''
+        :param field: The field containing the variable to write.
+        :type field: :class:`ocgis.interface.base.field.Field`
+        :param str variable_alias: The alias of the variable to write.
+        :param paths: Paths to the value and mask `.npy` files.
+        :type paths: sequence of str
+        :param str mode: Mode used to reopen the written files.
+        :returns: A masked array with data and mask backed by the memory-mapped files.
+        :rtype: :class:`numpy.ma.MaskedArray`
+        '''
+        shape = field.shape
+        ## copy slabs of time steps sliced from the field. values not loaded from
+        ## source are read one slab at a time.
+        step = max(1,constants.npy_write_size/max(1,np.prod([shape[idx] for idx in [0,2,3,4]])))
+        for idx in range(0,shape[1],step):
+            slc = slice(idx,idx+step)
+            value = field[:,slc,:,:,:].variables[variable_alias].value
+            if idx == 0:
+                value_mmap = np.lib.format.open_memmap(paths[0],mode='w+',dtype=value.dtype,shape=shape)
+                mask_mmap = np.lib.format.open_memmap(paths[1],mode='w+',dtype=bool,shape=shape)
+                fill_value = value.fill_value
+            value_mmap[:,slc] = value.data
+            mask_mmap[:,slc] = np.ma.getmaskarray(value)
+        del value_mmap,mask_mmap
+        
+        ret = np.ma.array(np.load(paths[0],mmap_mode=mode),mask=np.load(paths[1],mmap_mode=mode),
+                          fill_value=fill_value)
+        return(ret)
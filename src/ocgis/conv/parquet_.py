@@ -0,0 +1,112 @@
+from ocgis.conv.base import OcgConverter
+import itertools
+import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+#: Column types of the output headers. Identifiers and date parts are integers.
+#: Level values may be integers or floats and are written as floats. Values
+#: are written as floats. Time values are floats if they are not formatted (see
+#: :func:`get_column_types`).
+header_types = {'did':'int','vid':'int','cid':'int','ugid':'int','tid':'int','lid':'int','gid':'int',
+                'variable':'str','alias':'str','calc_key':'str','calc_alias':'str','time':'datetime',
+                'year':'int','month':'int','day':'int','level':'float','value':'float'}
+
+
+def get_column_types(headers,format_time=True):
+    '''
+    >>> get_column_types(['UGID','TIME','FOO'])
+    ['int', 'datetime', None]
+    >>> get_column_types(['UGID','TIME','FOO'],format_time=False)
+    ['int', 'float', None]
+    
+    :param headers: Column header names.
+    :type headers: sequence of str
+    :param bool format_time: If `False`, time values are the unformatted numeric
+     time values.
+    :returns: The column type for each header from :attr:`header_types`. The type
+     is `None` for headers without a declared type.
+    :rtype: list
+    '''
+    ret = [header_types.get(header.lower()) for header in headers]
+    if not format_time:
+        ret = ['float' if t == 'datetime' else t for t in ret]
+    return(ret)
+
+
+def get_arrow_values(values):
+    '''
+    :param values: Column values.
+    :type values: one-dimensional object :class:`numpy.ndarray`
+    :returns: The column values with NumPy scalars converted to their Python
+     equivalents.
+    :rtype: list
+    '''
+    return([v.item() if isinstance(v,np.generic) else v for v in values])
+
+
+class ParquetConverter(OcgConverter):
+    '''
+    Writes the CSV headers as typed columns of a Parquet file with a row group for
+    each block of rows. Geometries are written to a `GEOMETRY` column as
+    well-known binary. Column types are declared for the standard headers (see
+    :func:`get_column_types`). Types of other columns are taken from the first
+    block of rows. Requires :mod:`pyarrow`.
+    '''
+    _ext = 'parquet'
+    #: If `True`, dictionary encode repeated column values (i.e. variable names).
+    _use_dictionary = True
+
+    def _build_(self,coll):
+        ret = {'parquet_writer':None,'schema':None}
+        return(ret)
+
+    def _finalize_(self,f):
+        if f['parquet_writer'] is not None:
+            f['parquet_writer'].close()
+
+    def _get_arrays_(self,columns,headers,schema):
+        if schema is None:
+            arrow_types = {'int':pa.int64(),'float':pa.float64(),'str':pa.string(),
+                           'datetime':pa.timestamp('us')}
+            arrays = []
+            for column,column_type in itertools.izip(columns,get_column_types(headers,format_time=self.ops.format_time)):
+                if column_type is None:
+                    array = pa.array(column)
+                    ## byte strings are inferred as binary
+                    if array.type == pa.binary():
+                        array = pa.array(column,type=pa.string())
+                else:
+                    array = pa.array(column,type=arrow_types[column_type])
+                arrays.append(array)
+        else:
+            arrays = [pa.array(column,type=field.type) for column,field in itertools.izip(columns,schema)]
+        return(arrays)
+
+    def _write_coll_(self,f,coll):
+        ## geometries are repeated for each time and level. convert each geometry
+        ## once for the collection.
+        wkb = {}
+        for geoms,batch in coll.get_iter_batches(use_upper_keys=True):
+            keys = itertools.izip(batch['DID'],batch['UGID'],batch['GID'])
+            geometry = []
+            for key,geom in itertools.izip(keys,geoms):
+                try:
+                    geometry.append(wkb[key])
+                except KeyError:
+                    geometry.append(wkb.setdefault(key,geom.wkb))
+            columns = [get_arrow_values(v) for v in batch.itervalues()]
+            arrays = self._get_arrays_(columns,batch.keys(),f['schema'])
+            arrays.append(pa.array(geometry,type=pa.binary()))
+            table = pa.Table.from_arrays(arrays,names=batch.keys()+['GEOMETRY'])
+
+            ## the schema is set by the first block of rows
+            if f['parquet_writer'] is None:
+                f['schema'] = table.schema
+                f['parquet_writer'] = pq.ParquetWriter(self.path,table.schema,use_dictionary=self._use_dictionary)
+            f['parquet_writer'].write_table(table)
@@ -16,6 +16,7 @@ from osgeo.ogr import CreateGeometryFromWkb
 from shapely import wkb
 from ocgis.util.spatial.index import build_index_grid, build_index,\
     index_intersects
+from ocgis.util.spatial.nearest import NearestCellIndex
 import fiona
 from shapely.geometry.geo import mapping
 
@@ -30,6 +31,8 @@ class SpatialDimension(base.AbstractUidDimension):
         self.crs = kwds.pop('crs',None)
         self.abstraction = kwds.pop('abstraction','polygon')
         self._geom = kwds.pop('geom',None)
+        ## the geometry used to clip the spatial dimension if it has been clipped
+        self._clip_geometry = None
         
         ## if a grid value is passed, then when it is reset
         if self._grid is not None:
@@ -106,18 +109,41 @@ class SpatialDimension(base.AbstractUidDimension):
                 ret = self.geom.point.weights
         return(ret)
     
-    def get_clip(self,polygon,return_indices=False):
+    def get_clip(self,polygon,return_indices=False,intersect_geometries=True):
+        '''
+        :param polygon: The clip geometry.
+        :type polygon: :class:`shapely.geometry.Polygon` or :class:`shapely.geometry.MultiPolygon`
+        :param bool return_indices: If `True`, also return the slice used to subset the grid.
+        :param bool intersect_geometries: If `False`, polygon geometries are not replaced
+         by their intersection with `polygon`. Only the fraction of each geometry's area
+         inside `polygon` is recorded and used to adjust the area weights.
+        '''
         assert(type(polygon) in (Polygon,MultiPolygon))
         
         ret,slc = self.get_intersects(polygon,return_indices=True)
         
         ## clipping with points is okay...
         try:
-            ref_value = ret.geom.polygon.value
+            ref_polygon = ret.geom.polygon
         except ImproperPolygonBoundsError:
             ref_value = ret.geom.point.value
-        for (row_idx,col_idx),geom in iter_array(ref_value,return_value=True):
-            ref_value[row_idx,col_idx] = geom.intersection(polygon)
+            for (row_idx,col_idx),geom in iter_array(ref_value,return_value=True):
+                ref_value[row_idx,col_idx] = geom.intersection(polygon)
+        else:
+            ## only geometries crossing the polygon boundary need to be intersected.
+            ## geometries contained by the polygon are unchanged by the clip.
+            ref_value = ref_polygon.value
+            prepared = prep(polygon)
+            fraction = np.ma.array(np.ones(ref_value.shape,dtype=constants.np_float),mask=ref_value.mask.copy())
+            for (row_idx,col_idx),geom in iter_array(ref_value,return_value=True):
+                if not prepared.contains(geom):
+                    clipped = geom.intersection(polygon)
+                    fraction[row_idx,col_idx] = clipped.area/geom.area
+                    if intersect_geometries:
+                        ref_value[row_idx,col_idx] = clipped
+            if not intersect_geometries:
+                ref_polygon._area_fraction = fraction
+        ret._clip_geometry = polygon
             
 #        ## clipped geometries have no grid or point representations
 #        ret.grid._value = None
@@ -163,6 +189,7 @@ class SpatialDimension(base.AbstractUidDimension):
             else:
                 ## reset the geometries
                 ret._geom = None
+                ret._clip_geometry = None
                 ## subset the grid by its bounding box
                 ret.grid,slc = self.grid.get_subset_bbox(minx,miny,maxx,maxy,return_indices=True)
                 ## update the unique identifier to copy the grid uid
@@ -183,6 +210,74 @@ class SpatialDimension(base.AbstractUidDimension):
         
         return(ret)
     
+    def get_cells(self,rows,cols,return_indices=False):
+        '''
+        Subset to the bounding box of specific grid cells. Cells in the bounding box
+        that are not selected are masked.
+        
+        :param rows: Row indices of the selected cells.
+        :type rows: sequence of int
+        :param cols: Column indices of the selected cells.
+        :type cols: sequence of int
+        :param bool return_indices: If `True`, also return the slice used to subset the grid.
+        '''
+        if self.grid is None:
+            raise(NotImplementedError)
+        rows = np.asarray(rows,dtype=int).flatten()
+        cols = np.asarray(cols,dtype=int).flatten()
+        slc = (slice(rows.min(),rows.max()+1),slice(cols.min(),cols.max()+1))
+        
+        ret = copy(self)
+        ## geometries are reconstructed from the subsetted grid
+        ret._geom = None
+        ret._clip_geometry = None
+        ret.grid = self.grid[slc[0],slc[1]]
+        ret.uid = ret.grid.uid
+        mask = np.ones(ret.grid.shape,dtype=bool)
+        mask[rows-slc[0].start,cols-slc[1].start] = False
+        ## a new mask array is required as the sliced grid shares memory with
+        ## the source grid.
+        r_value = ret.grid.value
+        new_mask = np.logical_or(np.ma.getmaskarray(r_value),mask)
+        ret.grid._value = np.ma.array(r_value.data,mask=new_mask,fill_value=r_value.fill_value)
+        
+        if return_indices:
+            ret = (ret,slc)
+        return(ret)
+    
+    def get_nearest(self,point,k=1,return_indices=False,index=None,max_distance=None):
+        '''
+        Subset to the grid cells with centers nearest to the point(s). See
+        :class:`~ocgis.util.spatial.nearest.NearestCellIndex`.
+        
+        :param point: The selection point(s).
+        :type point: :class:`shapely.geometry.Point` or :class:`shapely.geometry.MultiPoint`
+        :param int k: The number of nearest cells to select for each point.
+        :param bool return_indices: If `True`, also return the slice used to subset the grid.
+        :param index: An existing index for the grid. Provide this to avoid rebuilding
+         the index for repeated queries.
+        :type index: :class:`~ocgis.util.spatial.nearest.NearestCellIndex`
+        :param float max_distance: If provided, cells with centers farther than this
+         distance from the point(s) are not selected.
+        :raises: EmptySubsetError
+        '''
+        if type(point) == Point:
+            points = [point]
+        elif type(point) == MultiPoint:
+            points = list(point)
+        else:
+            ocgis_lh(exc=ValueError('Only Points and MultiPoints may be used for nearest cell selection.'),logger='dimension.spatial')
+        if index is None:
+            index = NearestCellIndex(self.grid)
+        rows,cols,distance = index.query([pt.x for pt in points],[pt.y for pt in points],k=k,
+                                         return_distance=True)
+        if max_distance is not None:
+            select = distance <= max_distance
+            if not select.any():
+                ocgis_lh(exc=EmptySubsetError(origin='spatial'),logger='dimension.spatial')
+            rows,cols = rows[select],cols[select]
+        return(self.get_cells(rows,cols,return_indices=return_indices))
+    
     def get_geom_iter(self,target=None,as_multipolygon=True):
         target = target or self.abstraction
         if target is None:
@@ -670,6 +765,10 @@ class SpatialGeometryPointDimension(base.AbstractUidValueDimension):
 class SpatialGeometryPolygonDimension(SpatialGeometryPointDimension):
     _geom_type = 'MultiPolygon'
     _axis = 'POLYGON'
+    _attrs_slice = ('uid','_value','grid','_area_fraction')
+    ## fraction of each geometry's area to use for the area. this is set when a
+    ## clip operation does not replace the geometries with their intersections.
+    _area_fraction = None
     
     def __init__(self,*args,**kwds):
         super(SpatialGeometryPolygonDimension,self).__init__(*args,**kwds)
@@ -688,11 +787,14 @@ class SpatialGeometryPolygonDimension(SpatialGeometryPointDimension):
         fill = np.ma.array(fill,mask=r_value.mask)
         for (ii,jj),geom in iter_array(r_value,return_value=True):
             fill[ii,jj] = geom.area
+        if self._area_fraction is not None:
+            fill = fill*self._area_fraction
         return(fill)
     
     @property
     def weights(self):
-        return(self.area/self.area.max())
+        area = self.area
+        return(area/area.max())
     
     def _get_value_(self):
         ref_row_bounds = self.grid.row.bounds
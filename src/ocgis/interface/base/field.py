@@ -1,8 +1,8 @@
 from ocgis.util.helpers import get_default_or_apply, get_none_or_slice,\
-    get_formatted_slice, get_reduced_slice, assert_raise
+    get_formatted_slice, get_reduced_slice, assert_raise, get_object_array
 import numpy as np
-from copy import copy, deepcopy
-from collections import deque
+from copy import copy
+from collections import deque, OrderedDict
 import itertools
 from shapely.ops import cascaded_union
 from shapely.geometry.multipoint import MultiPoint
@@ -13,6 +13,7 @@ from shapely.geometry.point import Point
 from ocgis.exc import ImproperPolygonBoundsError
 import logging
 from ocgis.util.logging_ocgis import ocgis_lh
+from ocgis.util.spatial.dissolve import get_dissolved_grid
         
 
 class Field(object):
@@ -80,75 +81,143 @@ class Field(object):
         ret = self[slc_field]
         return(ret)
     
-    def get_clip(self,polygon):
-        return(self._get_spatial_operation_('get_clip',polygon))
+    def get_clip(self,polygon,intersect_geometries=True):
+        '''
+        See :meth:`ocgis.interface.base.dimension.spatial.SpatialDimension.get_clip`.
+        '''
+        return(self._get_spatial_operation_('get_clip',polygon,intersect_geometries=intersect_geometries))
     
     def get_intersects(self,polygon):
         return(self._get_spatial_operation_('get_intersects',polygon))
     
+    def get_cells(self,rows,cols):
+        '''
+        See :meth:`ocgis.interface.base.dimension.spatial.SpatialDimension.get_cells`.
+        '''
+        return(self._get_spatial_operation_('get_cells',rows,cols=cols))
+    
+    def get_nearest(self,point,k=1,index=None,max_distance=None):
+        '''
+        See :meth:`ocgis.interface.base.dimension.spatial.SpatialDimension.get_nearest`.
+        '''
+        return(self._get_spatial_operation_('get_nearest',point,k=k,index=index,max_distance=max_distance))
+    
     def get_iter(self,add_masked_value=True,value_keys=None):
+        '''
+        Iterate over the field's values as dictionaries. See :meth:`get_iter_batches`
+        for a description of the arguments.
         
-        def _get_dimension_iterator_1d_(target):
-            attr = getattr(self,target)
-            if attr is None:
-                ret = [(0,{})]
-            else:
-                ret = attr.get_iter()
-            return(ret)
+        :rtype: dict
+        '''
+        for batch in self.get_iter_batches(add_masked_value=add_masked_value,value_keys=value_keys):
+            keys = batch.keys()
+            for row in itertools.izip(*batch.values()):
+                yield(dict(itertools.izip(keys,row)))
+                
+    def get_iter_batches(self,add_masked_value=True,value_keys=None,batch_size=None,formatter=None):
+        '''
+        Iterate over the field's values in blocks of rows. Each block maps the row
+        keys to object arrays of equal length. Rows are ordered by variable,
+        realization, time, level, and geometry.
+        
+        >>> for batch in field.get_iter_batches():
+        ...     rows = zip(*batch.values())
         
-        is_masked = np.ma.is_masked
+        :param bool add_masked_value: If `True`, masked values are replaced by the
+         fill value. Otherwise, masked values are skipped.
+        :param value_keys: Element names of structured value arrays. Masked values
+         are always skipped for structured value arrays.
+        :type value_keys: sequence of str
+        :param int batch_size: The maximum number of data values in each block.
+         Defaults to :attr:`ocgis.constants.iter_batch_size`.
+        :param formatter: If provided, a function converting a one-dimensional
+         array of row values to an object array (i.e. strings). Dimension and
+         constant values are converted once. Geometries are not converted.
+        :type formatter: function
+        :rtype: :class:`collections.OrderedDict`
+        '''
+        batch_size = batch_size or constants.iter_batch_size
         masked_value = constants.fill_value
+        has_value_keys = False if value_keys is None else True
         
+        ## row values for each dimension are computed once and gathered for each
+        ## block using the dimension indices.
+        tables = [self._get_dimension_table_(target) for target in ['realization','temporal','level']]
         ## there is not level, these keys will need to be provided a None value
-        has_level = True if self.level is not None else False
-        r_level_defaults = dict.fromkeys(constants.level_headers)
+        if self.level is None:
+            tables[2] = (1,OrderedDict((k,get_object_array([None])) for k in constants.level_headers))
+        g_row,g_col,g_geom,g_uid = [],[],[],[]
+        for row_idx,col_idx,geom,uid in self.spatial.get_geom_iter():
+            g_row.append(row_idx)
+            g_col.append(col_idx)
+            g_geom.append(geom)
+            g_uid.append(uid)
+        g_row,g_col = np.array(g_row,dtype=int),np.array(g_col,dtype=int)
+        g_geom,g_uid = get_object_array(g_geom),get_object_array(g_uid)
         
-        ## value keys occur when the value array is in fact a structured array with
-        ## field definitions. this occurs with keyed output functions...
-        has_value_keys = False if value_keys is None else True
+        ## convert the dimension values once if there is a formatter
+        if formatter is None:
+            format_value = lambda x: x
+            format_array = get_object_array
+        else:
+            format_value = lambda x: formatter(get_object_array([x]))[0]
+            format_array = formatter
+            for _,table in tables:
+                for k,v in table.iteritems():
+                    table[k] = formatter(v)
+            g_uid = formatter(g_uid)
+        masked_value = format_value(masked_value)
         
+        sizes = [table[0] for table in tables] + [g_row.shape[0]]
+        total = int(np.prod(sizes))
         r_gid_name = self.spatial.name_uid
         for variable in self.variables.itervalues():
             yld = self._get_variable_iter_yield_(variable)
             ref_value = variable.value
-            iters = map(_get_dimension_iterator_1d_,['realization','temporal','level'])
-            iters.append(self.spatial.get_geom_iter())
-            for [(ridx,rlz),(tidx,t),(lidx,l),(sridx,scidx,geom,gid)] in itertools.product(*iters):
-                to_yld = deepcopy(yld)
-                ref_idx = ref_value[ridx,tidx,lidx,sridx,scidx]
+            for start in range(0,total,batch_size):
+                flat = np.arange(start,min(start+batch_size,total))
+                ridx,tidx,lidx,gidx = np.unravel_index(flat,sizes)
+                values = ref_value[ridx,tidx,lidx,g_row[gidx],g_col[gidx]]
                 
-                ## determin if the data is masked
-                if is_masked(ref_idx):
-                    if add_masked_value:
-                        ref_idx = masked_value
-                    else:
-                        continue
-                    
-                ## realization, time, and level values.
-                to_yld.update(rlz)
-                to_yld.update(t)
-                to_yld.update(l)
+                ## determine if the data is masked
+                mask = np.ma.getmaskarray(values)
+                if mask.any() and (has_value_keys or not add_masked_value):
+                    select = np.invert(mask)
+                    ridx,tidx,lidx,gidx = ridx[select],tidx[select],lidx[select],gidx[select]
+                    values,mask = values[select],mask[select]
+                n = ridx.shape[0]
+                if n == 0:
+                    continue
                 
+                to_yld = OrderedDict()
+                for k,v in yld.iteritems():
+                    to_yld[k] = np.empty(n,dtype=object)
+                    to_yld[k].fill(format_value(v))
+                ## realization, time, and level values.
+                for (_,table),idx in zip(tables,[ridx,tidx,lidx]):
+                    for k,v in table.iteritems():
+                        to_yld[k] = v[idx]
                 ## add geometries to the output
-                to_yld['geom'] = geom
-                to_yld[r_gid_name] = gid
-                
-                ## if there is no level, defaults are needs to satisfy converters
-                if not has_level:
-                    to_yld.update(r_level_defaults)
+                to_yld['geom'] = g_geom[gidx]
+                to_yld[r_gid_name] = g_uid[gidx]
                 
+                value = np.ma.getdata(values)
                 ## the target value is a structure array, multiple value elements
                 ## need to be added. these outputs do not a specific value, so
                 ## it is not added. there may also be multiple elements in the
-                ## structure which changes how the loop progresses.
+                ## structure which repeats the row.
                 if has_value_keys:
-                    for ii in range(ref_idx.shape[0]):
-                        for vk in value_keys:
-                            to_yld[vk] = ref_idx[vk][ii]
-                        yield(to_yld)
+                    repeat = np.repeat(np.arange(n),[element.shape[0] for element in value])
+                    for k in to_yld.keys():
+                        to_yld[k] = to_yld[k][repeat]
+                    for vk in value_keys:
+                        to_yld[vk] = format_array(np.concatenate([element[vk] for element in value]))
                 else:
-                    to_yld['value'] = ref_idx
-                    yield(to_yld)
+                    value = format_array(value)
+                    if add_masked_value:
+                        value[mask] = masked_value
+                    to_yld['value'] = value
+                yield(to_yld)
                 
     def get_shallow_copy(self):
         return(copy(self))
@@ -161,10 +230,28 @@ class Field(object):
         ret.variables = variables
         return(ret)
     
-    def _get_spatial_operation_(self,attr,polygon):
+    def _get_dimension_table_(self,target):
+        '''
+        :returns: Tuple of the dimension's length and a mapping of its row keys to
+         object arrays of row values. A missing dimension has a length of one and no
+         row keys.
+        :rtype: tuple of (int, :class:`collections.OrderedDict`)
+        '''
+        dim = getattr(self,target)
+        table = OrderedDict()
+        if dim is None:
+            size = 1
+        else:
+            rows = [yld for _,yld in dim.get_iter()]
+            size = len(rows)
+            for k in rows[0].keys():
+                table[k] = get_object_array([row[k] for row in rows])
+        return(size,table)
+    
+    def _get_spatial_operation_(self,attr,polygon,**kwds):
         ref = getattr(self.spatial,attr)
         ret = copy(self)
-        ret.spatial,slc = ref(polygon,return_indices=True)
+        ret.spatial,slc = ref(polygon,return_indices=True,**kwds)
         slc = [slice(None),slice(None),slice(None)] + list(slc)
         ret.variables = self.variables._get_sliced_variables_(slc)
 
@@ -173,7 +260,16 @@ class Field(object):
         
         return(ret)
     
-    def get_spatially_aggregated(self,new_spatial_uid=None):
+    def get_spatially_aggregated(self,new_spatial_uid=None,selection_geometry=None):
+        '''
+        :param new_spatial_uid: The unique identifier for the aggregated geometry.
+        :type new_spatial_uid: int
+        :param selection_geometry: If provided, this geometry is used as the aggregated
+         polygon geometry and no union is performed. This is appropriate for the
+         geometry used to clip the field.
+        :type selection_geometry: :class:`shapely.geometry.Polygon` or :class:`shapely.geometry.MultiPolygon`
+        :rtype: :class:`ocgis.interface.base.field.Field`
+        '''
 
         def _get_geometry_union_(value):
             to_union = [geom for geom in value.compressed().flat]
@@ -195,77 +291,123 @@ class Field(object):
             return(ret)
         
         ret = copy(self)
-        ## the spatial dimension needs to be deep copied so the grid may be
-        ## dereferenced.
-        ret.spatial = deepcopy(self.spatial)
+        ## the aggregated spatial dimension is a shallow copy of the source with
+        ## the grid dereferenced and the geometry containers replaced.
+        ret.spatial = copy(self.spatial)
         ## this is the new spatial identifier for the spatial dimension.
         new_spatial_uid = new_spatial_uid or 1
+        geom = copy(self.spatial.geom)
         ## aggregate the geometry containers if possible.
-        if ret.spatial.geom.point is not None:
-            unioned = _get_geometry_union_(ret.spatial.geom.point.value)
-            ret.spatial.geom.point._value = unioned
-            ret.spatial.geom.point.uid = new_spatial_uid
+        point = self.spatial.geom.point
+        if point is not None:
+            point = copy(point)
+            point._value = _get_geometry_union_(point.value)
+            point.uid = new_spatial_uid
+            ## the geometry type of the point dimension is now MultiPoint
+            point._geom_type = 'MultiPoint'
+        geom._point = point
             
         try:
-            if ret.spatial.geom.polygon is not None:
-                unioned = _get_geometry_union_(ret.spatial.geom.polygon.value)
-                ret.spatial.geom.polygon._value = _get_geometry_union_(ret.spatial.geom.polygon.value)
-                ret.spatial.geom.polygon.uid = new_spatial_uid
+            polygon = self.spatial.geom.polygon
+            if polygon is not None:
+                if selection_geometry is not None:
+                    unioned = np.ma.array([[None]],mask=False,dtype=object)
+                    unioned[0,0] = selection_geometry
+                else:
+                    unioned = self._get_grid_dissolve_(polygon.value)
+                    if unioned is None:
+                        unioned = _get_geometry_union_(polygon.value)
+                    ## the union of clipped geometries is the intersection of the
+                    ## dataset geometries' union with the clip geometry.
+                    if self.spatial._clip_geometry is not None:
+                        unioned[0,0] = unioned[0,0].intersection(self.spatial._clip_geometry)
+                polygon = copy(polygon)
+                polygon._value = unioned
+                polygon.uid = new_spatial_uid
+            geom._polygon = polygon
         except ImproperPolygonBoundsError:
             msg = 'No polygon representation to aggregate.'
             ocgis_lh(msg=msg,logger='field',level=logging.WARN)
+        geom.uid = new_spatial_uid
+        ret.spatial._geom = geom
         
         ## update the spatial uid
         ret.spatial.uid = new_spatial_uid
         ## there are no grid objects for aggregated spatial dimensions.
         ret.spatial.grid = None
         ret.spatial._geom_to_grid = False
-        ## next the values are aggregated.
+        ## next the values are aggregated. weights are computed once and the
+        ## weighted average is reduced over the spatial axes for all (realization,
+        ## time,level) slices at once. masked values do not contribute weight.
         shp = list(ret.shape)
         shp[-2] = 1
         shp[-1] = 1
-        itrs = [range(dim) for dim in shp[0:3]]
-        weights = self.spatial.weights
-        ref_average = np.ma.average
+        weights = np.ma.filled(self.spatial.weights,0).astype(np.float64)
         
         ## old values for the variables will be stored in the _raw container, but
         ## to avoid reference issues, we need to copy the variables
         new_variables = []
         for variable in ret.variables.itervalues():
             r_value = variable.value
-            fill = np.ma.array(np.zeros(shp),mask=False,dtype=variable.value.dtype)
-            for idx_r,idx_t,idx_l in itertools.product(*itrs):
-                fill[idx_r,idx_t,idx_l] = ref_average(r_value[idx_r,idx_t,idx_l],weights=weights)
+            valid = np.invert(np.ma.getmaskarray(r_value))
+            numerator = np.tensordot(np.ma.filled(r_value,0).astype(np.float64),weights,axes=([3,4],[0,1]))
+            denominator = np.tensordot(valid.astype(np.float64),weights,axes=([3,4],[0,1]))
+            empty = denominator == 0
+            with np.errstate(divide='ignore',invalid='ignore'):
+                averaged = numerator/denominator
+            averaged[empty] = 0
+            fill = np.ma.array(averaged.astype(r_value.dtype).reshape(shp),mask=empty.reshape(shp))
             new_variable = copy(variable)
             new_variable._value = fill
             new_variables.append(new_variable)
         ret.variables = VariableCollection(variables=new_variables)
         
-        ## the geometry type of the point dimension is now MultiPoint
-        ret.spatial.geom.point._geom_type = 'MultiPoint'
-        
         ## we want to keep a copy of the raw data around for later calculations.
         ret._raw = copy(self)
                 
         return(ret)
 
+    def _get_grid_dissolve_(self,value):
+        '''
+        :param value: The polygon geometry array.
+        :type value: :class:`numpy.ma.MaskedArray`
+        :returns: A geometry array containing the dissolved grid cells or `None` if
+         the grid may not be dissolved by index (e.g. no rectilinear bounds). Clipped
+         geometries are not considered.
+        '''
+        ret = None
+        grid = self.spatial.grid
+        if grid is not None and grid.row is not None and grid.col is not None:
+            if grid.row.bounds is not None and grid.col.bounds is not None:
+                select = np.invert(np.ma.getmaskarray(value))
+                dissolved = get_dissolved_grid(grid.row.bounds,grid.col.bounds,select)
+                if dissolved is not None:
+                    ret = np.ma.array([[None]],mask=False,dtype=object)
+                    ret[0,0] = dissolved
+        return(ret)
+
     def _get_value_from_source_(self,*args,**kwds):
         raise(NotImplementedError)
         ## TODO: remember to apply the geometry mask to fresh values!!
 
     def _set_new_value_mask_(self,field,mask):
-        ret_shp = field.shape
-        rng_realization = range(ret_shp[0])
-        rng_temporal = range(ret_shp[1])
-        rng_level = range(ret_shp[2])
-        ref_logical_or = np.logical_or
-        
+        ## the spatial mask is broadcast across the realization, time, and level
+        ## dimensions. numpy.ma requires a mask with the full value shape, so an
+        ## array is only allocated when the value does not already have one.
+        mask = np.asarray(mask,dtype=bool)
+        if not mask.any():
+            return
         for var in field.variables.itervalues():
             if var._value is not None:
                 v = var._value
-                for idx_r,idx_t,idx_l in itertools.product(rng_realization,rng_temporal,rng_level):
-                    ref = v[idx_r,idx_t,idx_l]
-                    ref.mask = ref_logical_or(ref.mask,mask)
+                if v.mask is np.ma.nomask:
+                    new_mask = np.empty(v.shape,dtype=bool)
+                    new_mask[:] = mask
+                    v.mask = new_mask
+                else:
+                    ## update in place as the mask may be shared with a parent
+                    ## field's value.
+                    np.logical_or(v.mask,mask,out=v.mask)
                     
     def _get_variable_iter_yield_(self,variable):
         yld = {}
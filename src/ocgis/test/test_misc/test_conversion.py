@@ -7,6 +7,16 @@ from ocgis.api.operations import OcgOperations
 from collections import OrderedDict
 import fiona
 from ocgis.test.test_simple.test_simple import ToTest
+from ocgis.conv.csv_ import get_csv_strings, OcgDialect
+from ocgis.conv.fiona_ import FionaConverter
+from ocgis.conv.nc import get_chunksizes
+from ocgis.conv.parquet_ import get_column_types, get_arrow_values
+from ocgis.conv.numpy_ import NpyConverter
+from ocgis import constants
+from StringIO import StringIO
+import numpy as np
+import datetime
+import csv
 
 
 class Test(TestBase):
@@ -35,6 +45,64 @@ class Test(TestBase):
 #        subprocess.call(['nautilus',os.path.split(ret)[0]])
 #        import ipdb;ipdb.set_trace()
 
+    def test_get_csv_strings(self):
+        ## formatted columns match the csv module
+        columns = [np.array([0.1,1.0,1e16,np.nan,-np.inf,1e20]),
+                   np.array([0.1,1.0,1e20],dtype=np.float32),
+                   np.array([1,-2,3],dtype=np.int32),
+                   np.array([None,'a,b','c"d',1.5,np.float32(0.1),datetime.datetime(2000,1,1,12)],dtype=object)]
+        for column in columns:
+            f = StringIO()
+            csv.writer(f,dialect=OcgDialect).writerow(list(column))
+            self.assertEqual(','.join(get_csv_strings(column)),f.getvalue().strip())
+
+    def test_fiona_converted_column(self):
+        ## converted columns match the per-element conversion
+        column = np.array([np.float32(1.5),np.float64(2.0),np.int32(3)],dtype=object)
+        for conversion in [int,float,str]:
+            converted = FionaConverter._get_converted_column_(column,conversion)
+            self.assertEqual(converted,[conversion(element) for element in column])
+            self.assertEqual(map(type,converted),[type(conversion(element)) for element in column])
+        self.assertIs(FionaConverter._get_converted_column_(column,None),column)
+
+    def test_fiona_converted_column_masked_integer(self):
+        ## masked integer values are replaced by the fill value which overflows the
+        ## native integer type
+        column = np.array([np.int32(1),constants.fill_value,np.int32(3)],dtype=object)
+        converted = FionaConverter._get_converted_column_(column,int)
+        self.assertEqual(converted,[int(element) for element in column])
+        self.assertEqual(converted,[1,int(constants.fill_value),3])
+        column = np.array([constants.fill_value],dtype=object)
+        self.assertEqual(FionaConverter._get_converted_column_(column,int),[int(constants.fill_value)])
+
+    def test_parquet_column_types(self):
+        ## standard headers have declared types so all-empty columns are typed
+        for headers in [constants.raw_headers,constants.calc_headers,constants.multi_headers]:
+            types = get_column_types([h.upper() for h in headers])
+            self.assertNotIn(None,types)
+        self.assertEqual(get_column_types(['UGID','TIME','LEVEL','VALUE','VARIABLE','FOO']),
+                         ['int','datetime','float','float','str',None])
+        ## unformatted time values are numeric
+        self.assertEqual(get_column_types(['UGID','TIME','YEAR'],format_time=False),['int','float','int'])
+        ## numpy scalars are converted to python types
+        column = np.array([np.int32(1),np.float32(1.5),None,'a'],dtype=object)
+        values = get_arrow_values(column)
+        self.assertEqual(values,[1,1.5,None,'a'])
+        self.assertEqual(map(type,values[0:2]),[int,float])
+        
+    def test_npy_return_no_collection(self):
+        ## nothing is returned if no collections were written
+        conv = NpyConverter([],self._test_dir,'npy')
+        self.assertIsNone(conv._get_return_())
+        
+    def test_get_chunksizes(self):
+        self.assertEqual(get_chunksizes((365,180,360),'map'),(1,180,360))
+        self.assertEqual(get_chunksizes((365,180,360),'timeseries'),(365,26,26))
+        self.assertEqual(get_chunksizes((3,40,180,360),'map'),(1,1,180,360))
+        ## large spatial domains are split
+        chunksizes = get_chunksizes((10,2000,3000),'map')
+        self.assertLessEqual(np.prod(chunksizes),constants.nc_chunk_size)
+
     def test_csv_plus_custom_headers(self):
         rd1 = self.test_data.get_rd('cancm4_tasmax_2011')
         rd2 = self.test_data.get_rd('maurer_bccr_1950')
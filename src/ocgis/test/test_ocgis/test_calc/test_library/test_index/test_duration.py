@@ -65,6 +65,24 @@ class TestDuration(AbstractCalcBase):
             if reraise:
                 raise(cap['exception'])
             
+
+    def test_duration_against_reference(self):
+        ## compare the vectorized spell detection against a per-cell reference
+        duration = Duration()
+        np.random.seed(1)
+        values = np.ma.array(np.random.rand(60,4,5),mask=False)
+        values.mask[np.random.rand(*values.shape) > 0.9] = True
+        ## the output mask is taken from the first time step
+        values.mask[0,:,:] = False
+        for summary in ['mean','median','std','max','min']:
+            ret = duration.calculate(values,0.4,operation='gt',summary=summary)
+            arr = np.ma.filled(values > 0.4,False)
+            for ii in range(values.shape[1]):
+                for jj in range(values.shape[2]):
+                    spells = ''.join(['1' if a else '0' for a in arr[:,ii,jj]]).split('0')
+                    spells = [len(spell) for spell in spells if len(spell) > 0]
+                    actual = getattr(np,summary)(spells) if len(spells) > 0 else 0
+                    self.assertAlmostEqual(ret[ii,jj],actual,places=5)
             
 class TestFrequencyDuration(AbstractCalcBase):
     
@@ -81,6 +99,20 @@ class TestFrequencyDuration(AbstractCalcBase):
         self.assertNumpyAll(np.array([2,3,5],dtype=np.int32),ret.flatten()[0]['duration'])
         self.assertNumpyAll(np.array([2,1,1],dtype=np.int32),ret.flatten()[0]['count'])
         
+        ## single occurrences are each counted
+        values = np.array([3,1,3,1,3],dtype=float)
+        values = self.get_reshaped(values)
+        ret = fduration.calculate(values,threshold=2,operation='gt')
+        self.assertNumpyAll(np.array([1],dtype=np.int32),ret.flatten()[0]['duration'])
+        self.assertNumpyAll(np.array([3],dtype=np.int32),ret.flatten()[0]['count'])
+        
+        ## no occurrence
+        values = np.array([1,1,1],dtype=float)
+        values = self.get_reshaped(values)
+        ret = fduration.calculate(values,threshold=2,operation='gt')
+        self.assertNumpyAll(np.array([0],dtype=np.int32),ret.flatten()[0]['duration'])
+        self.assertNumpyAll(np.array([1],dtype=np.int32),ret.flatten()[0]['count'])
+        
         calc = [{'func':'freq_duration','name':'freq_duration','kwds':{'operation':'gt','threshold':280}}]
         ret = self.run_standard_operations(calc,capture=True,output_format=None)
         for dct in ret:
@@ -3,11 +3,59 @@ from ocgis.api.request.base import RequestDataset
 import netCDF4 as nc
 from ocgis.test.base import TestBase
 import itertools
+import os
+from ocgis import env
 import datetime
 import numpy as np
 from ocgis.calc.library.index.dynamic_kernel_percentile import DynamicDailyKernelPercentileThreshold
 from ocgis.test.test_simple.test_simple import nc_scope
 from ocgis.test.test_base import longrunning
+from ocgis.test.test_ocgis.test_interface.test_base.test_field import AbstractTestField
+
+
+class TestDynamicDailyKernelPercentileThresholdField(AbstractTestField):
+    
+    def test_calculate_default_cache(self):
+        ## no cache directory is set by default
+        env.reset()
+        self.assertIsNone(env.DIR_CACHE)
+        field = self.get_field(with_value=True,month_count=2,with_realization=False,with_level=False)
+        ## the base temporal dimension values are already datetime objects
+        field.temporal.value_datetime = field.temporal.value
+        temporal_group = field.temporal.get_grouping(['month'])
+        kwds = dict(percentile=10,width=5,operation='lt')
+        dkp = DynamicDailyKernelPercentileThreshold(tgd=temporal_group,parms=kwds,field=field,alias='tg10p')
+        ret = dkp.execute()['tg10p_tmax'].value
+        self.assertEqual(ret.shape,(1,2,1,3,4))
+        ## the daily percentile is computed for the variable and not cached
+        daily_percentile = dkp.get_daily_percentile(field.variables['tmax'].value,field.temporal.value_datetime,10,5)
+        kwds['daily_percentile'] = daily_percentile
+        dkp = DynamicDailyKernelPercentileThreshold(tgd=temporal_group,parms=kwds,field=field,alias='tg10p')
+        self.assertNumpyAll(dkp.execute()['tg10p_tmax'].value,ret)
+    
+    def test_calculate_cache_mask(self):
+        field = self.get_field(with_value=True,month_count=2,with_realization=False,with_level=False)
+        field.temporal.value_datetime = field.temporal.value
+        temporal_group = field.temporal.get_grouping(['month'])
+        kwds = dict(percentile=10,width=5,operation='lt')
+        try:
+            env.DIR_CACHE = self._test_dir
+            dkp = DynamicDailyKernelPercentileThreshold(tgd=temporal_group,parms=kwds,field=field,alias='tg10p')
+            ref = dkp.execute()['tg10p_tmax'].value
+            ## same extent and shape but a different spatial mask
+            masked = field[:,:,:,:,:]
+            masked.variables['tmax'].value.mask[:,:,:,0,:] = True
+            dkp = DynamicDailyKernelPercentileThreshold(tgd=temporal_group,parms=kwds,field=masked,alias='tg10p')
+            ret = dkp.execute()['tg10p_tmax'].value
+            cached = [f for f in os.listdir(self._test_dir) if f.endswith('.npz')]
+            self.assertEqual(len(cached),2)
+            self.assertTrue(ret.mask[:,:,:,0,:].all())
+            self.assertNumpyAll(ret[:,:,:,1:,:],ref[:,:,:,1:,:])
+            ## the unmodified field loads its own baseline
+            dkp = DynamicDailyKernelPercentileThreshold(tgd=temporal_group,parms=kwds,field=field,alias='tg10p')
+            self.assertNumpyAll(dkp.execute()['tg10p_tmax'].value,ref)
+        finally:
+            env.reset()
 
 
 class TestDynamicDailyKernelPercentileThreshold(TestBase):
@@ -80,7 +128,62 @@ class TestDynamicDailyKernelPercentileThreshold(TestBase):
         
         ret = dkp.execute()
         self.assertEqual(ret['tg10p_tas'].value.shape,(1,36,1,64,128))
-        self.assertAlmostEqual(ret['tg10p_tas'].value.mean(),10.394866943359375)
+        
+        ## compare against a reference using the percentile matched to each date
+        dates = field.temporal.value_datetime
+        for it in [0,5,35]:
+            dgroup = temporal_group.dgroups[it]
+            b = np.array([dperc[np.logical_and(dperc['month'] == dt.month,dperc['day'] == dt.day)]['percentile'][0].reshape(64,128)
+                          for dt in dates[dgroup]])
+            actual = np.ma.sum(value[0,dgroup,0,:,:] < b,axis=0)
+            self.assertNumpyAll(ret['tg10p_tas'].value[0,it,0,:,:],actual)
+    
+    def test_get_daily_percentile_batched(self):
+        ## the batch size should not change the percentiles
+        dates = np.array([datetime.datetime(2000,1,1,12) + datetime.timedelta(days=ii) for ii in range(3*366)])
+        value = np.ma.array(np.random.rand(1,dates.shape[0],1,3,4),mask=False)
+        dkp = DynamicDailyKernelPercentileThreshold
+        ref = dkp.get_daily_percentile(value,dates,10,5)
+        self.assertEqual(ref.shape[0],366)
+        try:
+            dkp._max_batch_bytes = 1
+            ret = dkp.get_daily_percentile(value,dates,10,5)
+        finally:
+            dkp._max_batch_bytes = 2e8
+        for r,a in zip(ret['percentile'],ref['percentile']):
+            self.assertNumpyAll(r,a)
+        ## window members of the first calendar day wrap to the end of the year
+        select = np.array([(dt.month,dt.day) in [(12,30),(12,31),(1,1),(1,2),(1,3)] for dt in dates])
+        self.assertNumpyAllClose(ref['percentile'][0],np.percentile(value[:,select],10,axis=1))
+    
+    def test_save_load_daily_percentile(self):
+        dates = np.array([datetime.datetime(2000,1,1,12) + datetime.timedelta(days=ii) for ii in range(40)])
+        value = np.ma.array(np.random.rand(1,dates.shape[0],1,3,4),mask=False)
+        dperc = DynamicDailyKernelPercentileThreshold.get_daily_percentile(value,dates,10,5)
+        path = os.path.join(self._test_dir,'dperc.npz')
+        DynamicDailyKernelPercentileThreshold.save_daily_percentile(path,dperc)
+        ret = DynamicDailyKernelPercentileThreshold.load_daily_percentile(path)
+        for field in ['month','day','index']:
+            self.assertNumpyAll(ret[field],dperc[field])
+        for r,a in zip(ret['percentile'],dperc['percentile']):
+            self.assertNumpyAll(r,a)
+    
+    def test_calculate_cache(self):
+        rd = self.test_data.get_rd('cancm4_tas')
+        field = rd.get()
+        field = field.get_between('temporal',datetime.datetime(2001,1,1),datetime.datetime(2001,12,31,23,59))
+        temporal_group = field.temporal.get_grouping(['month'])
+        kwds = dict(percentile=10,width=5,operation='lt')
+        try:
+            env.DIR_CACHE = self._test_dir
+            dkp = DynamicDailyKernelPercentileThreshold(tgd=temporal_group,parms=kwds,field=field,alias='tg10p')
+            ref = dkp.execute()['tg10p_tas'].value
+            cached = [f for f in os.listdir(self._test_dir) if f.endswith('.npz')]
+            self.assertEqual(len(cached),1)
+            dkp = DynamicDailyKernelPercentileThreshold(tgd=temporal_group,parms=kwds,field=field,alias='tg10p')
+            self.assertNumpyAll(dkp.execute()['tg10p_tas'].value,ref)
+        finally:
+            env.reset()
     
     @longrunning
     def test_operations(self):
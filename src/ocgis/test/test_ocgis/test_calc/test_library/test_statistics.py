@@ -18,6 +18,17 @@ class Test(AbstractTestField):
          np.ma.array(data=[0.92864656,0.98615474,0.95269281,0.98542988],
                      mask=False,fill_value=1e+20))
 
+    def test_FrequencyPercentile_sketch_size(self):
+        field = self.get_field(with_value=True,month_count=2)
+        grouping = ['month']
+        tgd = field.temporal.get_grouping(grouping)
+        ## in-memory percentiles are exact and the sketch size is only used when
+        ## streaming
+        ret = FrequencyPercentile(field=field,tgd=tgd,parms={'percentile':90,'sketch_size':8}).execute()['freq_perc_tmax']
+        ref = FrequencyPercentile(field=field,tgd=tgd,parms={'percentile':90}).execute()['freq_perc_tmax']
+        self.assertNumpyAll(ret.value,ref.value)
+        self.assertNotIn('quantile_rank_error',ret.meta['attrs'])
+
     def test_Mean(self):
         field = self.get_field(with_value=True,month_count=2)
         grouping = ['month']
@@ -0,0 +1,154 @@
+import unittest
+import numpy as np
+from ocgis.test.test_ocgis.test_interface.test_base.test_field import AbstractTestField
+from ocgis.calc.online import OnlineMean, OnlineStandardDeviation, OnlineMax,\
+    OnlineMin, OnlineThreshold, OnlineQuantileSketch, iter_online_groups
+from ocgis.calc.percentile import get_percentile
+from ocgis.calc.library.statistics import Mean, StandardDeviation, Max, Median,\
+    FrequencyPercentile
+from ocgis.calc.library.thresholds import Threshold
+from ocgis.exc import CalculationException
+from ocgis.calc.engine import OcgCalculationEngine
+from collections import OrderedDict
+
+
+class TestOnlineAccumulators(AbstractTestField):
+
+    def get_values(self):
+        values = np.ma.array(np.random.rand(2,50,2,3,4),mask=False)
+        values.mask[np.random.rand(*values.shape) > 0.8] = True
+        ## a completely masked time series
+        values.mask[0,:,0,0,0] = True
+        return(values)
+
+    def test_accumulators(self):
+        values = self.get_values()
+        for klass,f in [(OnlineMean,np.ma.mean),(OnlineStandardDeviation,np.ma.std),
+                        (OnlineMax,np.ma.max),(OnlineMin,np.ma.min)]:
+            acc = klass()
+            for start in range(0,values.shape[1],7):
+                acc.update(values[:,start:start+7,:,:,:])
+            ret = acc.get_value()
+            actual = f(values,axis=1).reshape(ret.shape)
+            self.assertNumpyAll(ret.mask,np.ma.getmaskarray(actual))
+            self.assertNumpyAllClose(ret.compressed(),actual.compressed())
+
+    def test_accumulators_integer(self):
+        values = np.ma.array(np.random.random_integers(0,10,size=(2,50,2,3,4)),mask=False)
+        for klass,f in [(OnlineMean,np.ma.mean),(OnlineStandardDeviation,np.ma.std)]:
+            acc = klass()
+            for start in range(0,values.shape[1],7):
+                acc.update(values[:,start:start+7,:,:,:])
+            ret = acc.get_value()
+            actual = f(values,axis=1).reshape(ret.shape)
+            self.assertEqual(ret.dtype,actual.dtype)
+            self.assertNumpyAllClose(ret,actual)
+        ## other accumulators keep the input data type
+        acc = OnlineMax()
+        acc.update(values)
+        self.assertEqual(acc.get_value().dtype,values.dtype)
+
+    def test_threshold(self):
+        values = self.get_values()
+        acc = OnlineThreshold(threshold=0.5,operation='gte')
+        for start in range(0,values.shape[1],9):
+            acc.update(values[:,start:start+9,:,:,:])
+        ret = acc.get_value()
+        actual = np.ma.sum(values >= 0.5,axis=1).reshape(ret.shape)
+        self.assertEqual(ret.dtype,np.int32)
+        self.assertNumpyAll(ret.compressed(),actual.compressed())
+        self.assertTrue(ret.mask[0,0,0,0,0])
+
+    def test_quantile_sketch(self):
+        values = self.get_values()
+        acc = OnlineQuantileSketch(percentile=50,sketch_size=200)
+        for start in range(0,values.shape[1],9):
+            acc.update(values[:,start:start+9,:,:,:])
+        ret = acc.get_value()
+        ## the sketch holds all values exactly
+        actual = get_percentile(values,50,axis=1).reshape(ret.shape)
+        self.assertNumpyAll(ret.mask,actual.mask)
+        self.assertNumpyAllClose(ret.compressed(),actual.compressed())
+
+    def test_get_value_empty(self):
+        with self.assertRaises(ValueError):
+            OnlineMean().get_value()
+
+
+class TestIterOnlineGroups(AbstractTestField):
+
+    def test_iter_online_groups(self):
+        field = self.get_field(with_value=True,month_count=2)
+        grouping = ['month']
+        tgd = field.temporal.get_grouping(grouping)
+        calc = [{'func':'mean','name':'my_mean','ref':Mean,'kwds':{}},
+                {'func':'std','name':'my_std','ref':StandardDeviation,'kwds':{}},
+                {'func':'max','name':'my_max','ref':Max,'kwds':{}},
+                {'func':'threshold','name':'my_threshold','ref':Threshold,'kwds':{'threshold':0.5,'operation':'gt'}}]
+        for chunk_size in [1,7,31,100]:
+            ret = list(iter_online_groups(field,calc,grouping,chunk_size=chunk_size,calc_sample_size=True))
+            self.assertEqual([r[0] for r in ret],[0,1])
+            for idx_group,values in ret:
+                self.assertEqual(values.keys(),['my_mean_tmax','n_my_mean_tmax','my_std_tmax','n_my_std_tmax',
+                                                'my_max_tmax','n_my_max_tmax','my_threshold_tmax','n_my_threshold_tmax'])
+                for c in calc:
+                    function = c['ref'](field=field,tgd=tgd,parms=c['kwds'],alias=c['name'])
+                    actual = function.execute()[c['name']+'_tmax'].value[:,idx_group,:,:,:]
+                    self.assertEqual(values[c['name']+'_tmax'].shape,(2,1,2,3,4))
+                    self.assertNumpyAllClose(values[c['name']+'_tmax'].reshape(*actual.shape),actual)
+                self.assertEqual(values['n_my_mean_tmax'].sum(),tgd.dgroups[idx_group].sum()*2*2*3*4)
+
+    def test_iter_online_groups_not_available(self):
+        field = self.get_field(with_value=True)
+        calc = [{'func':'median','name':'my_median','ref':Median,'kwds':{}}]
+        with self.assertRaises(CalculationException):
+            list(iter_online_groups(field,calc,['month']))
+
+
+class TestOcgCalculationEngineOnline(AbstractTestField):
+
+    def get_coll(self,field):
+        return(OrderedDict([(1,OrderedDict([('tmax',field)]))]))
+
+    def test_execute(self):
+        field = self.get_field(with_value=True,month_count=2)
+        grouping = ['month']
+        calc = [{'func':'mean','name':'my_mean','ref':Mean,'kwds':{}},
+                {'func':'threshold','name':'my_threshold','ref':Threshold,'kwds':{'threshold':0.5,'operation':'gt'}}]
+        actual = OcgCalculationEngine(grouping,calc,calc_sample_size=True).execute(self.get_coll(field))
+        engine = OcgCalculationEngine(grouping,calc,calc_sample_size=True,online_chunk_size=10)
+        self.assertTrue(engine.get_is_online())
+        ret = engine.execute(self.get_coll(field))
+        actual_vc = actual[1]['tmax'].variables
+        ret_vc = ret[1]['tmax'].variables
+        self.assertEqual(ret_vc.keys(),actual_vc.keys())
+        self.assertEqual(ret[1]['tmax'].shape,(2,2,2,3,4))
+        for key in actual_vc.keys():
+            self.assertEqual(ret_vc[key].value.dtype,actual_vc[key].value.dtype)
+            self.assertNumpyAllClose(ret_vc[key].value,actual_vc[key].value)
+            self.assertEqual(ret_vc[key].fdef,actual_vc[key].fdef)
+
+    def test_execute_sketch(self):
+        field = self.get_field(with_value=True,month_count=2)
+        calc = [{'func':'freq_perc','name':'p90','ref':FrequencyPercentile,'kwds':{'percentile':90,'sketch_size':8}}]
+        engine = OcgCalculationEngine(['month'],calc,online_chunk_size=10)
+        ret = engine.execute(self.get_coll(field))[1]['tmax'].variables['p90_tmax']
+        actual = OcgCalculationEngine(['month'],calc).execute(self.get_coll(field))[1]['tmax'].variables['p90_tmax']
+        self.assertEqual(ret.value.shape,actual.value.shape)
+        self.assertEqual(ret.meta['attrs']['quantile_sketch_size'],8)
+        self.assertTrue(0 < ret.meta['attrs']['quantile_rank_error'] <= 1)
+        self.assertNotIn('quantile_rank_error',actual.meta['attrs'])
+
+    def test_get_is_online(self):
+        calc = [{'func':'median','name':'my_median','ref':Median,'kwds':{}}]
+        self.assertFalse(OcgCalculationEngine(['month'],calc,online_chunk_size=10).get_is_online())
+        calc = [{'func':'mean','name':'my_mean','ref':Mean,'kwds':{}}]
+        self.assertFalse(OcgCalculationEngine(['month'],calc).get_is_online())
+        self.assertFalse(OcgCalculationEngine(['month'],calc,online_chunk_size=10).get_is_online(file_only=True))
+        self.assertFalse(OcgCalculationEngine(['month'],calc,raw=True,agg=True,online_chunk_size=10).get_is_online())
+        self.assertTrue(OcgCalculationEngine(['month'],calc,online_chunk_size=10).get_is_online())
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+from ocgis.test.base import TestBase
+from ocgis.calc.percentile import get_percentile, get_median
+
+
+class TestPercentile(TestBase):
+
+    def get_values(self):
+        np.random.seed(1)
+        values = np.ma.array(np.random.rand(31,3,4).astype(np.float32),mask=False)
+        return(values)
+
+    def test_get_percentile(self):
+        values = self.get_values()
+        for percentile in [0,10,50,99,100]:
+            ret = get_percentile(values,percentile)
+            self.assertIsInstance(ret,np.ma.MaskedArray)
+            self.assertEqual(ret.shape,(3,4))
+            self.assertNumpyAll(ret.data,np.percentile(values.data,percentile,axis=0))
+
+    def test_get_percentile_multiple(self):
+        values = self.get_values()
+        ret = get_percentile(values,[10,50,90])
+        self.assertEqual(ret.shape,(3,3,4))
+        self.assertNumpyAll(ret.data,np.percentile(values.data,[10,50,90],axis=0))
+
+    def test_get_percentile_axis(self):
+        values = np.random.rand(2,10,5,3)
+        ret = get_percentile(values,30,axis=1)
+        self.assertEqual(ret.shape,(2,5,3))
+        self.assertNumpyAllClose(ret,np.percentile(values,30,axis=1))
+
+    def test_get_percentile_masked(self):
+        values = self.get_values()
+        values.mask[np.random.rand(*values.shape) > 0.6] = True
+        ## a cell with no unmasked values
+        values.mask[:,0,0] = True
+        ret = get_percentile(values,[10,50,90])
+        self.assertTrue(ret.mask[:,0,0].all())
+        self.assertEqual(ret.mask.sum(),3)
+        for ii,jj in [(0,1),(1,2),(2,3)]:
+            self.assertNumpyAllClose(ret[:,ii,jj],np.percentile(values[:,ii,jj].compressed(),[10,50,90]))
+
+    def test_get_percentile_bad_percentile(self):
+        with self.assertRaises(ValueError):
+            get_percentile(self.get_values(),101)
+
+    def test_get_median(self):
+        values = self.get_values()
+        values.mask[0:20,1,1] = True
+        ret = get_median(values)
+        self.assertNumpyAllClose(ret,np.ma.median(values,axis=0))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import pickle
+import numpy as np
+from ocgis.test.base import TestBase
+from ocgis.calc.sketch import QuantileSketch
+from ocgis.calc.percentile import get_percentile
+
+
+class TestQuantileSketch(TestBase):
+
+    def get_values(self,n=5000):
+        np.random.seed(1)
+        values = np.ma.array(np.random.rand(n,3,4),mask=False)
+        values.mask[np.random.rand(*values.shape) > 0.8] = True
+        values.mask[:,0,0] = True
+        return(values)
+
+    def assertWithinBound(self,sketch,values,quantiles):
+        ret = sketch.get_quantile(quantiles)
+        bound = sketch.get_error_bound()*sketch.count[sketch.count > 0].min()
+        for ii,jj in [(0,1),(1,2),(2,3)]:
+            compressed = np.sort(values[:,ii,jj].compressed())
+            for q,value in zip(quantiles,ret[:,ii,jj]):
+                lower = np.searchsorted(compressed,value,side='left')
+                upper = np.searchsorted(compressed,value,side='right') - 1
+                target = q*(compressed.shape[0] - 1)
+                self.assertTrue(max(0,lower-target,target-upper) <= bound)
+        self.assertTrue(ret.mask[:,0,0].all())
+
+    def test_exact(self):
+        values = self.get_values(n=100)
+        sketch = QuantileSketch((3,4),k=200)
+        sketch.update(values)
+        self.assertEqual(sketch.get_error_bound(),0)
+        ret = sketch.get_quantile([0.1,0.5])
+        self.assertNumpyAll(ret,get_percentile(values,[10,50]))
+
+    def test_update_chunks(self):
+        values = self.get_values()
+        sketch = QuantileSketch((3,4),k=64)
+        for start in range(0,values.shape[0],333):
+            sketch.update(values[start:start+333])
+        self.assertEqual(sketch.n,values.shape[0])
+        self.assertNumpyAll(sketch.count,np.invert(values.mask).sum(axis=0).flatten())
+        self.assertTrue(0 < sketch.get_error_bound() < 0.2)
+        ## memory is bounded by the number of levels and the capacity
+        self.assertTrue(sum([level.shape[1] for level in sketch.levels]) < len(sketch.levels)*64)
+        self.assertWithinBound(sketch,values,[0.01,0.5,0.9,0.99])
+
+    def test_error_bound_masked(self):
+        values = self.get_values()
+        ## a cell with few unmasked values has a larger normalized error
+        values.mask[500:,2,3] = True
+        sketch = QuantileSketch((3,4),k=64)
+        sketch.update(values)
+        bound = sketch.get_error_bound()
+        self.assertTrue(bound*values.shape[0] > sketch.rank_error)
+        self.assertTrue(bound*sketch.count.max() > 1)
+        self.assertWithinBound(sketch,values,[0.1,0.5,0.9])
+
+    def test_merge(self):
+        values = self.get_values()
+        first = QuantileSketch((3,4),k=64)
+        first.update(values[:2000])
+        second = QuantileSketch((3,4),k=64)
+        second.update(values[2000:])
+        ## merged sketches may come from other processes
+        second = pickle.loads(pickle.dumps(second))
+        first.merge(second)
+        self.assertEqual(first.n,values.shape[0])
+        self.assertWithinBound(first,values,[0.1,0.5,0.9])
+
+        with self.assertRaises(ValueError):
+            first.merge(QuantileSketch((3,4),k=32))
+
+    def test_update_bad_shape(self):
+        sketch = QuantileSketch((3,4))
+        with self.assertRaises(ValueError):
+            sketch.update(np.random.rand(10,4,3))
+
+    def test_update_axis(self):
+        values = np.random.rand(2,300,1,3,4)
+        sketch = QuantileSketch((2,1,3,4),k=32)
+        sketch.update(values,axis=1)
+        self.assertEqual(sketch.get_quantile(0.5).shape,(2,1,3,4))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
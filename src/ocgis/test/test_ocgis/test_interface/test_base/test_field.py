@@ -1,6 +1,6 @@
 import unittest
 from datetime import datetime as dt
-from ocgis.util.helpers import get_date_list, make_poly
+from ocgis.util.helpers import get_date_list, make_poly, iter_array
 from ocgis.interface.base.dimension.base import VectorDimension
 import datetime
 from ocgis.interface.base.dimension.spatial import SpatialGridDimension,\
@@ -12,9 +12,12 @@ from ocgis.test.base import TestBase
 from ocgis.exc import EmptySubsetError
 from shapely import wkt
 from shapely.ops import cascaded_union
+from shapely.geometry.point import Point
+from shapely.geometry.multipoint import MultiPoint
 from ocgis.interface.base.variable import Variable, VariableCollection
 from ocgis.interface.base.dimension.temporal import TemporalDimension
 from copy import deepcopy
+from ocgis import constants
 
 
 class AbstractTestField(TestBase):
@@ -190,7 +193,27 @@ class TestField(AbstractTestField):
             self.assertEqual(real[k],v)
         self.assertEqual(set(real.keys()),set(rows[100].keys()))
         self.assertEqual(set(field.variables['tmax'].value.flatten().tolist()),set([r['value'] for r in rows]))
-        
+
+    def test_get_iter_batches(self):
+        field = self.get_field(with_value=True)
+        field.variables['tmax'].value.mask[0,3,1,2,1] = True
+        batches = list(field.get_iter_batches(batch_size=100))
+        self.assertEqual(len(batches),15)
+        self.assertTrue(set(['did','variable','alias','vid','value','geom']).issubset(batches[0].keys()))
+        for batch in batches:
+            self.assertEqual(len(set([v.shape[0] for v in batch.values()])),1)
+        ## the masked value is filled
+        rows = list(field.get_iter())
+        self.assertEqual(sum([batch['value'].shape[0] for batch in batches]),len(rows))
+        self.assertEqual(rows[3*24+1*12+2*4+1]['value'],constants.fill_value)
+        ## block rows match the row iterator
+        batches = list(field.get_iter_batches(add_masked_value=False,batch_size=100))
+        rows = list(field.get_iter(add_masked_value=False))
+        self.assertEqual(len(rows),2*31*2*3*4-1)
+        batch_rows = [dict(zip(batch.keys(),row)) for batch in batches for row in zip(*batch.values())]
+        self.assertEqual(batch_rows,rows)
+
+
     def test_get_intersects_domain_polygon(self):
         regular = make_poly((36.61,41.39),(-101.41,-95.47))
         field = self.get_field(with_value=True)
@@ -206,6 +229,27 @@ class TestField(AbstractTestField):
         self.assertNumpyAll(ret.variables['tmax'].value.mask[0,2,1,:,:],np.array([[True,False],[False,False]]))
         self.assertEqual(ret.spatial.uid.data[ret.spatial.get_mask()][0],5)
         
+    def test_set_new_value_mask(self):
+        field = self.get_field(with_value=True)
+        value = field.variables['tmax'].value
+        self.assertFalse(value.mask.any())
+        mask = np.zeros((3,4),dtype=bool)
+        mask[1,2] = True
+        field._set_new_value_mask_(field,mask)
+        self.assertTrue(value.mask[:,:,:,1,2].all())
+        self.assertEqual(value.mask.sum(),2*31*2)
+        
+        ## an empty spatial mask does not allocate a mask array
+        field = self.get_field(with_value=True)
+        value = np.ma.array(field.variables['tmax'].value.data)
+        field.variables['tmax']._value = value
+        self.assertIs(value.mask,np.ma.nomask)
+        field._set_new_value_mask_(field,np.zeros((3,4),dtype=bool))
+        self.assertIs(value.mask,np.ma.nomask)
+        field._set_new_value_mask_(field,mask)
+        self.assertEqual(value.mask.shape,field.shape)
+        self.assertEqual(value.mask.sum(),2*31*2)
+        
     def test_get_clip_single_cell(self):
         single = wkt.loads('POLYGON((-97.997731 39.339322,-97.709012 39.292322,-97.742584 38.996888,-97.668726 38.641026,-98.158876 38.708170,-98.340165 38.916316,-98.273021 39.218463,-97.997731 39.339322))')
         field = self.get_field(with_value=True)
@@ -220,6 +264,55 @@ class TestField(AbstractTestField):
         ref_poly = ret.spatial.geom.polygon.value[0,0]
         self.assertTrue(ref_poly.intersects(ref_pt))
         
+    def test_get_clip_area_fraction(self):
+        irregular = wkt.loads('POLYGON((-100.106049 38.211305,-99.286894 38.251591,-99.286894 38.258306,-99.286894 38.258306,-99.260036 39.252035,-98.769886 39.252035,-98.722885 37.734583,-100.092620 37.714440,-100.106049 38.211305))')
+        field = self.get_field(with_value=True)
+        clipped = field.get_clip(irregular)
+        unclipped = field.get_clip(irregular,intersect_geometries=False)
+        self.assertIsNone(clipped.spatial.geom.polygon._area_fraction)
+        fraction = unclipped.spatial.geom.polygon._area_fraction
+        self.assertTrue(np.all(fraction.compressed() <= 1))
+        ## the geometries are not modified but the areas and weights match the clip
+        intersects = field.get_intersects(irregular)
+        for (ii,jj),geom in iter_array(unclipped.spatial.geom.polygon.value,return_value=True):
+            self.assertTrue(geom.equals(intersects.spatial.geom.polygon.value[ii,jj]))
+        self.assertNumpyAllClose(unclipped.spatial.geom.polygon.area,clipped.spatial.geom.polygon.area)
+        self.assertNumpyAllClose(unclipped.spatial.weights,clipped.spatial.weights)
+        ## aggregated values and geometries are equivalent
+        agg_clipped = clipped.get_spatially_aggregated()
+        agg_unclipped = unclipped.get_spatially_aggregated()
+        self.assertNumpyAllClose(agg_clipped.variables['tmax'].value,agg_unclipped.variables['tmax'].value)
+        self.assertTrue(agg_clipped.spatial.geom.polygon.value[0,0].equals(agg_unclipped.spatial.geom.polygon.value[0,0]))
+        ## the fraction is sliced with the geometries
+        sub = unclipped[:,:,:,1,:]
+        self.assertNumpyAll(sub.spatial.geom.polygon._area_fraction,fraction[1:2,:])
+
+    def test_get_nearest(self):
+        field = self.get_field(with_value=True)
+        ret = field.get_nearest(Point(-98.9,38.8))
+        self.assertEqual(ret.shape,(2,31,2,1,1))
+        self.assertEqual(ret.spatial.geom.point.value[0,0].coords[0],(-99.0,39.0))
+        self.assertNumpyAll(ret.variables['tmax'].value,field.variables['tmax'].value[:,:,:,1:2,1:2])
+        ## cells between the nearest cells are masked
+        ret = field.get_nearest(MultiPoint([Point(-99.9,39.9),Point(-97.1,38.1)]))
+        self.assertEqual(ret.shape,(2,31,2,3,4))
+        self.assertEqual(ret.spatial.get_mask().sum(),10)
+        self.assertFalse(ret.variables['tmax'].value.mask[0,0,0,0,0])
+        self.assertTrue(ret.variables['tmax'].value.mask[0,0,0,1,1])
+        self.assertEqual(ret.spatial.geom.polygon.value.compressed().shape[0],2)
+        ## the source grid is not masked
+        self.assertFalse(field.spatial.grid.value.mask.any())
+        ## k nearest cells
+        ret = field.get_nearest(Point(-98.6,38.6),k=4)
+        self.assertEqual(ret.shape,(2,31,2,2,2))
+        self.assertFalse(ret.spatial.get_mask().any())
+        ## cells farther than the maximum distance are not selected
+        with self.assertRaises(EmptySubsetError):
+            field.get_nearest(Point(-120.0,38.6),max_distance=1.0)
+        ret = field.get_nearest(MultiPoint([Point(-120.0,38.6),Point(-98.9,38.8)]),max_distance=1.0)
+        self.assertEqual(ret.shape,(2,31,2,1,1))
+        self.assertEqual(ret.spatial.geom.point.value[0,0].coords[0],(-99.0,39.0))
+
     def test_get_clip_irregular(self):
         for wv in [True,False]:
             single = wkt.loads('POLYGON((-99.894355 40.230645,-98.725806 40.196774,-97.726613 40.027419,-97.032258 39.942742,-97.681452 39.626613,-97.850806 39.299194,-98.178226 39.643548,-98.844355 39.920161,-99.894355 40.230645))')
@@ -265,6 +358,59 @@ class TestField(AbstractTestField):
             to_test = field.variables['tmax'].value[0,0,0,:,:].mean()
             self.assertNumpyAll(to_test,agg.variables['tmax'].value[0,0,0,0,0])
         
+    def test_get_aggregated_masked(self):
+        irregular = wkt.loads('POLYGON((-100.106049 38.211305,-99.286894 38.251591,-99.286894 38.258306,-99.286894 38.258306,-99.260036 39.252035,-98.769886 39.252035,-98.722885 37.734583,-100.092620 37.714440,-100.106049 38.211305))')
+        field = self.get_field(with_value=True)
+        clipped = field.get_clip(irregular)
+        value = clipped.variables['tmax'].value
+        ## mask a value that is not masked spatially
+        value.mask[0,3,1,0,1] = True
+        agg = clipped.get_spatially_aggregated()
+        weights = clipped.spatial.weights
+        for idx_r,idx_t,idx_l in itertools.product(*[range(ii) for ii in agg.shape[0:3]]):
+            actual = np.ma.average(value[idx_r,idx_t,idx_l],weights=weights)
+            self.assertAlmostEqual(agg.variables['tmax'].value[idx_r,idx_t,idx_l,0,0],actual)
+        self.assertFalse(agg.variables['tmax'].value.mask.any())
+        ## the source spatial dimension is not modified
+        self.assertEqual(clipped.spatial.shape,(2,2))
+        self.assertNotEqual(clipped.spatial.grid,None)
+        self.assertEqual(agg.spatial.geom.polygon.value.shape,(1,1))
+        self.assertEqual(agg.spatial.geom.point.value.shape,(1,1))
+        self.assertEqual(clipped.spatial.geom.polygon.value.shape,(2,2))
+        self.assertEqual(agg.spatial.uid[0,0],1)
+        
+        ## a completely masked slice is masked in the output
+        value.mask[1,4,0,:,:] = True
+        agg = clipped.get_spatially_aggregated()
+        self.assertTrue(agg.variables['tmax'].value.mask[1,4,0,0,0])
+        self.assertEqual(agg.variables['tmax'].value.mask.sum(),1)
+
+    def test_get_aggregated_grid_dissolve(self):
+        field = self.get_field(with_value=True)
+        irregular = wkt.loads('POLYGON((-100.106049 38.211305,-99.286894 38.251591,-99.286894 38.258306,-99.286894 38.258306,-99.260036 39.252035,-98.769886 39.252035,-98.722885 37.734583,-100.092620 37.714440,-100.106049 38.211305))')
+        ## intersected cells are dissolved on the grid
+        sub = field.get_intersects(irregular)
+        self.assertIsNone(sub.spatial._clip_geometry)
+        self.assertIsNotNone(sub._get_grid_dissolve_(sub.spatial.geom.polygon.value))
+        agg = sub.get_spatially_aggregated()
+        actual = cascaded_union([geom for geom in sub.spatial.geom.polygon.value.compressed().flat])
+        self.assertAlmostEqual(agg.spatial.geom.polygon.value[0,0].symmetric_difference(actual).area,0.0)
+        ## the dissolved grid is intersected with the clip geometry
+        clipped = field.get_clip(irregular)
+        self.assertTrue(clipped.spatial._clip_geometry is irregular)
+        agg = clipped.get_spatially_aggregated()
+        actual = cascaded_union([geom for geom in clipped.spatial.geom.polygon.value.compressed().flat])
+        self.assertAlmostEqual(agg.spatial.geom.polygon.value[0,0].symmetric_difference(actual).area,0.0)
+
+    def test_get_aggregated_selection_geometry(self):
+        field = self.get_field(with_value=True)
+        irregular = wkt.loads('POLYGON((-100.106049 38.211305,-99.286894 38.251591,-99.286894 38.258306,-99.286894 38.258306,-99.260036 39.252035,-98.769886 39.252035,-98.722885 37.734583,-100.092620 37.714440,-100.106049 38.211305))')
+        clipped = field.get_clip(irregular)
+        agg = clipped.get_spatially_aggregated(selection_geometry=irregular)
+        self.assertTrue(agg.spatial.geom.polygon.value[0,0] is irregular)
+        actual = clipped.get_spatially_aggregated()
+        self.assertNumpyAll(agg.variables['tmax'].value,actual.variables['tmax'].value)
+
     def test_subsetting(self):
         for wv in [True,False]:
             field = self.get_field(with_value=wv)
@@ -0,0 +1,34 @@
+import unittest
+from shapely.geometry.point import Point
+from ocgis.util.cache import BoundedCache, get_geometry_key
+
+
+class TestBoundedCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = BoundedCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache['a'],1)
+        cache['c'] = 3
+        self.assertEqual(len(cache),2)
+        self.assertNotIn('b',cache)
+        self.assertEqual(cache.get('b'),None)
+        self.assertEqual(cache.get('a'),1)
+        ## replacing a value does not evict
+        cache['c'] = 4
+        self.assertEqual(len(cache),2)
+        self.assertEqual(cache['c'],4)
+        cache.clear()
+        self.assertEqual(len(cache),0)
+        with self.assertRaises(ValueError):
+            BoundedCache(maxsize=0)
+
+    def test_get_geometry_key(self):
+        self.assertEqual(get_geometry_key(Point(1,2)),get_geometry_key(Point(1,2)))
+        self.assertNotEqual(get_geometry_key(Point(1,2)),get_geometry_key(Point(1,3)))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import itertools
+import numpy as np
+from shapely.ops import cascaded_union
+from shapely.geometry.polygon import Polygon
+from shapely.geometry.multipolygon import MultiPolygon
+from ocgis.test.base import TestBase
+from ocgis.util.helpers import make_poly
+from ocgis.util.spatial.dissolve import get_grid_edges, get_dissolved_grid
+
+
+class TestDissolve(TestBase):
+
+    def get_bounds(self,start,n,delta):
+        edges = start + np.arange(n+1)*delta
+        return(np.hstack((edges[:-1].reshape(-1,1),edges[1:].reshape(-1,1))))
+
+    def get_union(self,row_bounds,col_bounds,select):
+        polygons = []
+        for idx_row,idx_col in itertools.product(*[range(ii) for ii in select.shape]):
+            if select[idx_row,idx_col]:
+                polygons.append(make_poly(row_bounds[idx_row],col_bounds[idx_col]))
+        return(cascaded_union(polygons))
+
+    def test_get_grid_edges(self):
+        bounds = self.get_bounds(0.0,3,1.0)
+        self.assertNumpyAll(get_grid_edges(bounds),np.array([0.,1.,2.,3.]))
+        ## descending coordinates with flipped bounds
+        bounds = self.get_bounds(3.0,3,-1.0)
+        self.assertNumpyAll(get_grid_edges(bounds),np.array([3.,2.,1.,0.]))
+        self.assertNumpyAll(get_grid_edges(bounds[:,::-1]),np.array([3.,2.,1.,0.]))
+        ## gaps between the cells
+        bounds = np.array([[0.,1.],[2.,3.]])
+        self.assertIsNone(get_grid_edges(bounds))
+
+    def test_get_dissolved_grid(self):
+        np.random.seed(1)
+        for row_delta,col_delta in [(1.0,0.5),(-1.0,0.5),(0.25,-2.0)]:
+            row_bounds = self.get_bounds(40.0,9,row_delta)
+            col_bounds = self.get_bounds(-100.0,11,col_delta)
+            for _ in range(5):
+                select = np.random.rand(9,11) > 0.4
+                ret = get_dissolved_grid(row_bounds,col_bounds,select)
+                actual = self.get_union(row_bounds,col_bounds,select)
+                self.assertTrue(ret.is_valid)
+                self.assertAlmostEqual(ret.area,actual.area)
+                self.assertAlmostEqual(ret.symmetric_difference(actual).area,0.0)
+
+    def test_get_dissolved_grid_hole(self):
+        row_bounds = self.get_bounds(0.0,3,1.0)
+        col_bounds = self.get_bounds(0.0,3,1.0)
+        select = np.ones((3,3),dtype=bool)
+        select[1,1] = False
+        ret = get_dissolved_grid(row_bounds,col_bounds,select)
+        self.assertIsInstance(ret,Polygon)
+        self.assertEqual(len(ret.interiors),1)
+        self.assertAlmostEqual(ret.area,8.0)
+
+    def test_get_dissolved_grid_disjoint(self):
+        row_bounds = self.get_bounds(0.0,2,1.0)
+        col_bounds = self.get_bounds(0.0,2,1.0)
+        ## cells touching at a single vertex remain separate polygons
+        select = np.array([[True,False],[False,True]])
+        ret = get_dissolved_grid(row_bounds,col_bounds,select)
+        self.assertIsInstance(ret,MultiPolygon)
+        self.assertEqual(len(ret),2)
+        self.assertAlmostEqual(ret.area,2.0)
+
+    def test_get_dissolved_grid_empty(self):
+        row_bounds = self.get_bounds(0.0,2,1.0)
+        col_bounds = self.get_bounds(0.0,2,1.0)
+        self.assertIsNone(get_dissolved_grid(row_bounds,col_bounds,np.zeros((2,2),dtype=bool)))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import os
+import fiona
+from shapely.geometry.geo import box, mapping
+from ocgis.test.base import TestBase
+from ocgis.util.geom_store import GeometryStore
+from ocgis.util.shp_cabinet import ShpCabinet
+
+
+class TestGeometryStore(TestBase):
+
+    def write_shapefile(self,path,n=10):
+        schema = {'geometry':'Polygon','properties':{'UGID':'int','NAME':'str'}}
+        crs = {'proj':'longlat','datum':'WGS84','no_defs':True}
+        with fiona.open(path,'w',driver='ESRI Shapefile',schema=schema,crs=crs) as sink:
+            for ii in range(n):
+                sink.write({'geometry':mapping(box(ii,0,ii+1,1)),
+                            'properties':{'UGID':ii+1,'NAME':'geom{0}'.format(ii+1)}})
+
+    def get_store(self):
+        shp_path = os.path.join(self._test_dir,'boxes.shp')
+        self.write_shapefile(shp_path)
+        store = GeometryStore.build(shp_path,os.path.join(self._test_dir,'boxes.sqlite'))
+        return(shp_path,store)
+
+    def test_iter_geoms(self):
+        shp_path,store = self.get_store()
+        rows = list(store.iter_geoms())
+        self.assertEqual(len(rows),10)
+        self.assertEqual(rows[3][1].keys(),['UGID','NAME'])
+        self.assertEqual(rows[3][1]['NAME'],'geom4')
+        self.assertTrue(rows[3][0].equals(box(3,0,4,1)))
+        self.assertEqual(store.get_extent(),(0.0,0.0,10.0,1.0))
+
+    def test_iter_geoms_select(self):
+        shp_path,store = self.get_store()
+        ugids = [row[1]['UGID'] for row in store.iter_geoms(select_ugid=[9,2,2,4,100])]
+        self.assertEqual(ugids,[2,4,9])
+        ugids = [row[1]['UGID'] for row in store.iter_geoms(bounds=(2.5,0.5,4.5,2.0))]
+        self.assertEqual(ugids,[3,4,5])
+        ugids = [row[1]['UGID'] for row in store.iter_geoms(select_ugid=range(1,5),bounds=(2.5,0.5,4.5,2.0))]
+        self.assertEqual(ugids,[3,4])
+        self.assertEqual(list(store.iter_geoms(bounds=(20,20,30,30))),[])
+
+    def test_get_is_current(self):
+        shp_path,store = self.get_store()
+        self.assertTrue(store.get_is_current(shp_path))
+        self.write_shapefile(shp_path,n=3)
+        os.utime(shp_path,(0,0))
+        self.assertFalse(store.get_is_current(shp_path))
+
+    def test_shp_cabinet(self):
+        os.mkdir(os.path.join(self._test_dir,'boxes'))
+        shp_path = os.path.join(self._test_dir,'boxes','boxes.shp')
+        self.write_shapefile(shp_path)
+        sc = ShpCabinet(path=self._test_dir)
+        self.assertIsNone(sc.get_store('boxes'))
+        store = sc.build_store('boxes')
+        self.assertEqual(store.path,os.path.join(self._test_dir,'boxes','boxes.sqlite'))
+        self.assertIsNotNone(sc.get_store('boxes'))
+        ## the store is used for iteration
+        rows = list(sc.iter_geoms('boxes',select_ugid=[1,7],bounds=(0,0,5,1)))
+        self.assertEqual([row['properties']['UGID'] for row in rows],[1])
+        self.assertEqual(rows[0]['meta']['schema']['properties'].keys(),['UGID','NAME'])
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
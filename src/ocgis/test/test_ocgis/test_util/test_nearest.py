@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+from ocgis.test.test_ocgis.test_interface.test_base.test_field import AbstractTestField
+from ocgis.util.spatial.nearest import NearestCellIndex
+
+
+class TestNearestCellIndex(AbstractTestField):
+
+    def get_reference(self,grid,x,y,k):
+        value = grid.value
+        mask = np.ma.getmaskarray(value)[0]
+        distance = (value.data[1]-x)**2 + (value.data[0]-y)**2
+        distance[mask] = np.inf
+        idx = np.argsort(distance.flatten(),kind='mergesort')[0:k]
+        return(np.unravel_index(idx,distance.shape))
+
+    def test_query(self):
+        grid = self.get_field().spatial.grid
+        index = NearestCellIndex(grid)
+        self.assertIsNotNone(index._rectilinear)
+        x = np.random.uniform(-101,-96,size=50)
+        y = np.random.uniform(37,41,size=50)
+        rows,cols = index.query(x,y)
+        self.assertEqual(rows.shape,(50,1))
+        for ii in range(x.shape[0]):
+            actual = self.get_reference(grid,x[ii],y[ii],1)
+            self.assertEqual((rows[ii,0],cols[ii,0]),(actual[0][0],actual[1][0]))
+        ## the search without the rectilinear grid matches
+        index._rectilinear = None
+        rows_search,cols_search = index.query(x,y)
+        self.assertNumpyAll(rows,rows_search)
+        self.assertNumpyAll(cols,cols_search)
+
+    def test_query_k(self):
+        grid = self.get_field().spatial.grid
+        index = NearestCellIndex(grid)
+        rows,cols = index.query([-98.2],[38.6],k=3)
+        self.assertEqual(rows.shape,(1,3))
+        actual = self.get_reference(grid,-98.2,38.6,3)
+        self.assertNumpyAll(rows[0],actual[0])
+        self.assertNumpyAll(cols[0],actual[1])
+        ## k is limited by the number of cells
+        rows,cols = index.query([-98.2],[38.6],k=100)
+        self.assertEqual(rows.shape,(1,12))
+
+    def test_query_distance(self):
+        grid = self.get_field().spatial.grid
+        index = NearestCellIndex(grid)
+        rows,cols,distance = index.query([-98.2,-110.0],[38.6,38.0],k=2,return_distance=True)
+        self.assertEqual(distance.shape,(2,2))
+        for ii,(x,y) in enumerate([(-98.2,38.6),(-110.0,38.0)]):
+            for jj in range(2):
+                actual = np.hypot(grid.value.data[1,rows[ii,jj],cols[ii,jj]]-x,grid.value.data[0,rows[ii,jj],cols[ii,jj]]-y)
+                self.assertAlmostEqual(distance[ii,jj],actual)
+        self.assertTrue(np.all(np.diff(distance,axis=1) >= 0))
+
+    def test_query_masked(self):
+        grid = self.get_field().spatial.grid
+        grid.value.mask[:,1,1] = True
+        index = NearestCellIndex(grid)
+        self.assertIsNone(index._rectilinear)
+        index.max_brute_force_size = 20
+        rows,cols = index.query([-99.3,-97.0],[39.1,38.0])
+        self.assertEqual(rows.flatten().tolist(),[1,2])
+        self.assertNotEqual((rows[0,0],cols[0,0]),(1,1))
+        for ii,(x,y) in enumerate([(-99.3,39.1),(-97.0,38.0)]):
+            actual = self.get_reference(grid,x,y,1)
+            self.assertEqual((rows[ii,0],cols[ii,0]),(actual[0][0],actual[1][0]))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -2,6 +2,54 @@ import unittest
 from ocgis.test.base import TestBase
 from ocgis.util.shp_cabinet import ShpCabinet
 from unittest.case import SkipTest
+from shapely.geometry.geo import box, mapping
+import fiona
+import os
+
+
+class TestShpCabinetCatalog(TestBase):
+    
+    def write_shapefile(self,path,n=3):
+        schema = {'geometry':'Polygon','properties':{'UGID':'int'}}
+        crs = {'proj':'longlat','datum':'WGS84','no_defs':True}
+        with fiona.open(path,'w',driver='ESRI Shapefile',schema=schema,crs=crs) as sink:
+            for ii in range(n):
+                sink.write({'geometry':mapping(box(ii,0,ii+1,1)),'properties':{'UGID':ii+1}})
+    
+    def test_catalog(self):
+        os.mkdir(os.path.join(self._test_dir,'first'))
+        path = os.path.join(self._test_dir,'first','first.shp')
+        self.write_shapefile(path)
+        sc = ShpCabinet(path=self._test_dir)
+        self.assertEqual(sc.keys(),['first'])
+        self.assertEqual(sc.get_shp_path('first'),path)
+        with self.assertRaises(ValueError):
+            sc.get_shp_path('second')
+        entry = sc.get_entry('first')
+        self.assertEqual(entry['feature_count'],3)
+        self.assertEqual(entry['extent'],(0.0,0.0,3.0,1.0))
+        self.assertEqual(entry['schema']['properties'].keys(),['UGID'])
+        self.assertEqual(sc.get_meta('first')['schema'],entry['schema'])
+        ## the catalog and entries are reused
+        catalog = sc.catalog
+        self.assertTrue(ShpCabinet(path=self._test_dir).catalog is catalog)
+        self.assertTrue(sc.get_entry('first') is entry)
+        
+        ## a new shapefile folder refreshes the catalog
+        os.mkdir(os.path.join(self._test_dir,'second'))
+        ## ensure the directory modification time changes
+        os.utime(self._test_dir,(0,0))
+        self.write_shapefile(os.path.join(self._test_dir,'second','second.shp'),n=2)
+        self.assertEqual(set(sc.keys()),set(['first','second']))
+        self.assertFalse(sc.catalog is catalog)
+        self.assertEqual(sc.get_entry('second')['feature_count'],2)
+        
+        ## a modified shapefile reloads its entry
+        catalog = sc.catalog
+        entry = sc.get_entry('first')
+        self.write_shapefile(path,n=5)
+        os.utime(path,(0,0))
+        self.assertEqual(sc.get_entry('first')['feature_count'],5)
 
 
 class TestShpCabinet(TestBase):
@@ -21,6 +69,18 @@ class TestShpCabinet(TestBase):
         self.assertEqual(len(geoms),1)
         self.assertEqual(geoms[0]['properties']['STATE_NAME'],'New Hampshire')
             
+    def test_iter_geoms_bounds(self):
+        sc = ShpCabinet()
+        ## a bounding box around New Hampshire
+        bounds = (-72.0,43.0,-71.5,43.5)
+        geoms = list(sc.iter_geoms('state_boundaries',bounds=bounds))
+        self.assertTrue(0 < len(geoms) < 51)
+        self.assertIn('New Hampshire',[g['properties']['STATE_NAME'] for g in geoms])
+        for geom in geoms:
+            self.assertTrue(geom['geom'].envelope.intersects(box(*bounds)))
+        geoms = list(sc.iter_geoms('state_boundaries',select_ugid=[1,13],bounds=bounds))
+        self.assertEqual([g['properties']['STATE_NAME'] for g in geoms],['New Hampshire'])
+        
     def test_iter_all(self):
         raise(SkipTest('dev - long'))
         sc = ShpCabinet()
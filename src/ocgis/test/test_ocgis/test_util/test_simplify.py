@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from shapely.geometry import Polygon, Point
+from ocgis.util.spatial.simplify import GeometrySimplifier
+
+
+class TestGeometrySimplifier(unittest.TestCase):
+
+    def get_circle(self,n=1000):
+        theta = np.linspace(0,2*np.pi,n,endpoint=False)
+        return(Polygon(zip(np.cos(theta)*10,np.sin(theta)*10)))
+
+    def test_simplify(self):
+        geom = self.get_circle()
+        simplifier = GeometrySimplifier()
+        simplified,area_error = simplifier.simplify(geom,0.5)
+        self.assertTrue(simplified.is_valid)
+        self.assertLess(len(simplified.exterior.coords),len(geom.exterior.coords))
+        self.assertAlmostEqual(area_error,abs(simplified.area-geom.area)/geom.area)
+        self.assertTrue(0 < area_error < 0.05)
+        ## the simplified geometry is cached by geometry and tolerance
+        self.assertEqual(len(simplifier.cache),1)
+        self.assertIs(simplifier.simplify(self.get_circle(),0.5)[0],simplified)
+        simplifier.simplify(geom,0.25)
+        self.assertEqual(len(simplifier.cache),2)
+
+    def test_simplify_unchanged(self):
+        simplifier = GeometrySimplifier()
+        point = Point(1,2)
+        self.assertEqual(simplifier.simplify(point,0.5),(point,0.0))
+        geom = self.get_circle()
+        self.assertEqual(simplifier.simplify(geom,0),(geom,0.0))
+        self.assertEqual(len(simplifier.cache),0)
+        ## the topology is preserved for large tolerances
+        simplified,area_error = simplifier.simplify(geom,100)
+        self.assertTrue(simplified.is_valid)
+        self.assertEqual(len(simplified.exterior.coords),5)
+        self.assertAlmostEqual(area_error,1-200/geom.area)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
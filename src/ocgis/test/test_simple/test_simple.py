@@ -1,6 +1,7 @@
 import unittest
 from ocgis.api.operations import OcgOperations
 from ocgis.api.interpreter import OcgInterpreter
+from ocgis.api.subset import SubsetOperation
 import itertools
 import numpy as np
 import datetime
@@ -17,11 +18,16 @@ from ocgis.exc import ExtentError, DefinitionValidationError,\
     ImproperPolygonBoundsError
 from shapely.geometry.polygon import Polygon
 import csv
+import gzip
+import json
 import fiona
+from ocgis.api.collection import SpatialCollection
+from ocgis.conv.nc import NcConverter, NcTimeSeriesConverter
 from collections import OrderedDict
 from ocgis.interface.base import crs
 from shapely.geometry.geo import mapping
-from shapely import wkt
+from shapely import wkt, wkb
+from unittest.case import SkipTest
 from ocgis.interface.base.crs import CoordinateReferenceSystem, WGS84, CFWGS84
 from ocgis.api.request.base import RequestDataset, RequestDatasetCollection
 from copy import deepcopy
@@ -30,6 +36,10 @@ from ocgis.test.test_simple.make_test_data import SimpleNcNoLevel, SimpleNc,\
     SimpleNcNoBounds, SimpleMaskNc, SimpleNc360, SimpleNcProjection
 from csv import DictReader
 from ocgis.test.test_base import longrunning
+from ocgis.interface.base.dimension.base import VectorDimension
+from ocgis.interface.base.dimension.spatial import SpatialDimension, SpatialGridDimension
+from ocgis.interface.base.variable import Variable
+from ocgis.interface.base.field import Field
 
 
 @contextmanager
@@ -179,6 +189,35 @@ class TestSimple(TestSimpleBase):
         self.assertEqual(ref.spatial.grid.shape,(1,1))
         self.assertTrue(ref.spatial.geom.polygon.value[0,0].intersects(ops.geom[0]['geom']))
     
+    def test_point_subset_nearest(self):
+        ops = self.get_ops(kwds={'geom':[-103.4,38.4],'select_nearest':True})
+        ret = ops.execute()
+        ref = ret[1]['foo']
+        self.assertEqual(ref.spatial.grid.shape,(1,1))
+        self.assertEqual(ref.spatial.geom.point.value[0,0].coords[0],(-103.0,38.0))
+        
+        ## a point far outside the grid does not select an edge cell
+        ops = self.get_ops(kwds={'geom':[-120.0,38.4],'select_nearest':True})
+        with self.assertRaises(ExtentError):
+            ops.execute()
+        ops = self.get_ops(kwds={'geom':[-120.0,38.4],'select_nearest':True,'allow_empty':True})
+        ret = ops.execute()
+        self.assertIsNone(ret[1]['foo'])
+
+    def test_point_subset_geometry_cache(self):
+        ## the buffered point is processed once for both request datasets
+        rd1 = self.get_dataset()
+        rd1['alias'] = 'var1'
+        rd2 = self.get_dataset()
+        rd2['alias'] = 'var2'
+        ops = OcgOperations(dataset=[rd1,rd2],geom=[-103,38],search_radius_mult=0.01)
+        so = SubsetOperation(ops)
+        colls = list(so)
+        self.assertEqual(len(colls),2)
+        self.assertEqual(len(so._geom_cache),1)
+        for coll in colls:
+            self.assertEqual(coll[1].values()[0].spatial.grid.shape,(1,1))
+
     def test_slicing(self):
         ops = self.get_ops(kwds={'slice':[None,None,0,[0,2],[0,2]]})
         ret = ops.execute()
@@ -349,6 +388,52 @@ class TestSimple(TestSimpleBase):
         ret = self.get_ret(kwds={'geom':geom,'allow_empty':True})
         self.assertEqual(ret[1]['foo'],None)
         
+    def test_empty_intersection_extent(self):
+        ## the second selection geometry is rejected using the dataset extent
+        geom = [{'geom':make_poly((37.8,38.2),(-103.2,-102.8)),'properties':{'UGID':1}},
+                {'geom':make_poly((20,25),(-90,-80)),'properties':{'UGID':2}}]
+        ret = self.get_ret(kwds={'geom':geom,'allow_empty':True})
+        self.assertEqual(ret[1]['foo'].spatial.grid.shape,(1,1))
+        self.assertEqual(ret[2]['foo'],None)
+
+    def test_empty_intersection_extent_shapefile(self):
+        ## shapefile selection geometries outside the dataset extent are returned
+        ## empty or raise an extent error
+        features = [{'NAME':'a','wkt':make_poly((37.8,38.2),(-103.2,-102.8)).wkt},
+                    {'NAME':'b','wkt':make_poly((20,25),(-90,-80)).wkt}]
+        path = os.path.join(self._test_dir,'extent_polygons.shp')
+        with FionaMaker(path,geometry='Polygon') as fm:
+            fm.write(features)
+        ocgis.env.DIR_SHPCABINET = self._test_dir
+        ret = self.get_ret(kwds={'geom':'extent_polygons','allow_empty':True})
+        self.assertEqual(ret.keys(),[1,2])
+        self.assertEqual(ret[1]['foo'].spatial.grid.shape,(1,1))
+        self.assertEqual(ret[2]['foo'],None)
+        with self.assertRaises(ExtentError):
+            self.get_ret(kwds={'geom':'extent_polygons'})
+
+    def test_geom_simplify_mult(self):
+        ## a densified selection geometry selects the same cells when simplified
+        geom = make_poly((37.6,39.4),(-103.4,-101.6)).buffer(0.05,resolution=64)
+        ret_original = self.get_ret(kwds={'geom':geom})
+        ret = self.get_ret(kwds={'geom':geom,'geom_simplify_mult':0.1})
+        self.assertNumpyAll(ret[1]['foo'].spatial.grid.value,ret_original[1]['foo'].spatial.grid.value)
+        ## the original selection geometry is returned
+        self.assertTrue(ret.geoms[1].equals(geom))
+
+    def test_geom_simplify_mult_no_resolution(self):
+        ## a single coordinate without bounds has no resolution and the selection
+        ## geometry is not simplified
+        geom = make_poly((37.6,39.4),(-103.4,-101.6))
+        ops = OcgOperations(dataset=self.get_dataset(),geom=geom,geom_simplify_mult=0.1)
+        so = SubsetOperation(ops)
+        grid = SpatialGridDimension(row=VectorDimension(value=[40.]),col=VectorDimension(value=[-105.]))
+        variable = Variable(name='foo',value=np.ma.array(np.zeros((1,1,1,1,1))))
+        field = Field(variables=variable,spatial=SpatialDimension(grid=grid))
+        with self.assertRaises(exc.ResolutionError):
+            field.spatial.grid.resolution
+        self.assertIs(so._get_simplified_geometry_(field,geom,'foo',1),geom)
+
     def test_empty_time_subset(self):
         ds = self.get_dataset(time_range=[datetime.datetime(2900,1,1),datetime.datetime(3100,1,1)])
         
@@ -514,6 +599,112 @@ class TestSimple(TestSimpleBase):
         
         self.assertNcEqual(rd['uri'],ret)
         
+    def test_nc_conversion_write_size(self):
+        ## values written in slabs of time steps match the source data
+        rd = self.get_dataset()
+        nc_write_size = constants.nc_write_size
+        try:
+            constants.nc_write_size = 10
+            ops = OcgOperations(dataset=rd,output_format='nc',prefix='slabs')
+            ret = self.get_ret(ops)
+        finally:
+            constants.nc_write_size = nc_write_size
+        
+        self.assertNcEqual(rd['uri'],ret)
+        
+    def test_nc_conversion_nc_options(self):
+        rd = self.get_dataset()
+        ops = OcgOperations(dataset=rd,output_format='nc',prefix='compressed',
+                            nc_options={'zlib':True,'chunking':'timeseries'})
+        ret = self.get_ret(ops)
+        
+        self.assertNcEqual(rd['uri'],ret)
+        ds = nc.Dataset(ret,'r')
+        try:
+            self.assertIn(ds.file_format,['NETCDF4','NETCDF4_CLASSIC'])
+            var = ds.variables['foo']
+            self.assertTrue(var.filters()['zlib'])
+            self.assertEqual(var.chunking()[0],var.shape[0])
+        finally:
+            ds.close()
+        
+        with self.assertRaises(DefinitionValidationError):
+            OcgOperations(dataset=rd,output_format='csv',nc_options={'zlib':True})
+        with self.assertRaises(DefinitionValidationError):
+            OcgOperations(dataset=rd,output_format='nc',nc_options={'chunking':'foo'})
+        with self.assertRaises(DefinitionValidationError):
+            OcgOperations(dataset=rd,output_format='nc',nc_options={'zlib':True,'file_format':'NETCDF3_CLASSIC'})
+        
+    def test_nc_conversion_multiple_fields(self):
+        ## all fields in a collection are written to the root group
+        rd = self.get_dataset()
+        ops = OcgOperations(dataset=rd,output_format='nc')
+        field = RequestDataset(**rd).get()
+        field2 = deepcopy(field)
+        field2.variables['foo'].alias = 'foo2'
+        coll = SpatialCollection(crs=field.spatial.crs)
+        coll.add_field(1,None,'foo',field)
+        coll.add_field(1,None,'foo2',field2)
+        ret = NcConverter([coll],self._test_dir,'multiple',ops=ops).write()
+        
+        with nc_scope(ret) as ds:
+            self.assertNumpyAll(ds.variables['time'][:],field.temporal.value)
+            for alias in ['foo','foo2']:
+                self.assertEqual(ds.variables[alias].shape,(61,2,4,4))
+                self.assertNumpyAll(ds.variables[alias][:],field.variables['foo'].value[0])
+        
+        ## fields on a different grid may not be written to the same file
+        coll = SpatialCollection(crs=field.spatial.crs)
+        coll.add_field(1,None,'foo',field)
+        coll.add_field(1,None,'foo2',field2[:,:,:,0:2,0:2])
+        with self.assertRaises(ValueError):
+            NcConverter([coll],self._test_dir,'mismatch',ops=ops).write()
+        
+    def test_nc_ts_conversion(self):
+        ## aggregated series are written for each selection geometry
+        kwds = dict(dataset=self.get_dataset(),geom='states',aggregate=True,spatial_operation='clip')
+        ops = OcgOperations(output_format='nc-ts',prefix='nc_ts',**kwds)
+        ret = ops.execute()
+        ret_numpy = OcgOperations(output_format='numpy',**kwds).execute()
+        
+        ds = nc.Dataset(ret,'r')
+        try:
+            self.assertEqual(ds.featureType,'timeSeriesProfile')
+            self.assertEqual(len(ds.dimensions['station']),2)
+            self.assertEqual(ds.variables['ugid'][:].tolist(),[1,2])
+            self.assertEqual(ds.variables['did'][:].tolist(),[1,1])
+            self.assertTrue(ds.variables['geometry'][0].startswith('MULTIPOLYGON'))
+            var = ds.variables['foo']
+            self.assertEqual(var.dimensions,('station','time','z'))
+            for idx,ugid in enumerate([1,2]):
+                value = ret_numpy.gvu(ugid,'foo')
+                self.assertNumpyAll(var[idx],value[0,:,:,0,0])
+        finally:
+            ds.close()
+        
+    def test_nc_ts_conversion_multiple_grids(self):
+        ## datasets on different grids do not share stations
+        rd = self.get_dataset()
+        ops = OcgOperations(dataset=rd,output_format='nc-ts')
+        field = RequestDataset(**rd).get()
+        field.uid = 1
+        field2 = deepcopy(field)[:,:,:,1:3,1:3]
+        field2.uid = 2
+        field2.variables['foo'].alias = 'foo2'
+        coll = SpatialCollection(crs=field.spatial.crs)
+        coll.add_field(1,None,'foo',field)
+        coll.add_field(1,None,'foo2',field2)
+        ret = NcTimeSeriesConverter([coll],self._test_dir,'multiple_grids',ops=ops).write()
+        
+        with nc_scope(ret) as ds:
+            self.assertEqual(len(ds.dimensions['station']),20)
+            self.assertEqual(ds.variables['did'][:].tolist(),[1]*16+[2]*4)
+            self.assertEqual(ds.variables['gid'][16:].tolist(),[6,7,10,11])
+            self.assertEqual(ds.variables['station_id'][16],'1_2_6')
+            foo2 = ds.variables['foo2']
+            self.assertTrue(foo2[0:16].mask.all())
+            self.assertNumpyAll(foo2[16],field.variables['foo'].value[0,:,:,1,1])
+        
     def test_nc_conversion_calc(self):
         calc_grouping = ['month']
         calc = [{'func':'mean','name':'my_mean'},
@@ -773,6 +964,101 @@ class TestSimple(TestSimpleBase):
                     self.assertDictEqual(f.meta,{'crs': {u'no_defs': True, u'ellps': u'WGS84', u'proj': u'longlat'}, 'driver': u'ESRI Shapefile', 'schema': {'geometry': 'Polygon', 'properties': OrderedDict([(u'DID', 'int:10'), (u'VID', 'int:10'), (u'CID', 'int:10'), (u'UGID', 'int:10'), (u'TID', 'int:10'), (u'LID', 'int:10'), (u'GID', 'int:10'), (u'VARIABLE', 'str'), (u'ALIAS', 'str'), (u'CALC_KEY', 'str'), (u'CALC_ALIAS', 'str'), (u'TIME', 'date'), (u'YEAR', 'int:10'), (u'MONTH', 'int:10'), (u'DAY', 'int:10'), (u'LEVEL', 'int:10'), (u'VALUE', 'float')])}})
                     self.assertEqual(len(f),64)
                     
+    def test_parquet_conversion(self):
+        from ocgis.conv import parquet_
+        if parquet_.pq is None:
+            raise(SkipTest('pyarrow is not installed'))
+        ops = OcgOperations(dataset=self.get_dataset(),output_format='csv')
+        ret = self.get_ret(ops)
+        with open(ret,'r') as f:
+            rows = list(csv.DictReader(f))
+        ops = OcgOperations(dataset=self.get_dataset(),output_format='parquet',prefix='parquet')
+        ret = self.get_ret(ops)
+        self.assertTrue(ret.endswith('.parquet'))
+        
+        table = parquet_.pq.read_table(ret)
+        self.assertEqual(table.schema.names,[h.upper() for h in constants.raw_headers]+['GEOMETRY'])
+        self.assertEqual(table.num_rows,len(rows))
+        columns = table.to_pydict()
+        for idx in [0,len(rows)-1]:
+            self.assertEqual(columns['GID'][idx],int(rows[idx]['GID']))
+            self.assertEqual(columns['VALUE'][idx],float(rows[idx]['VALUE']))
+            self.assertEqual(columns['VARIABLE'][idx],rows[idx]['VARIABLE'])
+        self.assertEqual(wkb.loads(columns['GEOMETRY'][0]).geom_type,'MultiPolygon')
+        self.assertEqual(str(table.column('TIME').type),'timestamp[us]')
+        
+        ## unformatted time values are written as floats
+        ops = OcgOperations(dataset=self.get_dataset(),output_format='parquet',prefix='parquet_raw_time',
+                            format_time=False)
+        ret = self.get_ret(ops)
+        table = parquet_.pq.read_table(ret)
+        self.assertEqual(str(table.column('TIME').type),'double')
+        field = RequestDataset(**self.get_dataset()).get(format_time=False)
+        self.assertEqual(table.to_pydict()['TIME'][0],field.temporal.value[0])
+        
+    def test_npy_conversion(self):
+        ret_numpy = self.get_ret(kwds={'output_format':'numpy'})
+        ops = OcgOperations(dataset=self.get_dataset(),output_format='npy',prefix='npy')
+        ret = self.get_ret(ops)
+        value = ret.gvu(1,'foo')
+        self.assertIsInstance(value.data,np.memmap)
+        self.assertNumpyAll(value,ret_numpy.gvu(1,'foo'))
+        self.assertNumpyAll(value.mask,ret_numpy.gvu(1,'foo').mask)
+        
+        folder = os.path.join(self._test_dir,'npy')
+        with open(os.path.join(folder,'npy_index.json'),'r') as f:
+            index = json.load(f)
+        self.assertEqual(len(index['variables']),1)
+        entry = index['variables'][0]
+        self.assertEqual((entry['ugid'],entry['variable']),(1,'foo'))
+        self.assertEqual(tuple(entry['shape']),value.shape)
+        self.assertNumpyAll(np.load(os.path.join(folder,entry['value'])),value.data)
+        self.assertNumpyAll(np.load(os.path.join(folder,entry['mask'])),value.mask)
+        
+    def test_npy_conversion_write_size(self):
+        ## values copied in slabs of time steps match the source data
+        ret_numpy = self.get_ret(kwds={'output_format':'numpy'})
+        npy_write_size = constants.npy_write_size
+        try:
+            constants.npy_write_size = 10
+            ops = OcgOperations(dataset=self.get_dataset(),output_format='npy',prefix='npy_slabs')
+            ret = self.get_ret(ops)
+        finally:
+            constants.npy_write_size = npy_write_size
+        value = ret.gvu(1,'foo')
+        self.assertNumpyAll(value,ret_numpy.gvu(1,'foo'))
+        self.assertNumpyAll(value.mask,ret_numpy.gvu(1,'foo').mask)
+        
+    def test_shp_conversion_output_layout(self):
+        ## geometries are written once with values in a companion table
+        ops = OcgOperations(dataset=self.get_dataset(),output_format='shp',
+                            output_layout='normalized',prefix='normalized')
+        ret = self.get_ret(ops)
+        with fiona.open(ret) as f:
+            self.assertEqual(f.schema['properties'].keys(),[u'DID',u'UGID',u'GID'])
+            self.assertEqual(len(f),16)
+        with open(os.path.join(self._test_dir,'normalized','normalized_values.csv'),'r') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows),1952)
+        self.assertEqual(rows[0]['TIME'],'2000-03-01 12:00:00')
+        
+        ## value columns are added for each time value
+        ops = OcgOperations(dataset=self.get_dataset(),output_format='shp',
+                            output_layout='wide',prefix='wide')
+        ret = self.get_ret(ops)
+        with fiona.open(ret) as f:
+            keys = f.schema['properties'].keys()
+            self.assertNotIn(u'TIME',keys)
+            self.assertEqual(keys[-1],u'V61')
+            self.assertEqual(len(f),32)
+        with open(os.path.join(self._test_dir,'wide','wide_columns.csv'),'r') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows),61)
+        self.assertEqual(rows[60]['COLUMN'],'V61')
+        
+        with self.assertRaises(DefinitionValidationError):
+            OcgOperations(dataset=self.get_dataset(),output_format='csv',output_layout='wide')
+                    
     def test_shp_conversion_with_external_geometries(self):
         
         def _make_record_(wkt_str,ugid,state_name):
@@ -874,6 +1160,18 @@ class TestSimple(TestSimpleBase):
         npy = ops.execute()
         self.assertEqual(len(rows),reduce(lambda x,y: x*y,npy.gvu(1,'foo').shape))
         
+    def test_csv_conversion_gzip(self):
+        ops = OcgOperations(dataset=self.get_dataset(),output_format='csv',prefix='uncompressed')
+        ret = ops.execute()
+        ops = OcgOperations(dataset=self.get_dataset(),output_format='csv',output_compression='gzip')
+        ret_gzip = ops.execute()
+        self.assertTrue(ret_gzip.endswith('.csv.gz'))
+        with open(ret,'r') as f:
+            with gzip.open(ret_gzip,'rb') as f_gzip:
+                self.assertEqual(f.read(),f_gzip.read())
+        with self.assertRaises(DefinitionValidationError):
+            OcgOperations(dataset=self.get_dataset(),output_format='shp',output_compression='gzip')
+        
     def test_csv_calc_conversion(self):
         calc = [{'func':'mean','name':'my_mean'}]
         calc_grouping = ['month','year']
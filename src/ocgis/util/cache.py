@@ -0,0 +1,66 @@
+from collections import OrderedDict
+import hashlib
+
+
+class BoundedCache(object):
+    '''
+    Mapping holding at most `maxsize` entries. The least recently used entry is
+    discarded when the cache is full.
+
+    >>> cache = BoundedCache(maxsize=2)
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache['a']
+    1
+    >>> cache['c'] = 3
+    >>> 'b' in cache
+    False
+
+    :param int maxsize: The maximum number of cached entries.
+    '''
+
+    def __init__(self,maxsize=128):
+        if maxsize < 1:
+            raise(ValueError('"maxsize" must be >= 1.'))
+        self.maxsize = maxsize
+        self._store = OrderedDict()
+
+    def __contains__(self,key):
+        return(key in self._store)
+
+    def __getitem__(self,key):
+        ## move the entry to the most recently used position
+        value = self._store.pop(key)
+        self._store[key] = value
+        return(value)
+
+    def __len__(self):
+        return(len(self._store))
+
+    def __setitem__(self,key,value):
+        if key in self._store:
+            self._store.pop(key)
+        elif len(self._store) >= self.maxsize:
+            self._store.popitem(last=False)
+        self._store[key] = value
+
+    def clear(self):
+        self._store.clear()
+
+    def get(self,key,default=None):
+        try:
+            ret = self[key]
+        except KeyError:
+            ret = default
+        return(ret)
+
+
+def get_geometry_key(geom):
+    '''
+    :param geom: The geometry to identify.
+    :type geom: :class:`shapely.geometry.base.BaseGeometry`
+    :returns: A digest of the geometry's well-known binary representation
+     suitable for use in cache keys.
+    :rtype: str
+    '''
+    return(hashlib.md5(geom.wkb).hexdigest())
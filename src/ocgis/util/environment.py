@@ -9,6 +9,8 @@ class Environment(object):
         self.DIR_SHPCABINET = EnvParm('DIR_SHPCABINET',None)
         self.DIR_DATA = EnvParm('DIR_DATA',None)
         self.DIR_TEST_DATA = EnvParm('DIR_TEST_DATA',None)
+        self.DIR_CACHE = EnvParm('DIR_CACHE',None)
+        self.ONLINE_CHUNK_SIZE = EnvParm('ONLINE_CHUNK_SIZE',None,formatter=int)
         self.SERIAL = EnvParm('SERIAL',True,formatter=self._format_bool_)
         self.CORES = EnvParm('CORES',6,formatter=int)
         self.MODE = EnvParm('MODE','raw')
@@ -0,0 +1,150 @@
+import os
+import json
+import sqlite3
+from collections import OrderedDict
+import fiona
+from shapely import wkb
+from shapely.geometry import shape
+
+
+class GeometryStore(object):
+    '''
+    Local SQLite store of the geometries and properties of a shapefile. Geometries
+    are stored as WKB with an R*Tree index of their envelopes. The store records
+    the modification time and size of its source shapefile to detect when it is
+    out of date.
+
+    >>> store = GeometryStore.build('/path/to/states.shp','/path/to/states.sqlite')
+    >>> rows = list(store.iter_geoms(select_ugid=[1,48],bounds=(-110,30,-90,50)))
+
+    :param path: Path to an existing store.
+    :type path: str
+    '''
+
+    def __init__(self,path):
+        if not os.path.exists(path):
+            raise(ValueError('Geometry store does not exist: {0}'.format(path)))
+        self.path = path
+
+    @classmethod
+    def build(cls,shp_path,path):
+        '''
+        Build a store from a shapefile. An existing store at `path` is replaced.
+
+        :param str shp_path: Path to the source shapefile. Features must have a
+         "UGID" attribute.
+        :param str path: Path to the output store.
+        :rtype: :class:`ocgis.util.geom_store.GeometryStore`
+        '''
+        ## build into a temporary file so a partially written store is never used
+        path_tmp = path + '.tmp'
+        if os.path.exists(path_tmp):
+            os.remove(path_tmp)
+        conn = sqlite3.connect(path_tmp)
+        try:
+            conn.execute('CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('CREATE TABLE geometries (fid INTEGER PRIMARY KEY, ugid INTEGER, wkb BLOB, properties TEXT)')
+            conn.execute('CREATE VIRTUAL TABLE geometries_rtree USING rtree(fid, minx, maxx, miny, maxy)')
+            with fiona.open(shp_path,'r') as source:
+                rows = cls._iter_rows_(source)
+                for fid,ugid,geom,properties in rows:
+                    minx,miny,maxx,maxy = geom.bounds
+                    conn.execute('INSERT INTO geometries VALUES (?,?,?,?)',
+                                 (fid,ugid,buffer(geom.wkb),json.dumps(properties)))
+                    conn.execute('INSERT INTO geometries_rtree VALUES (?,?,?,?,?)',
+                                 (fid,minx,maxx,miny,maxy))
+            conn.execute('CREATE INDEX geometries_ugid ON geometries (ugid)')
+            conn.executemany('INSERT INTO metadata VALUES (?,?)',cls._get_source_signature_(shp_path).items())
+            conn.commit()
+        finally:
+            conn.close()
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path_tmp,path)
+        return(cls(path))
+
+    @property
+    def metadata(self):
+        ''':rtype: dict'''
+        conn = sqlite3.connect(self.path)
+        try:
+            ret = dict(conn.execute('SELECT key,value FROM metadata'))
+        finally:
+            conn.close()
+        return(ret)
+
+    def get_extent(self):
+        '''
+        :returns: The envelope of all geometries in the store.
+        :rtype: tuple of (minx,miny,maxx,maxy)
+        '''
+        conn = sqlite3.connect(self.path)
+        try:
+            minx,maxx,miny,maxy = conn.execute('SELECT min(minx),max(maxx),min(miny),max(maxy) FROM geometries_rtree').fetchone()
+        finally:
+            conn.close()
+        return(minx,miny,maxx,maxy)
+
+    def get_is_current(self,shp_path):
+        '''
+        :returns: `True` if the store was built from the current version of the
+         shapefile.
+        :rtype: bool
+        '''
+        try:
+            ret = self.metadata == self._get_source_signature_(shp_path)
+        except (OSError,sqlite3.DatabaseError):
+            ret = False
+        return(ret)
+
+    def iter_geoms(self,select_ugid=None,bounds=None):
+        '''
+        Stream geometries in feature order.
+
+        :param select_ugid: Sequence of unique identifiers to select.
+        :type select_ugid: sequence of int
+        :param bounds: If provided, only geometries with envelopes intersecting the
+         bounding box are returned.
+        :type bounds: tuple of (minx,miny,maxx,maxy)
+        :yields: tuple of (:class:`shapely.geometry.base.BaseGeometry`,
+         :class:`collections.OrderedDict` of properties)
+        '''
+        conn = sqlite3.connect(self.path)
+        try:
+            sql = ['SELECT g.wkb,g.properties FROM geometries g']
+            where = []
+            args = []
+            if select_ugid is not None:
+                ## the identifiers are joined from a temporary table avoiding large
+                ## "IN" statements.
+                conn.execute('CREATE TEMP TABLE select_ugid (ugid INTEGER PRIMARY KEY)')
+                conn.executemany('INSERT OR IGNORE INTO select_ugid VALUES (?)',[(int(u),) for u in select_ugid])
+                sql.append('JOIN select_ugid s ON g.ugid = s.ugid')
+            if bounds is not None:
+                minx,miny,maxx,maxy = bounds
+                sql.append('JOIN geometries_rtree r ON g.fid = r.fid')
+                where.append('r.minx <= ? AND r.maxx >= ? AND r.miny <= ? AND r.maxy >= ?')
+                args += [maxx,minx,maxy,miny]
+            if len(where) > 0:
+                sql.append('WHERE ' + ' AND '.join(where))
+            sql.append('ORDER BY g.fid')
+            for geom_wkb,properties in conn.execute(' '.join(sql),args):
+                yield(wkb.loads(str(geom_wkb)),json.loads(properties,object_pairs_hook=OrderedDict))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _get_source_signature_(shp_path):
+        stat = os.stat(shp_path)
+        ret = {'source_mtime':repr(stat.st_mtime),'source_size':str(stat.st_size)}
+        return(ret)
+
+    @staticmethod
+    def _iter_rows_(source):
+        for fid,feature in enumerate(source):
+            properties = feature['properties']
+            try:
+                ugid = properties['UGID']
+            except KeyError:
+                ugid = properties['ugid']
+            yield(fid,ugid,shape(feature['geometry']),properties)
@@ -114,6 +114,25 @@ def get_default_or_apply(target,f,default=None):
         ret = f(target)
     return(ret)
 
+def get_object_array(values):
+    '''
+    :param values: The elements of the new array. NumPy arrays contribute their
+     NumPy scalars as elements.
+    :type values: sequence
+    :returns: A one-dimensional object array holding the elements of `values`
+     without conversion.
+    :rtype: :class:`numpy.ndarray`
+    '''
+    ret = np.empty(len(values),dtype=object)
+    if isinstance(values,np.ndarray) and values.dtype != object:
+        ret[:] = list(values)
+    else:
+        ## elements are assigned individually so sequence elements (i.e.
+        ## geometries) are not broadcast.
+        for idx,value in enumerate(values):
+            ret[idx] = value
+    return(ret)
+
 def get_none_or_1d(target):
     if target is None:
         ret = None
@@ -7,28 +7,126 @@ import csv
 from osgeo.ogr import CreateGeometryFromWkb
 from shapely.geometry.polygon import Polygon
 from shapely import wkb
+from shapely.geometry.geo import box
 import fiona
 from ocgis.interface.base.crs import CoordinateReferenceSystem
+from collections import OrderedDict
+from copy import deepcopy
+from ocgis.util.geom_store import GeometryStore
+from ocgis.util.logging_ocgis import ocgis_lh
+import logging
 
 
 class ShpCabinetIterator(object):
     '''
     Iterate over a geometry selected by `key`.
+    
+    :param bounds: If provided, only features with envelopes intersecting the
+     bounding box are returned. See :meth:`ocgis.ShpCabinet.iter_geoms`.
+    :type bounds: tuple of (minx,miny,maxx,maxy)
+    :param bounds_crs: The coordinate system of `bounds`. If it does not match the
+     shapefile's coordinate system, `bounds` is ignored. If `None`, the coordinate
+     systems are assumed to match.
+    :type bounds_crs: :class:`ocgis.crs.CoordinateReferenceSystem`
     '''
     
-    def __init__(self,key,select_ugid=None):
+    def __init__(self,key,select_ugid=None,bounds=None,bounds_crs=None):
         self.key = key
         self.select_ugid = select_ugid
+        self.bounds = bounds
+        self.bounds_crs = bounds_crs
         self.sc = ShpCabinet()
         
     def __iter__(self):
         '''
         Return an iterator as from :meth:`ocgis.ShpCabinet.iter_geoms`
         '''
-        for row in self.sc.iter_geoms(self.key,select_ugid=self.select_ugid):
+        bounds = self.bounds
+        if bounds is not None and self.bounds_crs is not None:
+            crs = self.sc.get_entry(self.key)['crs']
+            if crs != self.bounds_crs:
+                bounds = None
+        for row in self.sc.iter_geoms(self.key,select_ugid=self.select_ugid,bounds=bounds):
             yield(row)
 
 
+class ShpCabinetCatalog(object):
+    '''
+    Catalog of the files contained in a shapefile cabinet directory. The directory
+    tree is walked once. The catalog is stale if the modification time of any
+    directory in the tree changes (i.e. a file is added, removed, or renamed).
+    Shapefile metadata is loaded on first access and reloaded if the shapefile's
+    modification time changes.
+    
+    :param path: Path to the cabinet directory.
+    :type path: str
+    '''
+    
+    def __init__(self,path):
+        self.path = path
+        self._dir_mtimes = {}
+        ## maps file extensions to dictionaries of keys and paths
+        self._paths = {}
+        ## maps shapefile paths to tuples of (modification time, entry)
+        self._entries = {}
+        for dirpath,dirnames,filenames in os.walk(self.path):
+            self._dir_mtimes[dirpath] = os.path.getmtime(dirpath)
+            for filename in filenames:
+                key,ext = os.path.splitext(filename)
+                ## the first file found for a key is used
+                paths = self._paths.setdefault(ext[1:],OrderedDict())
+                if key not in paths:
+                    paths[key] = os.path.join(dirpath,filename)
+    
+    @property
+    def is_stale(self):
+        ret = False
+        for dirpath,mtime in self._dir_mtimes.iteritems():
+            try:
+                if os.path.getmtime(dirpath) != mtime:
+                    ret = True
+            except OSError:
+                ret = True
+            if ret:
+                break
+        return(ret)
+    
+    def get_keys(self,ext='shp'):
+        ''':rtype: list of str'''
+        return(self._paths.get(ext,{}).keys())
+    
+    def get_path(self,key,ext='shp'):
+        try:
+            ret = self._paths[ext][key]
+        except KeyError:
+            raise(ValueError('a shapefile with key "{0}" was not found under the directory: {1}'.format(key,self.path)))
+        return(ret)
+    
+    def get_entry(self,key):
+        '''
+        :returns: A dictionary with keys "path", "meta" (the :mod:`fiona` source
+         metadata), "crs", "schema", "feature_count", and "extent" (minx,miny,maxx,maxy).
+        :rtype: dict
+        '''
+        path = self.get_path(key)
+        mtime = os.path.getmtime(path)
+        try:
+            entry_mtime,ret = self._entries[path]
+            if entry_mtime != mtime:
+                raise(KeyError(path))
+        except KeyError:
+            with fiona.open(path,'r') as source:
+                meta = source.meta
+                ret = {'path':path,
+                       'meta':meta,
+                       'crs':CoordinateReferenceSystem(crs=meta['crs']),
+                       'schema':meta['schema'],
+                       'feature_count':len(source),
+                       'extent':source.bounds}
+            self._entries[path] = (mtime,ret)
+        return(ret)
+
+
 class ShpCabinet(object):
     '''A utility object designed for accessing shapefiles stored in a locally
     accessible location.
@@ -48,6 +146,9 @@ class ShpCabinet(object):
     :type path: str
     '''
     
+    ## catalogs are shared by all cabinets and keyed by the cabinet path
+    _catalogs = {}
+    
     def __init__(self,path=None):
         self._path = path or env.DIR_SHPCABINET
     
@@ -64,17 +165,28 @@ class ShpCabinet(object):
         
         :rtype: list of str
         """
-        ret = []
-        for dirpath,dirnames,filenames in os.walk(self.path):
-            for fn in filenames:
-                if fn.endswith('shp'):
-                    ret.append(os.path.splitext(fn)[0])
+        return(self.catalog.get_keys())
+    
+    @property
+    def catalog(self):
+        ''':rtype: :class:`ocgis.util.shp_cabinet.ShpCabinetCatalog`'''
+        path = self.path
+        ret = self._catalogs.get(path)
+        if ret is None or ret.is_stale:
+            ret = ShpCabinetCatalog(path)
+            self._catalogs[path] = ret
         return(ret)
     
+    def get_entry(self,key):
+        '''
+        See :meth:`ocgis.util.shp_cabinet.ShpCabinetCatalog.get_entry`.
+        
+        :rtype: dict
+        '''
+        return(self.catalog.get_entry(key))
+    
     def get_meta(self,key):
-        path = self.get_shp_path(key)
-        with fiona.open(path,'r') as source:
-            return(source.meta)
+        return(deepcopy(self.get_entry(key)['meta']))
         
     def get_shp_path(self,key):
         return(self._get_path_(key,ext='shp'))
@@ -82,17 +194,45 @@ class ShpCabinet(object):
     def get_cfg_path(self,key):
         return(self._get_path_(key,ext='cfg'))
     
+    def get_store_path(self,key):
+        '''
+        :returns: The path to the geometry store for `key`. Stores are located
+         beside their shapefiles.
+        :rtype: str
+        '''
+        shp_path = self.get_shp_path(key)
+        return(os.path.join(os.path.split(shp_path)[0],key+'.sqlite'))
+    
+    def build_store(self,key):
+        '''
+        Build the geometry store used by :meth:`~ocgis.ShpCabinet.iter_geoms` for
+        `key`. The store is rebuilt if it exists.
+        
+        :rtype: :class:`ocgis.util.geom_store.GeometryStore`
+        '''
+        return(GeometryStore.build(self.get_shp_path(key),self.get_store_path(key)))
+    
+    def get_store(self,key):
+        '''
+        :returns: The geometry store for `key` or `None` if no store exists or the
+         store is out of date with its shapefile.
+        :rtype: :class:`ocgis.util.geom_store.GeometryStore`
+        '''
+        path = self.get_store_path(key)
+        if os.path.exists(path):
+            ret = GeometryStore(path)
+            if not ret.get_is_current(self.get_shp_path(key)):
+                ocgis_lh(msg='geometry store for "{0}" is out of date and will not be used'.format(key),
+                         logger='shp_cabinet',level=logging.WARN)
+                ret = None
+        else:
+            ret = None
+        return(ret)
+    
     def _get_path_(self,key,ext='shp'):
-        ret = None
-        for dirpath,dirnames,filenames in os.walk(self.path):
-            for filename in filenames:
-                if filename.endswith(ext) and os.path.splitext(filename)[0] == key:
-                    ret = os.path.join(dirpath,filename)
-                    return(ret)
-        if ret is None:
-            raise(ValueError('a shapefile with key "{0}" was not found under the directory: {1}'.format(key,self.path)))
+        return(self.catalog.get_path(key,ext=ext))
     
-    def iter_geoms(self,key,select_ugid=None):
+    def iter_geoms(self,key,select_ugid=None,bounds=None):
         """Iterate over geometries from a shapefile specified by `key`.
         
         >>> sc = ShpCabinet()
@@ -104,7 +244,12 @@ class ShpCabinet(object):
         :type key: str
         :param select_ugid: Sequence of unique identifiers matching values from the shapefile's UGID attribute.
         :type select_ugid: sequence
+        :param bounds: If provided, only features with envelopes intersecting this
+         bounding box are parsed. The bounding box is in the shapefile's coordinate system.
+        :type bounds: tuple of (minx,miny,maxx,maxy)
         :yields: dict
+        
+        .. note:: If a current geometry store exists for `key` (see :meth:`~ocgis.ShpCabinet.build_store`), geometries are read from the store instead of the shapefile.
         """
         
         ## path to the target shapefile
@@ -113,14 +258,31 @@ class ShpCabinet(object):
         if not os.path.exists(shp_path):
             raise(RuntimeError('requested geometry with identifier "{0}" does not exist in the file system.'.format(key)))
         
-        ## get the source CRS
-        meta = self.get_meta(key)
-        crs = CoordinateReferenceSystem(crs=meta['crs'])
+        ## get the source CRS and metadata from the catalog. only OGR opens the
+        ## shapefile for iteration.
+        entry = self.get_entry(key)
+        meta = deepcopy(entry['meta'])
+        crs = entry['crs']
+        
+        ## read from the geometry store if available
+        store = self.get_store(key)
+        if store is not None:
+            for geom,properties in store.iter_geoms(select_ugid=select_ugid,bounds=bounds):
+                yld = {'geom':geom,'properties':properties,'crs':crs,'meta':meta}
+                assert('UGID' in yld['properties'])
+                yield(yld)
+            return
         
         ## get the geometries
         ds = ogr.Open(shp_path)
         try:
             lyr = ds.GetLayerByIndex(0)
+            if bounds is not None:
+                minx,miny,maxx,maxy = bounds
+                spatial_filter = ogr.CreateGeometryFromWkb(box(minx,miny,maxx,maxy).wkb)
+                lyr.SetSpatialFilter(spatial_filter)
+            else:
+                spatial_filter = None
             lyr.ResetReading()
             if select_ugid is not None:
                 lyr_name = lyr.GetName()
@@ -130,7 +292,7 @@ class ShpCabinet(object):
                 else:
                     sql_where = 'UGID IN {0}'.format(tuple(select_ugid))
                 sql = 'SELECT * FROM {0} WHERE {1}'.format(lyr_name,sql_where)
-                features = ds.ExecuteSQL(sql)
+                features = ds.ExecuteSQL(sql,spatialFilter=spatial_filter)
             else:
                 features = lyr
             
@@ -0,0 +1,116 @@
+import numpy as np
+from shapely.geometry.linestring import LineString
+from shapely.geometry.multipolygon import MultiPolygon
+from shapely.ops import unary_union, polygonize
+
+
+def get_grid_edges(bounds):
+    '''
+    Convert a bounds array for a rectilinear dimension into a vector of cell edges.
+    Cell `i` spans `edges[i]` to `edges[i+1]`.
+
+    >>> get_grid_edges(np.array([[0.,1.],[1.,2.],[2.,3.]]))
+    array([ 0.,  1.,  2.,  3.])
+
+    :param bounds: Array of bounds with shape (n,2).
+    :type bounds: :class:`numpy.ndarray`
+    :returns: The cell edges with shape (n+1,) or `None` if the cells are not
+     contiguous.
+    :rtype: :class:`numpy.ndarray`
+    '''
+    bounds = np.asarray(bounds,dtype=np.float64)
+    lower = bounds.min(axis=1)
+    upper = bounds.max(axis=1)
+    if lower.shape[0] == 1 or np.allclose(lower[1:],upper[:-1]):
+        ret = np.concatenate((lower,upper[-1:]))
+    elif np.allclose(upper[1:],lower[:-1]):
+        ret = np.concatenate((upper[0:1],lower))
+    else:
+        ret = None
+    return(ret)
+
+
+def get_dissolved_grid(row_bounds,col_bounds,select):
+    '''
+    Dissolve the selected cells of a rectilinear grid into a single geometry without
+    unioning the individual cell polygons. Edges shared by two selected cells cancel
+    on the index grid, and only the remaining boundary edges are merged into lines
+    and polygonized.
+
+    :param row_bounds: Row (y-coordinate) bounds with shape (n_row,2).
+    :type row_bounds: :class:`numpy.ndarray`
+    :param col_bounds: Column (x-coordinate) bounds with shape (n_col,2).
+    :type col_bounds: :class:`numpy.ndarray`
+    :param select: Boolean array with shape (n_row,n_col). `True` values indicate
+     selected cells.
+    :type select: :class:`numpy.ndarray`
+    :returns: A :class:`~shapely.geometry.polygon.Polygon` or
+     :class:`~shapely.geometry.multipolygon.MultiPolygon`. `None` is returned if the
+     grid cells are not contiguous or no cells are selected.
+    '''
+    y_edges = get_grid_edges(row_bounds)
+    x_edges = get_grid_edges(col_bounds)
+    select = np.asarray(select,dtype=bool)
+    if y_edges is None or x_edges is None or not select.any():
+        return(None)
+    assert(select.shape == (y_edges.shape[0]-1,x_edges.shape[0]-1))
+
+    n_row,n_col = select.shape
+    padded = np.zeros((n_row+2,n_col+2),dtype=bool)
+    padded[1:-1,1:-1] = select
+    ## an edge is on the boundary if the selection differs across it. the
+    ## horizontal edge (i,j) lies on y_edges[i] and spans column j. the vertical
+    ## edge (i,j) lies on x_edges[j] and spans row i.
+    horizontal = padded[0:-1,1:-1] != padded[1:,1:-1]
+    vertical = padded[1:-1,0:-1] != padded[1:-1,1:]
+
+    lines = []
+    for idx_y,start,stop in _iter_runs_(horizontal):
+        y = y_edges[idx_y]
+        lines.append(LineString([(x_edges[start],y),(x_edges[stop],y)]))
+    for idx_x,start,stop in _iter_runs_(vertical.T):
+        x = x_edges[idx_x]
+        lines.append(LineString([(x,y_edges[start]),(x,y_edges[stop])]))
+
+    ## node the boundary lines and keep the faces lying inside selected cells.
+    ## faces inside unselected cells are holes.
+    y_sorted = np.sort(y_edges)
+    x_sorted = np.sort(x_edges)
+    polygons = []
+    for face in polygonize(unary_union(lines)):
+        pt = face.representative_point()
+        idx_row = _get_cell_index_(y_edges,y_sorted,pt.y)
+        idx_col = _get_cell_index_(x_edges,x_sorted,pt.x)
+        if select[idx_row,idx_col]:
+            polygons.append(face)
+
+    if len(polygons) == 1:
+        ret = polygons[0]
+    else:
+        ret = MultiPolygon(polygons)
+    return(ret)
+
+
+def _get_cell_index_(edges,edges_sorted,coordinate):
+    idx = np.searchsorted(edges_sorted,coordinate) - 1
+    idx = min(max(idx,0),edges.shape[0]-2)
+    ## descending edges index the cells in reverse
+    if edges[0] > edges[-1]:
+        idx = edges.shape[0] - 2 - idx
+    return(idx)
+
+
+def _iter_runs_(edges):
+    '''
+    :param edges: Two-dimensional boolean array.
+    :yields: tuple of (row index,start column,stop column) for each run of
+     consecutive `True` values along the rows with `stop` being the edge index
+     following the run.
+    '''
+    padded = np.zeros((edges.shape[0],edges.shape[1]+2),dtype=np.int8)
+    padded[:,1:-1] = edges
+    delta = np.diff(padded,axis=1)
+    idx_row_start,start = np.nonzero(delta == 1)
+    _,stop = np.nonzero(delta == -1)
+    for idx_row,a,b in zip(idx_row_start,start,stop):
+        yield(idx_row,a,b)
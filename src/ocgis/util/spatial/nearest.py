@@ -0,0 +1,115 @@
+import numpy as np
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+class NearestCellIndex(object):
+    '''
+    Index of grid cell centers for nearest-neighbour queries. Distances are
+    Euclidean in the grid's coordinate space. Rectilinear grids without masked
+    cells are queried analytically by searching the row and column coordinates.
+    Otherwise, a KD-tree is used if :mod:`scipy` is available with a chunked brute
+    force search as the fallback.
+
+    >>> index = NearestCellIndex(field.spatial.grid)
+    >>> rows,cols = index.query([-100.1,-98.6],[40.2,38.1])
+    >>> rows.shape
+    (2, 1)
+
+    :param grid: The grid to index.
+    :type grid: :class:`ocgis.interface.base.dimension.spatial.SpatialGridDimension`
+    '''
+    #: Maximum number of distances computed at once by the brute force search.
+    max_brute_force_size = 1e7
+
+    def __init__(self,grid):
+        value = grid.value
+        mask = np.ma.getmaskarray(value)[0]
+        if mask.all():
+            raise(ValueError('The grid has no unmasked cells to index.'))
+        self.shape = mask.shape
+        if grid.row is not None and grid.col is not None and not mask.any():
+            self._rectilinear = (np.asarray(grid.row.value),np.asarray(grid.col.value))
+        else:
+            self._rectilinear = None
+        ## flat indices and coordinates of the unmasked cell centers
+        self._valid = np.flatnonzero(np.invert(mask))
+        data = np.ma.getdata(value)
+        self._y,self._x = data[0],data[1]
+        self._coords = np.column_stack((data[1].flat[self._valid],data[0].flat[self._valid])).astype(np.float64)
+        self._tree = None
+
+    def query(self,x,y,k=1,return_distance=False):
+        '''
+        :param x: Point x-coordinates.
+        :type x: sequence of float
+        :param y: Point y-coordinates.
+        :type y: sequence of float
+        :param int k: The number of nearest cells to return for each point. This is
+         limited by the number of unmasked cells.
+        :param bool return_distance: If `True`, also return the distances from the
+         points to the cell centers.
+        :returns: Tuple of row and column index arrays with shape (n_points,k). Cells
+         are ordered by increasing distance. If `return_distance` is `True`, the
+         distance array with the same shape is the third element.
+        :rtype: tuple of :class:`numpy.ndarray`
+        '''
+        x = np.atleast_1d(np.asarray(x,dtype=np.float64))
+        y = np.atleast_1d(np.asarray(y,dtype=np.float64))
+        assert(x.shape == y.shape)
+        k = min(int(k),self._valid.shape[0])
+        if k < 1:
+            raise(ValueError('"k" must be >= 1.'))
+
+        if k == 1 and self._rectilinear is not None:
+            ## the squared distance separates by axis on a rectilinear grid
+            rows = self._get_nearest_1d_(self._rectilinear[0],y)
+            cols = self._get_nearest_1d_(self._rectilinear[1],x)
+            ret = (rows.reshape(-1,1),cols.reshape(-1,1))
+        else:
+            points = np.column_stack((x,y))
+            if cKDTree is not None:
+                if self._tree is None:
+                    self._tree = cKDTree(self._coords)
+                _,idx = self._tree.query(points,k=k)
+                idx = np.asarray(idx).reshape(points.shape[0],k)
+            else:
+                idx = self._get_brute_force_(points,k)
+            rows,cols = np.unravel_index(self._valid[idx].flatten(),self.shape)
+            ret = (rows.reshape(idx.shape),cols.reshape(idx.shape))
+        if return_distance:
+            rows,cols = ret
+            distance = np.hypot(self._x[rows,cols] - x.reshape(-1,1),self._y[rows,cols] - y.reshape(-1,1))
+            ret = (rows,cols,distance)
+        return(ret)
+
+    def _get_brute_force_(self,points,k):
+        n_valid = self._coords.shape[0]
+        chunk_size = max(int(self.max_brute_force_size/n_valid),1)
+        ret = np.empty((points.shape[0],k),dtype=np.int64)
+        for start in range(0,points.shape[0],chunk_size):
+            chunk = points[start:start+chunk_size]
+            distance = ((chunk[:,np.newaxis,:] - self._coords[np.newaxis,:,:])**2).sum(axis=2)
+            if k < n_valid:
+                idx = np.argpartition(distance,k-1,axis=1)[:,0:k]
+            else:
+                idx = np.tile(np.arange(n_valid),(chunk.shape[0],1))
+            ## order the selected cells by distance
+            order = np.argsort(distance[np.arange(chunk.shape[0]).reshape(-1,1),idx],axis=1,kind='mergesort')
+            ret[start:start+chunk_size] = idx[np.arange(chunk.shape[0]).reshape(-1,1),order]
+        return(ret)
+
+    @staticmethod
+    def _get_nearest_1d_(centers,values):
+        if centers.shape[0] == 1:
+            return(np.zeros(values.shape[0],dtype=np.int64))
+        order = np.argsort(centers,kind='mergesort')
+        ordered = centers[order]
+        idx = np.searchsorted(ordered,values)
+        idx = np.clip(idx,1,ordered.shape[0]-1)
+        ## select the lower neighbour if it is at least as close
+        lower = (values - ordered[idx-1]) <= (ordered[idx] - values)
+        idx = idx - lower.astype(idx.dtype)
+        return(order[idx])
@@ -0,0 +1,48 @@
+from shapely.geometry import Polygon, MultiPolygon
+from ocgis.util.cache import BoundedCache, get_geometry_key
+
+
+class GeometrySimplifier(object):
+    '''
+    Topology-preserving simplification of polygon selection geometries with
+    caching of the simplified geometries by geometry and tolerance. Other
+    geometry types are returned unchanged.
+
+    >>> simplifier = GeometrySimplifier()
+    >>> simplified,area_error = simplifier.simplify(geom,0.1)
+
+    :param int maxsize: The maximum number of cached simplified geometries.
+    '''
+
+    def __init__(self,maxsize=64):
+        self.cache = BoundedCache(maxsize=maxsize)
+
+    def simplify(self,geom,tolerance):
+        '''
+        :param geom: The geometry to simplify.
+        :type geom: :class:`shapely.geometry.base.BaseGeometry`
+        :param float tolerance: The simplification tolerance in the geometry's
+         coordinate units.
+        :returns: Tuple of the simplified geometry and the relative change in area
+         introduced by the simplification. If the geometry is not simplified, the
+         original geometry is returned with an area error of zero.
+        :rtype: tuple of (:class:`shapely.geometry.base.BaseGeometry`, float)
+        '''
+        if not isinstance(geom,(Polygon,MultiPolygon)) or tolerance <= 0:
+            return(geom,0.0)
+        key = (get_geometry_key(geom),float(tolerance))
+        try:
+            simplified,area_error = self.cache[key]
+        except KeyError:
+            simplified = geom.simplify(tolerance,preserve_topology=True)
+            ## keep the original geometry if the simplification degenerates it
+            if simplified.is_empty or not simplified.is_valid or simplified.area == 0:
+                simplified,area_error = None,0.0
+            else:
+                area_error = abs(simplified.area-geom.area)/geom.area
+            self.cache[key] = (simplified,area_error)
+        if simplified is None:
+            ret = (geom,0.0)
+        else:
+            ret = (simplified,area_error)
+        return(ret)
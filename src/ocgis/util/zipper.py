@@ -74,11 +74,15 @@ def format_return(ret_path,ops,with_auxiliary_files=False):
     ## can do nothing with numpy returns
     if ops.output_format == 'numpy':
         raise(NotImplementedError('numpy formats have no use here - only disk outputs.'))
-    ## the folder containing all output files
-    folder = os.path.split(ret_path)[0]
+    ## the folder containing all output files. memory-mapped numpy outputs return
+    ## a collection in place of a path.
+    if ops.output_format == 'npy':
+        folder = os.path.join(ops.dir_output,ops.prefix)
+    else:
+        folder = os.path.split(ret_path)[0]
     ## name for output zipfile
     path_zip = os.path.join(folder,ops.prefix+'.zip')
-    if ops.output_format in ['csv','nc']:
+    if ops.output_format in ['csv','nc','nc-ts','parquet']:
         ## add all files
         if with_auxiliary_files:
             ret = get_zipped_path(path_zip,folder)